@@ -0,0 +1,282 @@
+"""
+Searchable archive of past meetings: transcripts with Whisper's segment timestamps and the
+notes generated from them, indexed with SQLite FTS5.
+
+    python archive.py search "parking permits"
+    python archive.py import jobs/jobs.db batch_output/
+
+Meetings are archived by the app, the job workers and the batch CLI when their notes are done.
+Importing the job store or a batch output directory archives notes generated before that.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+from cache import hash_file, make_key, DiskCache
+from jobs import JobStore, DONE
+from transcription import WHISPER_MODEL
+
+ARCHIVE_DIR = os.environ.get("OPENREF_ARCHIVE_DIR", "./archive")
+ARCHIVE_DB = os.path.join(ARCHIVE_DIR, "archive.db")
+PASSAGE_WORDS = 60  # Transcripts archived without Whisper segments are indexed in passages of this size
+SNIPPET_TOKENS = 16
+SEARCH_LIMIT = 20
+SECTION_TITLE_WEIGHT = 4.0  # bm25 weight of a section title relative to the passage text
+
+SEGMENT = "segment"
+SECTION = "section"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    source TEXT UNIQUE,
+    template TEXT,
+    transcript TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY,
+    meeting_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL,
+    start_ms INTEGER,
+    end_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS passages_meeting ON passages (meeting_id, kind, position);
+CREATE INDEX IF NOT EXISTS meetings_created ON meetings (created);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages_index USING fts5 (
+    title, text, content = 'passages', content_rowid = 'id', tokenize = 'porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN
+    INSERT INTO passages_index (rowid, title, text) VALUES (new.id, new.title, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN
+    INSERT INTO passages_index (passages_index, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+END;
+"""
+
+
+def fts_query(text):
+    """
+    Turns free text into an FTS5 query that matches all of its words, so quotes, hyphens and
+    operators typed by the user are searched for rather than parsed. A trailing * keeps a
+    prefix search.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def transcript_passages(transcript, words=PASSAGE_WORDS):
+    """
+    Splits a transcript without timestamps into passages to index.
+    """
+    transcript_words = transcript.split()
+    return [{"start_ms": None, "end_ms": None, "text": " ".join(transcript_words[start:start + words])} for start in range(0, len(transcript_words), words)]
+
+
+def markdown_sections(markdown):
+    """
+    Splits generated notes back into [(title, content)] at their headings.
+    """
+    sections = []
+    for block in re.split(r"^(?=#{1,6} )", markdown, flags=re.MULTILINE):
+        if block.startswith("#"):
+            heading, _, content = block.partition("\n")
+            sections.append((heading.lstrip("#").strip(), content.strip()))
+    return sections
+
+
+def format_timestamp(milliseconds):
+    seconds = milliseconds // 1000
+    hours, minutes = divmod(seconds // 60, 60)
+    return f"{hours}:{minutes:02d}:{seconds % 60:02d}" if hours else f"{minutes}:{seconds % 60:02d}"
+
+
+class Archive:
+    """
+    Archived meetings and their search index. Opens a short-lived connection per call, like
+    JobStore, so it is safe to use from any thread or process.
+    """
+    def __init__(self, path=ARCHIVE_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def add_meeting(self, title, transcript, sections, segments=None, template=None, source=None, created=None):
+        """
+        Archives one meeting and returns its ID. sections are (title, content) pairs in order;
+        segments are Whisper's {"start_ms", "end_ms", "text"}, and without them the transcript
+        is indexed in passages that have no timestamps.
+
+        A meeting archived again from the same source replaces the earlier version.
+        """
+        meeting_id = uuid.uuid4().hex[:12]
+        passages = [(SEGMENT, position, "", segment["text"], segment["start_ms"], segment["end_ms"]) for position, segment in enumerate(segments or transcript_passages(transcript))]
+        passages += [(SECTION, position, section_title, content, None, None) for position, (section_title, content) in enumerate(sections) if content.strip()]
+
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if source is not None:
+                self._delete(connection, "source = ?", source)
+            connection.execute(
+                "INSERT INTO meetings (id, title, source, template, transcript, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (meeting_id, title, source, template, transcript, created or time.time()),
+            )
+            connection.executemany(
+                "INSERT INTO passages (meeting_id, kind, position, title, text, start_ms, end_ms) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(meeting_id, *passage) for passage in passages],
+            )
+            connection.execute("COMMIT")
+        return meeting_id
+
+    def _delete(self, connection, condition, value):
+        for row in connection.execute(f"SELECT id FROM meetings WHERE {condition}", (value,)).fetchall():
+            connection.execute("DELETE FROM passages WHERE meeting_id = ?", (row["id"],))
+            connection.execute("DELETE FROM meetings WHERE id = ?", (row["id"],))
+
+    def delete_meeting(self, meeting_id):
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._delete(connection, "id = ?", meeting_id)
+            connection.execute("COMMIT")
+
+    def search(self, query, limit=SEARCH_LIMIT, kind=None, template=None):
+        """
+        Returns the best matches for query across all meetings, best first. A hit is a dict with
+        the meeting's ID, title and date, the hit's kind (SEGMENT or SECTION), the section title,
+        start_ms and end_ms for timed segments, and a snippet with the matches in bold.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        conditions = ["passages_index MATCH ?"]
+        parameters = [match]
+        if kind is not None:
+            conditions.append("passages.kind = ?")
+            parameters.append(kind)
+        if template is not None:
+            conditions.append("meetings.template = ?")
+            parameters.append(template)
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT passages.meeting_id, meetings.title AS meeting_title, meetings.created, meetings.template, passages.kind, passages.position, "
+                f"passages.title, passages.start_ms, passages.end_ms, snippet(passages_index, 1, '**', '**', ' … ', {SNIPPET_TOKENS}) AS snippet, "
+                f"bm25(passages_index, {SECTION_TITLE_WEIGHT}, 1.0) AS score "
+                f"FROM passages_index JOIN passages ON passages.id = passages_index.rowid JOIN meetings ON meetings.id = passages.meeting_id "
+                f"WHERE {' AND '.join(conditions)} ORDER BY score LIMIT ?",
+                (*parameters, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_meeting(self, meeting_id):
+        """
+        Returns the meeting with its "segments" and "sections", or None.
+        """
+        with self._connect() as connection:
+            meeting = connection.execute("SELECT * FROM meetings WHERE id = ?", (meeting_id,)).fetchone()
+            if meeting is None:
+                return None
+            passages = connection.execute("SELECT kind, title, text, start_ms, end_ms FROM passages WHERE meeting_id = ? ORDER BY kind, position", (meeting_id,)).fetchall()
+        meeting = dict(meeting)
+        meeting["segments"] = [{"start_ms": row["start_ms"], "end_ms": row["end_ms"], "text": row["text"]} for row in passages if row["kind"] == SEGMENT]
+        meeting["sections"] = [(row["title"], row["text"]) for row in passages if row["kind"] == SECTION]
+        return meeting
+
+    def list_meetings(self, limit=50):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT id, title, source, template, created FROM meetings ORDER BY created DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_job_store(self, job_store):
+        """
+        Archives every finished background job. Returns how many were imported.
+        """
+        imported = 0
+        for job in job_store.list_jobs(DONE):
+            sections = [(title, content) for title, content, _ in job_store.get_sections(job["id"])]
+            self.add_meeting(f"Job {job['id']}", job["transcript"], sections, template=job["template"], source=f"job:{job['id']}", created=job["created"])
+            imported += 1
+        return imported
+
+    def import_batch_output(self, directory, cache=None):
+        """
+        Archives the notes of a batch CLI output directory. The transcript and its segments
+        come from the transcript cache when the recording and its cache entry still exist;
+        otherwise the notes are archived on their own.
+        """
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".md"):
+                continue
+            stem = name[:-len(".md")]
+            markdown_path = os.path.join(directory, name)
+            report_path = os.path.join(directory, stem + ".stats.json")
+            report = {}
+            if os.path.exists(report_path):
+                with open(report_path, "r", encoding="utf-8") as report_file:
+                    report = json.load(report_file)
+            with open(markdown_path, "r", encoding="utf-8") as markdown_file:
+                sections = markdown_sections(markdown_file.read())
+
+            recording = report.get("recording")
+            cached = None
+            if cache is not None and recording and os.path.exists(recording):
+                with open(recording, "rb") as audio_file:
+                    cached = cache.get("transcript", make_key(hash_file(audio_file), WHISPER_MODEL, "en"))
+            cached = cached or {}
+            self.add_meeting(stem, cached.get("text", ""), sections, segments=cached.get("segments"), template=report.get("template"), source=recording or os.path.abspath(markdown_path), created=os.path.getmtime(markdown_path))
+            imported += 1
+        return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search or fill the archive of past meetings.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    search_parser = subcommands.add_parser("search", help="Search transcripts and notes")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    search_parser.add_argument("--kind", choices=[SEGMENT, SECTION])
+    import_parser = subcommands.add_parser("import", help="Archive existing job stores (.db) and batch output directories")
+    import_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    archive = Archive()
+    if args.command == "search":
+        for hit in archive.search(args.query, limit=args.limit, kind=args.kind):
+            location = format_timestamp(hit["start_ms"]) if hit["start_ms"] is not None else hit["title"] or "transcript"
+            print(f"{hit['meeting_title']} ({time.strftime('%Y-%m-%d', time.localtime(hit['created']))}) [{location}]: {hit['snippet']}")
+        return
+
+    cache = DiskCache()
+    for path in args.paths:
+        imported = archive.import_job_store(JobStore(path)) if path.endswith(".db") else archive.import_batch_output(path, cache)
+        print(f"Imported {imported} meetings from {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import re
+import subprocess
+
+SILENCE_THRESHOLD_DB = -35  # Anything quieter than this counts as silence
+MIN_SILENCE_DURATION = 0.4  # Seconds of silence needed to qualify as a cut point
+TARGET_SAMPLE_RATE = 16000  # Whisper resamples to 16 kHz mono anyway
+
+# ffmpeg encoder arguments and file extension per compact speech codec
+CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "32k", "-application", "voip"], ".ogg"),
+    "flac": (["-c:a", "flac", "-sample_fmt", "s16"], ".flac"),
+    "mp3": (["-c:a", "libmp3lame", "-b:a", "64k"], ".mp3"),
+}
+DEFAULT_CODEC = "opus"
+
+
+def run_ffmpeg(args):
+    """
+    Run ffmpeg with the given arguments and return its stderr output.
+    """
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostdin", "-y", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    stderr = result.stderr.decode("utf-8", errors="replace")
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr[-500:]}")
+    return stderr
+
+
+def probe_duration(path) -> float:
+    """
+    Returns the duration of an audio file in seconds using ffprobe.
+    """
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    return float(result.stdout.decode().strip())
+
+
+def detect_silences(path, threshold_db=SILENCE_THRESHOLD_DB, min_duration=MIN_SILENCE_DURATION, duration=None):
+    """
+    Returns a list of (start, end) tuples in seconds for every silent stretch in the audio.
+    """
+    output = run_ffmpeg(["-i", path, "-af", f"silencedetect=noise={threshold_db}dB:d={min_duration}", "-f", "null", "-"])
+    starts = [float(value) for value in re.findall(r"silence_start: (-?[\d.]+)", output)]
+    ends = [float(value) for value in re.findall(r"silence_end: ([\d.]+)", output)]
+
+    silences = []
+    for index, start in enumerate(starts):
+        if index < len(ends):
+            end = ends[index]
+        else:
+            end = duration if duration is not None else start + min_duration  # Trailing silence runs to the end of the file
+        silences.append((max(start, 0.0), end))
+    return silences
+
+
+def plan_segments(duration, silences, max_seconds, overlap=1.0):
+    """
+    Splits [0, duration] into (start, end) segments no longer than max_seconds.
+
+    Each cut is placed in the middle of the latest silence that keeps the segment under
+    max_seconds. When no silence is available the segment is cut hard and the next
+    segment starts `overlap` seconds earlier so no words are lost at the seam.
+    """
+    cut_points = [(start + end) / 2 for start, end in silences]
+    segments = []
+    start = 0.0
+    while duration - start > max_seconds:
+        limit = start + max_seconds
+        candidates = [point for point in cut_points if start + max_seconds / 2 < point <= limit]
+        if candidates:
+            end = candidates[-1]
+            segments.append((start, end))
+            start = end
+        else:
+            segments.append((start, limit))
+            start = limit - overlap
+    segments.append((start, duration))
+    return segments
+
+
+def codec_extension(codec=DEFAULT_CODEC):
+    return CODECS[codec][1]
+
+
+def extract_segment(path, start, end, output_path, codec="mp3"):
+    """
+    Cuts [start, end] out of the audio file and encodes it as mono audio at output_path.
+    """
+    run_ffmpeg(["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", path, "-vn", "-ac", "1", *CODECS[codec][0], output_path])
+    return output_path
+
+
+def speech_bounds(duration, silences, margin=0.25):
+    """
+    Returns (start, end) of the audio once leading and trailing silence is dropped.
+    """
+    start, end = 0.0, duration
+    if silences and silences[0][0] <= 0.05:
+        start = max(0.0, silences[0][1] - margin)
+    if silences and silences[-1][1] >= duration - 0.05:
+        end = min(duration, silences[-1][0] + margin)
+    if end <= start:
+        return 0.0, duration  # All silence, leave it to Whisper
+    return start, end
+
+
+def precondition_audio(path, output_directory, codec=DEFAULT_CODEC, trim_silence=True, silences=None):
+    """
+    Downmixes to mono, resamples to 16 kHz, optionally trims leading and trailing silence and
+    re-encodes with a compact speech codec.
+
+    Returns (output_path, original_bytes, preconditioned_bytes).
+    """
+    arguments = []
+    if trim_silence:
+        duration = probe_duration(path)
+        start, end = speech_bounds(duration, silences if silences is not None else detect_silences(path, duration=duration))
+        arguments = ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+
+    output_path = os.path.join(output_directory, "preconditioned" + codec_extension(codec))
+    run_ffmpeg([*arguments, "-i", path, "-vn", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), *CODECS[codec][0], output_path])
+    return output_path, os.path.getsize(path), os.path.getsize(output_path)
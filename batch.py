@@ -0,0 +1,237 @@
+"""
+Headless batch processing of meeting recordings.
+
+    python batch.py recordings/ --output-dir notes/ --template "Municipality General Meeting"
+
+The source is a directory of audio files or a manifest file (a JSON list of paths, or one path
+per line). Progress is recorded in <output-dir>/manifest.json, so re-running a crashed batch
+skips the recordings that were already completed.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+from clients import create_groq_client
+
+from archive import Archive
+from fingerprint import FingerprintIndex
+from cache import hash_bytes, DiskCache
+from generation_statistics import GenerationStatistics
+from notes import Notes
+from pipeline import compact_for_prompts, create_pdf_file, transcribe_audio, stream_notes, DEFAULT_OUTLINE_MODEL, DEFAULT_CONTENT_MODEL
+from prompt_templates import PROMPT_TEMPLATES
+from rate_limit import RateLimiter, RateLimitedClient
+from retrieval import DEFAULT_TOP_K
+from section_scheduler import SECTION_DONE, SECTION_RESET, DEFAULT_MAX_CONCURRENCY
+from tracing import Trace
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".opus")
+MANIFEST_NAME = "manifest.json"
+
+
+def find_recordings(source):
+    """
+    Returns the recordings to process from a directory or a manifest file.
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(AUDIO_EXTENSIONS))
+
+    with open(source, "r", encoding="utf-8") as manifest_file:
+        text = manifest_file.read()
+    if source.endswith(".json"):
+        paths = json.loads(text)
+    else:
+        paths = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+    base = os.path.dirname(os.path.abspath(source))
+    # A recording listed twice is processed once
+    return list(dict.fromkeys(os.path.normpath(path if os.path.isabs(path) else os.path.join(base, path)) for path in paths))
+
+
+def output_stems(recordings):
+    """
+    Names each recording's outputs after its file name. Where names collide, such as
+    a/meeting.wav and b/meeting.wav, or meeting.wav and meeting.mp3, the extension and a short
+    hash of the path are added, so that no two recordings write to the same files.
+    """
+    stem = lambda recording: os.path.splitext(os.path.basename(recording))[0]
+    counts = Counter(stem(recording).lower() for recording in recordings)  # Some file systems ignore case
+    stems = {}
+    for recording in recordings:
+        stems[recording] = stem(recording)
+        if counts[stem(recording).lower()] > 1:
+            extension = os.path.splitext(recording)[1].lstrip(".").lower()
+            stems[recording] += f"-{extension}-{hash_bytes(os.path.abspath(recording).encode())[:8]}"
+    return stems
+
+
+class BatchManifest:
+    """
+    Per-recording status, rewritten atomically after every change so a crash loses nothing.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def is_done(self, recording):
+        entry = self.entries.get(os.path.abspath(recording), {})
+        return entry.get("status") == "done" and all(os.path.exists(path) for path in entry.get("outputs", {}).values())
+
+    def update(self, recording, **fields):
+        with self.lock:
+            self.entries.setdefault(os.path.abspath(recording), {}).update(fields)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as manifest_file:
+                json.dump(self.entries, manifest_file, indent=2)
+            os.replace(temp_path, self.path)
+
+
+def render_pdf(markdown, pdf_path):
+    """
+    Runs in a worker process, since PDF rendering is CPU-bound.
+    """
+    with open(pdf_path, "wb") as pdf_file:
+        pdf_file.write(create_pdf_file(markdown).getvalue())
+    return pdf_path
+
+
+def process_recording(recording, stem, args, client, cache, archive, fingerprints, stage_limits, pdf_pool):
+    """
+    Runs one recording through transcription, structure, sections and export, writing the
+    outputs as <stem>.md, .pdf and .stats.json. Returns their paths.
+    """
+    started = time.perf_counter()
+    markdown_path = os.path.join(args.output_dir, stem + ".md")
+    pdf_path = os.path.join(args.output_dir, stem + ".pdf")
+    report_path = os.path.join(args.output_dir, stem + ".stats.json")
+    trace = Trace(recording=os.path.abspath(recording), template=args.template)
+    meeting_span = trace.span("meeting").start()
+
+    with stage_limits["transcription"]:
+        transcription_started = time.perf_counter()
+        segments = []
+        with open(recording, "rb") as audio_file:
+            transcript = transcribe_audio(client, audio_file, cache=cache, trace=trace, segments=segments, fingerprints=fingerprints)
+        transcription_time = time.perf_counter() - transcription_started
+    prompt_transcript, compaction = compact_for_prompts(transcript, trace) if args.compaction else (transcript, None)
+
+    with stage_limits["generation"]:
+        generation_started = time.perf_counter()
+        notes = Notes({})
+        structure_statistics = GenerationStatistics(model_name=args.outline_model)
+        section_statistics = GenerationStatistics(model_name=args.content_model)
+        for title, item in stream_notes(client, notes, prompt_transcript, args.template, outline_model=args.outline_model, content_model=args.content_model, max_concurrency=args.section_workers, top_k=args.passages, cache=cache, trace=trace):
+            if isinstance(item, GenerationStatistics):
+                # Events without a title come from the map-reduce and outline stages
+                (structure_statistics if title is None else section_statistics).add(item)
+            elif item is SECTION_DONE:
+                notes.complete_section(title)
+            elif item is SECTION_RESET:
+                notes.reset_section(title)
+            else:
+                notes.update_content(title, item)
+        generation_time = time.perf_counter() - generation_started
+    if not notes.contents:
+        raise ValueError("Failed to decode the notes structure")
+
+    markdown = notes.get_markdown_content()
+    with open(markdown_path, "w", encoding="utf-8") as markdown_file:
+        markdown_file.write(markdown)
+    archive.add_meeting(stem, transcript, list(notes.contents.items()), segments=segments, template=args.template, source=os.path.abspath(recording))
+
+    pdf_started = time.perf_counter()
+    pdf_pool.submit(render_pdf, markdown, pdf_path).result()
+    pdf_time = time.perf_counter() - pdf_started
+    trace.record("pdf", pdf_time, characters=len(markdown))
+    meeting_span.set(cost=trace.total_cost(), sections=len(notes.contents))
+    meeting_span.end()
+
+    report = {
+        "recording": os.path.abspath(recording),
+        "template": args.template,
+        "transcript_characters": len(transcript),
+        "compaction": compaction.to_dict() if compaction else None,
+        "transcription_time": transcription_time,
+        "generation_time": generation_time,
+        "pdf_time": pdf_time,
+        "total_time": time.perf_counter() - started,
+        "structure": structure_statistics.to_dict(),
+        "sections": section_statistics.to_dict(),
+        "trace_id": trace.trace_id,
+        "cost": trace.total_cost(),
+    }
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+
+    return {"markdown": markdown_path, "pdf": pdf_path, "report": report_path}
+
+
+def run_batch(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = BatchManifest(os.path.join(args.output_dir, MANIFEST_NAME))
+    recordings = find_recordings(args.source)
+    stems = output_stems(recordings)
+    pending = [recording for recording in recordings if not manifest.is_done(recording)]
+    print(f"{len(recordings)} recordings, {len(recordings) - len(pending)} already done, {len(pending)} to process")
+
+    # Recordings run concurrently, so all of their requests share one set of rate limit budgets
+    client = RateLimitedClient(create_groq_client(), RateLimiter())
+    cache = DiskCache()
+    archive = Archive()
+    fingerprints = FingerprintIndex() if args.fingerprints else None
+    stage_limits = {
+        "transcription": threading.Semaphore(args.transcription_jobs),
+        "generation": threading.Semaphore(args.generation_jobs),
+    }
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.pdf_workers) as pdf_pool, ThreadPoolExecutor(max_workers=args.transcription_jobs + args.generation_jobs) as file_pool:
+        futures = {}
+        for recording in pending:
+            manifest.update(recording, status="queued")
+            futures[file_pool.submit(process_recording, recording, stems[recording], args, client, cache, archive, fingerprints, stage_limits, pdf_pool)] = recording
+
+        for future in as_completed(futures):
+            recording = futures[future]
+            try:
+                outputs = future.result()
+            except Exception as e:
+                failures += 1
+                manifest.update(recording, status="failed", error=str(e))
+                print(f"[error]: {recording}: {e}")
+            else:
+                manifest.update(recording, status="done", outputs=outputs, error=None)
+                print(f"Finished {recording}")
+
+    print(f"Batch complete: {len(pending) - failures} succeeded, {failures} failed. Cache: {cache.stats()}")
+    return failures
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate notes for a batch of recordings without the Streamlit UI.")
+    parser.add_argument("source", help="Directory of recordings, or a manifest file listing them")
+    parser.add_argument("--output-dir", default="./batch_output")
+    parser.add_argument("--template", default=next(iter(PROMPT_TEMPLATES)), choices=list(PROMPT_TEMPLATES))
+    parser.add_argument("--outline-model", default=DEFAULT_OUTLINE_MODEL)
+    parser.add_argument("--content-model", default=DEFAULT_CONTENT_MODEL)
+    parser.add_argument("--transcription-jobs", type=int, default=2, help="Recordings transcribed at the same time")
+    parser.add_argument("--generation-jobs", type=int, default=2, help="Recordings generating notes at the same time")
+    parser.add_argument("--section-workers", type=int, default=DEFAULT_MAX_CONCURRENCY, help="Concurrent section requests per recording")
+    parser.add_argument("--pdf-workers", type=int, default=2, help="Processes rendering PDFs")
+    parser.add_argument("--passages", type=int, default=DEFAULT_TOP_K, help="Transcript passages per section")
+    parser.add_argument("--no-compaction", dest="compaction", action="store_false", help="Prompt with the raw transcript, filler words and repetition included")
+    parser.add_argument("--no-fingerprints", dest="fingerprints", action="store_false", help="Transcribe every recording in full, even re-encoded copies of earlier ones")
+    args = parser.parse_args()
+    raise SystemExit(1 if run_batch(args) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Regression check that transcript compaction stays fast on multi-hour meetings.
+
+    python -m benchmarks.compaction --hours 4 --max-seconds 2
+
+Builds a synthetic transcript at a typical speaking rate, with filler words, stutters and
+Whisper-style loops mixed in, then times compact_transcript on it. Exits with status 1 when it
+takes longer than --max-seconds or when it fails to remove the injected noise.
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.mock_groq import FILLER_WORDS as VOCABULARY
+from compaction import compact_transcript
+
+WORDS_PER_MINUTE = 150
+NOISE_FILLERS = ["um,", "uh", "erm", "hmm."]
+LOOP_PHRASE = "Thank you."
+
+
+def noisy_transcript(hours, seed=0):
+    """
+    Returns (transcript, number of noise words injected).
+    """
+    generator = random.Random(seed)
+    words = []
+    noise = 0
+    while len(words) < hours * 60 * WORDS_PER_MINUTE:
+        sentence = [generator.choice(VOCABULARY) for _ in range(generator.randint(8, 20))]
+        roll = generator.random()
+        if roll < 0.3:
+            sentence.insert(generator.randrange(len(sentence)), generator.choice(NOISE_FILLERS))
+            noise += 1
+        elif roll < 0.4:
+            # A stutter: one word said three times
+            position = generator.randrange(len(sentence))
+            sentence[position:position + 1] = [sentence[position]] * 3
+            noise += 2
+        elif roll < 0.42:
+            loops = generator.randint(3, 30)
+            sentence += LOOP_PHRASE.split() * loops
+            noise += 2 * (loops - 1)
+        words += sentence
+        words[-1] += "."
+    return " ".join(words), noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time transcript compaction on a long synthetic meeting.")
+    parser.add_argument("--hours", type=float, default=4.0)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="Fail when compaction takes longer than this")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs timed; the fastest counts")
+    args = parser.parse_args()
+
+    transcript, noise = noisy_transcript(args.hours)
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        compacted, report = compact_transcript(transcript)
+        timings.append(time.perf_counter() - started)
+    elapsed = min(timings)
+
+    removed = report.filler_words + report.repeated_words
+    print(f"{args.hours:g} hours, {len(transcript.split())} words: compacted in {elapsed:.2f}s ({len(transcript) / elapsed / 1e6:.1f} MB/s)")
+    print(report)
+    failures = []
+    if elapsed > args.max_seconds:
+        failures.append(f"took {elapsed:.2f}s, more than the {args.max_seconds:g}s budget")
+    if removed < noise:
+        failures.append(f"removed {removed} words but {noise} noise words were injected")
+    for failure in failures:
+        print(f"[error]: compaction {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
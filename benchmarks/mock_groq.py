@@ -0,0 +1,221 @@
+"""
+Local stand-in for the Groq API, for benchmarking without the network or an API key.
+
+    python -m benchmarks.mock_groq --port 8765 --tokens-per-second 400 --rate-limit-probability 0.05
+
+Serves /openai/v1/chat/completions (streamed as server-sent events with x_groq.usage on the
+last chunk, or as a single JSON response) and /openai/v1/audio/transcriptions. Point a client
+at it with GROQ_BASE_URL=http://127.0.0.1:8765.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tokens import estimate_tokens
+
+OUTLINE_INSTRUCTION = "Create a structure for comprehensive notes"
+BATCHED_SECTIONS_INSTRUCTION = "Write the notes for every section listed"
+FILLER_WORDS = "the council discussed the proposal and agreed that the budget for the project should be reviewed again next month".split()
+
+
+class MockGroqConfig:
+    """
+    latency: seconds before the first byte of every response.
+    tokens_per_second: completion speed, also reported back in x_groq.usage.
+    rate_limit_probability: share of requests answered with a 429 and retry_after.
+    """
+    def __init__(self, latency=0.05, tokens_per_second=400.0, prompt_tokens_per_second=20000.0, completion_tokens=300, sections=4, rate_limit_probability=0.0, retry_after=0.5, transcription_seconds=0.2, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.sections = sections
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.transcription_seconds = transcription_seconds
+        self.random = random.Random(seed)
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return body
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        config = server.config
+        body = self._read_body()
+        endpoint = self.path.rsplit("/", 1)[-1]
+        with server.lock:
+            server.requests[endpoint] += 1
+            rate_limited = config.random.random() < config.rate_limit_probability
+            if rate_limited:
+                server.rate_limited[endpoint] += 1
+
+        if rate_limited:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}}, {"retry-after": str(config.retry_after)})
+            return
+
+        time.sleep(config.latency)
+        if self.path.endswith("/chat/completions"):
+            self._chat_completion(json.loads(body))
+        elif self.path.endswith("/audio/transcriptions"):
+            time.sleep(config.transcription_seconds)
+            text = " ".join(FILLER_WORDS * 10)
+            payload = {"text": text}
+            if b"verbose_json" in body:
+                words = text.split()
+                payload["segments"] = [{"id": index, "start": index * 2.0, "end": index * 2.0 + 1.8, "text": " " + " ".join(words[index * 10:index * 10 + 10])} for index in range((len(words) + 9) // 10)]
+            self._send_json(200, payload)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _completion_text(self, request):
+        config = self.server.config
+        prompt = request["messages"][-1]["content"]
+        if OUTLINE_INSTRUCTION in prompt:
+            return json.dumps({f"Section {index + 1}": f"Notes on topic {index + 1}" for index in range(config.sections)})
+        count = min(request.get("max_tokens") or config.completion_tokens, config.completion_tokens)
+        if BATCHED_SECTIONS_INSTRUCTION in prompt:
+            # One section's worth of tokens for every numbered section in the prompt
+            numbers = re.findall(r"^(\d+)\. ", prompt.split("### Sections", 1)[-1], flags=re.MULTILINE)
+            return json.dumps({number: " ".join(config.random.choice(FILLER_WORDS) for _ in range(count)) for number in numbers})
+        return " ".join(config.random.choice(FILLER_WORDS) for _ in range(count))
+
+    def _usage(self, request, completion_tokens):
+        config = self.server.config
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in request["messages"])
+        prompt_time = prompt_tokens / config.prompt_tokens_per_second
+        completion_time = completion_tokens / config.tokens_per_second
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "queue_time": config.latency,
+            "prompt_time": prompt_time,
+            "completion_time": completion_time,
+            "total_time": prompt_time + completion_time,
+        }
+
+    def _chat_completion(self, request):
+        config = self.server.config
+        completion_id = "chatcmpl-" + uuid.uuid4().hex
+        # Each word, with its trailing space, stands in for one token
+        tokens = re.findall(r"\S+\s*", self._completion_text(request))
+        base = {"id": completion_id, "created": int(time.time()), "model": request["model"]}
+
+        if not request.get("stream"):
+            time.sleep(len(tokens) / config.tokens_per_second)
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": self._usage(request, len(tokens)),
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        started = time.perf_counter()
+        for index, token in enumerate(tokens):
+            # Paced against the start of the stream, so per-chunk overhead does not slow it down
+            delay = started + index / config.tokens_per_second - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._send_event({**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        self._send_event({
+            **base,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "req_" + uuid.uuid4().hex, "usage": self._usage(request, len(tokens))},
+        })
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, payload):
+        self._send_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockGroqHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.rate_limited = Counter()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True, name="mock-groq").start()
+        return self
+
+    def counters(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "rate_limited": dict(self.rate_limited)}
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.rate_limited.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Groq API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--sections", type=int, default=4, help="Sections in generated outlines")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    args = parser.parse_args()
+
+    config = MockGroqConfig(latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens, sections=args.sections, rate_limit_probability=args.rate_limit_probability, retry_after=args.retry_after)
+    server = MockGroqServer(config, port=args.port)
+    print(f"Mock Groq API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
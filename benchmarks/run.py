@@ -0,0 +1,219 @@
+"""
+End-to-end benchmark of the note generation pipeline against the local mock Groq API.
+
+    python -m benchmarks.run --words 2000 8000 30000 --sections 4 8 16 --output benchmarks/results/latest.json
+
+Transcribes a synthetic recording, then generates notes for every combination of synthetic
+transcript length and section count, through the same client stack the app uses. Reports wall
+time, time to first token and tokens/s per stage. Pass --baseline with an earlier results file
+to print the change against it.
+
+The outline is given by default, so that section generation is measured on its own. With
+--generated-outline the template's fixed sections are dropped and the mock writes the outline,
+so the outline stream, its parser and map-reduce (for transcripts too long for one prompt) are
+run and reported as stages too.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import wave
+
+from benchmarks.mock_groq import MockGroqConfig, MockGroqServer, FILLER_WORDS
+from clients import create_groq_client
+from generation_statistics import GenerationStatistics
+from notes import Notes
+from pipeline import iter_transcript, stream_notes, DEFAULT_CONTENT_MODEL, DEFAULT_OUTLINE_MODEL
+from prompt_templates import PROMPT_TEMPLATES
+from rate_limit import RateLimiter, RateLimitedClient, configured_rate_limits
+from retrieval import DEFAULT_TOP_K
+from section_scheduler import SECTION_DONE, SECTION_RESET, DEFAULT_MAX_CONCURRENCY
+from tracing import Trace
+
+UNLIMITED_RATE = (1_000_000, 1_000_000_000)
+SAMPLE_RATE = 16000
+
+
+def write_silent_wav(path, seconds):
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(b"\x00\x00" * int(seconds * SAMPLE_RATE))
+    return path
+
+
+def synthetic_outline(sections):
+    return {f"Section {index + 1}": f"Notes on topic{index + 1}" for index in range(sections)}
+
+
+def synthetic_transcript(words, sections, seed=0):
+    """
+    Sentences of filler words, each tagged with one of the sections' topics so retrieval has
+    something to find.
+    """
+    generator = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = [f"topic{generator.randrange(sections) + 1}"] + [generator.choice(FILLER_WORDS) for _ in range(generator.randint(8, 20))]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        count += len(sentence)
+    return " ".join(sentences)
+
+
+def run_transcription(client, audio_path):
+    started = time.perf_counter()
+    first_chunk = None
+    characters = 0
+    with open(audio_path, "rb") as audio_file:
+        for chunk in iter_transcript(client, audio_file):
+            first_chunk = first_chunk or time.perf_counter() - started
+            characters += len(chunk)
+    return {"wall_time": time.perf_counter() - started, "time_to_first_chunk": first_chunk, "characters": characters}
+
+
+def generated_outline_template(template_name):
+    """
+    Registers a copy of the template without its fixed sections, which makes the pipeline
+    generate the outline. Returns its name.
+    """
+    name = f"{template_name} (generated outline)"
+    PROMPT_TEMPLATES[name] = {key: value for key, value in PROMPT_TEMPLATES[template_name].items() if key != "sections"}
+    return name
+
+
+def stage_report(trace, name):
+    """
+    Wall time and time to first token of the named span, or None when the stage did not run.
+    """
+    spans = [span for span in trace.spans if span["name"] == name]
+    if not spans:
+        return None, None
+    return spans[0]["duration"], spans[0].get("time_to_first_token")
+
+
+def run_notes(client, transcript, sections, args):
+    notes = Notes({})
+    generation_statistics = GenerationStatistics(model_name=args.content_model)
+    section_first_tokens = {}
+    first_token = None
+    trace = Trace(path=None)
+    template_name = generated_outline_template(args.template) if args.generated_outline else args.template
+    outline = None if args.generated_outline else synthetic_outline(sections)
+    started = time.perf_counter()
+    events = stream_notes(client, notes, transcript, template_name, outline_model=args.outline_model, content_model=args.content_model, max_concurrency=args.max_concurrency, top_k=args.passages, outline=outline, trace=trace, batch_sections=not args.separate_sections)
+    for title, item in events:
+        elapsed = time.perf_counter() - started
+        if isinstance(item, GenerationStatistics):
+            generation_statistics.add(item)
+        elif item is SECTION_DONE:
+            notes.complete_section(title)
+        elif item is SECTION_RESET:
+            notes.reset_section(title)
+        elif isinstance(item, str):
+            first_token = first_token or elapsed
+            section_first_tokens.setdefault(title, elapsed)
+            notes.update_content(title, item)
+    wall_time = time.perf_counter() - started
+    outline_time, outline_first_token = stage_report(trace, "outline")
+    map_reduce_time, _ = stage_report(trace, "map_reduce")
+
+    return {
+        "wall_time": wall_time,
+        "outline_wall_time": outline_time,
+        "outline_time_to_first_token": outline_first_token,
+        "map_reduce_wall_time": map_reduce_time,
+        "time_to_first_token": first_token,
+        "mean_section_time_to_first_token": statistics.mean(section_first_tokens.values()) if section_first_tokens else None,
+        "input_tokens": generation_statistics.input_tokens,
+        "output_tokens": generation_statistics.output_tokens,
+        "tokens_per_second": generation_statistics.output_tokens / wall_time if wall_time else 0,
+    }
+
+
+def median_report(reports):
+    """
+    Medians of every numeric metric over repeated runs.
+    """
+    return {key: statistics.median(report[key] for report in reports) if reports[0][key] is not None else None for key in reports[0]}
+
+
+def compare(results, baseline):
+    baseline_scenarios = {(scenario["words"], scenario["sections"]): scenario for scenario in baseline.get("scenarios", [])}
+    rows = [("transcription", baseline.get("transcription"), results["transcription"])]
+    rows += [(f"notes {scenario['words']} words / {scenario['sections']} sections", baseline_scenarios.get((scenario["words"], scenario["sections"]), {}).get("notes"), scenario["notes"]) for scenario in results["scenarios"]]
+    for name, before, after in rows:
+        if not before:
+            print(f"{name}: not in baseline")
+            continue
+        changes = [f"{key} {before[key]:.3f} -> {after[key]:.3f} ({(after[key] - before[key]) / before[key] * 100:+.1f}%)" for key in after if after[key] is not None and before.get(key)]
+        print(f"{name}: " + ", ".join(changes))
+
+
+def run_benchmark(args):
+    config = MockGroqConfig(latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens, rate_limit_probability=args.rate_limit_probability, retry_after=args.retry_after)
+    server = MockGroqServer(config).start()
+    os.environ["GROQ_BASE_URL"] = server.base_url
+    limits = configured_rate_limits() if args.client_rate_limits else {model: UNLIMITED_RATE for model in configured_rate_limits()}
+    client = RateLimitedClient(create_groq_client("benchmark"), RateLimiter(limits=limits))
+
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "config": vars(args), "scenarios": []}
+    with tempfile.TemporaryDirectory(prefix="openref_benchmark_") as workdir:
+        audio_path = write_silent_wav(os.path.join(workdir, "recording.wav"), args.audio_seconds)
+        results["transcription"] = median_report([run_transcription(client, audio_path) for _ in range(args.repeat)])
+        print(f"transcription: {results['transcription']}")
+
+    for words in args.words:
+        for sections in args.sections:
+            transcript = synthetic_transcript(words, sections)
+            config.sections = sections  # Outlines written by the mock have as many sections
+            server.reset_counters()
+            report = median_report([run_notes(client, transcript, sections, args) for _ in range(args.repeat)])
+            scenario = {"words": words, "sections": sections, "notes": report, "server": server.counters()}
+            results["scenarios"].append(scenario)
+            print(f"notes {words} words / {sections} sections: {report}")
+
+    server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local mock of the Groq API.")
+    parser.add_argument("--words", type=int, nargs="+", default=[2000, 8000, 30000], help="Synthetic transcript lengths")
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 8, 16], help="Section counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; medians are reported")
+    parser.add_argument("--audio-seconds", type=float, default=120.0, help="Length of the synthetic recording")
+    parser.add_argument("--template", default=next(iter(PROMPT_TEMPLATES)), choices=list(PROMPT_TEMPLATES))
+    parser.add_argument("--outline-model", default=DEFAULT_OUTLINE_MODEL)
+    parser.add_argument("--content-model", default=DEFAULT_CONTENT_MODEL)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--passages", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency before each response, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Mock completion speed")
+    parser.add_argument("--completion-tokens", type=int, default=300, help="Mock tokens per completion")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Share of mock requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--client-rate-limits", action="store_true", help="Apply the configured Groq rate limits on the client side")
+    parser.add_argument("--separate-sections", action="store_true", help="Always send one request per section, even when a single batched request would fit")
+    parser.add_argument("--generated-outline", action="store_true", help="Let the mock write the outline, so the outline and map-reduce stages are run and timed too")
+    parser.add_argument("--output", default="benchmarks/results/latest.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+CACHE_DIR = os.environ.get("OPENREF_CACHE_DIR", "./cache")
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # 500 MB
+CACHE_MAX_AGE = 30 * 24 * 60 * 60  # 30 days
+EVICT_EVERY_WRITES = 20
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(file_obj) -> str:
+    """
+    Hashes a file-like object in chunks, leaving it rewound.
+    """
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """
+    Content-addressed key for any JSON-serialisable parts (hashes, model names, prompt text...).
+    """
+    return hash_bytes(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+class DiskCache:
+    """
+    Persistent JSON cache on disk with size- and age-based LRU eviction.
+
+    Entries live in one file each; a read touches the file's mtime so eviction can drop the
+    least recently used entries first. Safe to share between threads and sessions.
+    """
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = Counter()
+        self.misses = Counter()
+        self.lock = threading.Lock()
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, namespace, key):
+        return os.path.join(self.directory, namespace, key[:2], key + ".json")
+
+    def get(self, namespace, key):
+        """
+        Returns the cached value or None, counting the hit or miss under namespace.
+        """
+        path = self._path(namespace, key)
+        try:
+            with open(path, "r", encoding="utf-8") as cache_file:
+                value = json.load(cache_file)
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                raise FileNotFoundError(path)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self.lock:
+                self.misses[namespace] += 1
+            return None
+        with self.lock:
+            self.hits[namespace] += 1
+        return value
+
+    def set(self, namespace, key, value):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per process and thread, as workers and the app share the cache directory
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(value, cache_file, ensure_ascii=False)
+        os.replace(temp_path, path)  # Atomic, so concurrent readers never see a partial entry
+
+        with self.lock:
+            self.writes += 1
+            should_evict = self.writes % EVICT_EVERY_WRITES == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes entries older than max_age, then the least recently used until under max_bytes.
+        """
+        now = time.time()
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def stats(self):
+        with self.lock:
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            return {namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]} for namespace in namespaces}
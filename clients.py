@@ -0,0 +1,27 @@
+"""
+Groq client construction shared by the app, the batch CLI and the job workers.
+"""
+import httpx
+from groq import Groq
+
+# One pool per API key, shared by every session and worker thread using that key
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16  # Enough idle connections for concurrent sections and transcription chunks
+KEEPALIVE_EXPIRY = 120.0  # Seconds an idle connection is kept, so reruns minutes apart skip the TLS handshake
+CONNECT_TIMEOUT = 5.0
+REQUEST_TIMEOUT = 120.0  # Long transcription uploads and streams need more than the SDK's 60 seconds
+
+
+def create_groq_client(api_key=None):
+    """
+    A Groq client on a pooled keep-alive HTTP transport. api_key defaults to GROQ_API_KEY.
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+    )
+    return Groq(api_key=api_key, http_client=http_client)
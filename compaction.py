@@ -0,0 +1,114 @@
+"""
+Local, deterministic clean-up of transcripts before they are sent to the models.
+
+Every prompt carries the transcript (or passages of it), so tokens wasted on disfluencies are
+paid once per section. compact_transcript normalises whitespace, drops filler words and
+collapses repetition: stutters, false starts repeated word for word, and the loops Whisper
+sometimes produces ("thank you. thank you. thank you. ..."). The raw transcript is kept for
+display and the archive; only the prompts see the compacted text.
+"""
+import re
+
+from tokens import estimate_tokens
+
+FILLER_WORDS = frozenset({"um", "umm", "uh", "uhh", "uhm", "erm", "ah", "hmm", "mhm"})  # Not "er", "mm" or "hm", which are also words and units
+MAX_LOOP_WORDS = 12  # Longest repeated phrase collapsed, in words
+MIN_WORD_REPEATS = 3  # A single word must repeat this often, as "that that" can be grammatical
+MIN_PHRASE_REPEATS = 2
+SENTENCE_END = ".?!"
+
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class CompactionReport:
+    def __init__(self, original_tokens=0, compacted_tokens=0, filler_words=0, repeated_words=0):
+        self.original_tokens = original_tokens
+        self.compacted_tokens = compacted_tokens
+        self.filler_words = filler_words
+        self.repeated_words = repeated_words
+
+    @property
+    def saved_tokens(self):
+        return self.original_tokens - self.compacted_tokens
+
+    @property
+    def reduction(self):
+        return self.saved_tokens / self.original_tokens if self.original_tokens else 0.0
+
+    def __str__(self):
+        return f"Compacted transcript from {self.original_tokens} to {self.compacted_tokens} tokens ({self.reduction:.1%} fewer): {self.filler_words} filler words and {self.repeated_words} repeated words removed"
+
+    def to_dict(self):
+        return {
+            "original_tokens": self.original_tokens,
+            "compacted_tokens": self.compacted_tokens,
+            "reduction": self.reduction,
+            "filler_words": self.filler_words,
+            "repeated_words": self.repeated_words,
+        }
+
+
+def _is_filler(word, filler_words):
+    # Upper case spellings such as "UM" are acronyms rather than hesitations
+    return _normalize(word) in filler_words and not re.sub(r"[^\w]", "", word).isupper()
+
+
+def _has_number(words):
+    return any(any(character.isdigit() for character in word) for word in words)
+
+
+def remove_filler_words(words, filler_words=FILLER_WORDS):
+    """
+    Drops filler words, moving a sentence end they carried ("um.") to the word before them.
+    Returns (kept words, removed count).
+    """
+    kept = []
+    for word in words:
+        if not _is_filler(word, filler_words):
+            kept.append(word)
+        elif kept and word[-1] in SENTENCE_END and kept[-1][-1] not in SENTENCE_END:
+            kept[-1] = kept[-1].rstrip(",;:") + word[-1]
+    return kept, len(words) - len(kept)
+
+
+def collapse_repeats(words, max_loop_words=MAX_LOOP_WORDS, min_word_repeats=MIN_WORD_REPEATS, min_phrase_repeats=MIN_PHRASE_REPEATS):
+    """
+    Keeps one copy of any phrase of up to max_loop_words words that is repeated back to back,
+    compared without case and punctuation. Phrases with numbers in them are kept, since
+    "1 2 1 2" or "5 5" are usually meant. Returns (kept words, removed count).
+    """
+    normalized = [_normalize(word) for word in words]
+    kept = []
+    index = 0
+    count = len(words)
+    while index < count:
+        for size in range(1, max_loop_words + 1):
+            if index + 2 * size > count:
+                break
+            phrase = normalized[index:index + size]
+            if normalized[index + size:index + 2 * size] != phrase or _has_number(phrase):
+                continue
+            repeats = 2
+            while normalized[index + repeats * size:index + (repeats + 1) * size] == phrase:
+                repeats += 1
+            if repeats >= (min_word_repeats if size == 1 else min_phrase_repeats):
+                # The last copy is kept, as its punctuation usually ends the loop
+                index += (repeats - 1) * size
+                break
+        kept.append(words[index])
+        index += 1
+    return kept, count - len(kept)
+
+
+def compact_transcript(transcript, filler_words=FILLER_WORDS, max_loop_words=MAX_LOOP_WORDS, min_word_repeats=MIN_WORD_REPEATS, min_phrase_repeats=MIN_PHRASE_REPEATS):
+    """
+    Returns (compacted transcript, CompactionReport). Pass filler_words=() or max_loop_words=0
+    to skip either step.
+    """
+    words = transcript.split()
+    words, filler_count = remove_filler_words(words, filler_words)
+    words, repeated_count = collapse_repeats(words, max_loop_words, min_word_repeats, min_phrase_repeats)
+    compacted = " ".join(words)
+    return compacted, CompactionReport(estimate_tokens(transcript), estimate_tokens(compacted), filler_count, repeated_count)
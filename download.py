@@ -1,14 +1,40 @@
-from __future__ import unicode_literals
-import yt_dlp as youtube_dl
-import os
-import time
+"""
+URL ingestion: one metadata pass, then ffmpeg converts the media straight to the compact
+speech format and cuts it into transcription-sized segments while the download is running.
+
+Segments are cached on disk by source ID, so a repeated request never downloads again. Each
+download writes to a directory of its own, published under the source ID once it is complete,
+and old downloads are evicted by age and total size.
+Only http(s) URLs are accepted. Local media can be read with file:// URLs, which need neither
+yt-dlp nor the network, where the caller allows it: the batch CLI and tests, or a server started
+with OPENREF_ALLOW_FILE_URLS=1, since any visitor could otherwise read files on the server.
+"""
+import json
 import os
+import random
 import shutil
+import subprocess
+import tempfile
+import time
+from urllib.parse import unquote, urlparse
+
+from audio import codec_extension, probe_duration, CODECS, DEFAULT_CODEC, TARGET_SAMPLE_RATE
+from cache import make_key
 
-MAX_FILE_SIZE = 100 * 1024 * 1024  # 100 MB
-FILE_TOO_LARGE_MESSAGE = "The audio file is too large for the current size and rate limits using Whisper. If you used a YouTube link, please try a shorter video clip. If you uploaded an audio file, try trimming or compressing the audio to under 100 MB."
-max_retries = 3
-delay = 2
+FILE_TOO_LARGE_MESSAGE = "Part of the audio was larger than Whisper accepts in one request. Please try compressing the audio, or trimming it, and uploading it again."
+DOWNLOAD_DIR = os.environ.get("OPENREF_DOWNLOAD_DIR", "./downloads/audio")
+SEGMENT_SECONDS = 10 * 60  # Matches transcription.CHUNK_MAX_SECONDS
+SEGMENTS_MANIFEST = "segments.json"  # Written once every segment is complete
+PARTIAL_SUFFIX = ".partial"  # Directories of downloads that are running or were abandoned
+DOWNLOAD_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB
+DOWNLOAD_MAX_AGE = 24 * 60 * 60  # Transcripts are cached separately, so segments mostly serve retries
+PARTIAL_MAX_AGE = 60 * 60  # A download that wrote nothing for an hour was abandoned
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+POLL_INTERVAL = 0.5
+ALLOW_FILE_URLS = os.environ.get("OPENREF_ALLOW_FILE_URLS") == "1"
+REMOTE_URL_SCHEMES = ("http", "https")
+REMOTE_PROTOCOLS = "http,https,tcp,tls,crypto"  # All ffmpeg may open for remote media, so a playlist cannot point it at local files
 
 
 class MyLogger(object):
@@ -26,56 +52,195 @@ class MyLogger(object):
         print("[error]: ", msg)
 
 
-def my_hook(d):
-    print("hook", d["status"])
-    if d["status"] == "finished":
-        print("Done downloading, now converting ...")
+class MediaSource:
+    """
+    What one metadata pass learns about a URL: a stable cache key, and where ffmpeg reads the
+    media from.
+    """
+    def __init__(self, key, media_url, title, headers=None, duration=None):
+        self.key = key
+        self.media_url = media_url
+        self.title = title
+        self.headers = headers or {}
+        self.duration = duration
 
 
-def get_ydl_opts(external_logger=lambda x: None):
-    return {
-    "format": "bestaudio/best",
-    "postprocessors": [
-        {
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-                "preferredquality": "192",  # set the preferred bitrate to 192kbps
-            }
-        ],
-        "logger": MyLogger(external_logger),
-    "outtmpl": "./downloads/audio/%(title)s.%(ext)s",  # Set the output filename directly
-    "progress_hooks": [my_hook],
-}
-
-
-def download_video_audio(url, external_logger=lambda x: None):
-    retries = 0
-    while retries < max_retries:
+def with_retries(action, description):
+    """
+    Runs action(), retrying with exponential backoff and jitter.
+    """
+    for attempt in range(MAX_RETRIES):
         try:
-            ydl_opts = get_ydl_opts(external_logger)
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                print("Going to download ", url)
-                info = ydl.extract_info(url, download=False)
-                filesize = info.get("filesize", 0)
-                if filesize > MAX_FILE_SIZE:
-                    raise Exception(FILE_TOO_LARGE_MESSAGE)
-                filename = ydl.prepare_filename(info)
-                res = ydl.download([url])
-                print("youtube-dl result :", res)
-                mp3_filename = os.path.splitext(filename)[0] + '.mp3'
-                print('mp3 file name - ', mp3_filename)
-                return mp3_filename
+            return action()
         except Exception as e:
-            retries += 1
-            print(
-                f"An error occurred during downloading (Attempt {retries}/{max_retries}):",
-                str(e),
-            )
-            if retries >= max_retries:
-                raise e
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = RETRY_BASE_DELAY * 2 ** attempt * random.uniform(1, 1.5)
+            print(f"An error occurred during {description} (Attempt {attempt + 1}/{MAX_RETRIES}), retrying in {delay:.1f}s:", str(e))
             time.sleep(delay)
 
 
+def resolve_source(url, external_logger=lambda x: None, allow_files=ALLOW_FILE_URLS):
+    """
+    Fetches the metadata for url once and returns a MediaSource. There is no size limit: the
+    media is converted and cut into segments far below the upload limit while it downloads.
+
+    Raises ValueError for anything but an http(s) URL, or a file:// URL when allow_files is set.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "file" and allow_files:
+        path = unquote(parsed.path)
+        stat = os.stat(path)
+        return MediaSource(make_key("file", os.path.abspath(path), stat.st_size, stat.st_mtime), path, os.path.basename(path), duration=probe_duration(path))
+
+    if parsed.scheme not in REMOTE_URL_SCHEMES:
+        raise ValueError(f"Unsupported media URL: {url}. Please enter an http or https link.")
+
+    import yt_dlp as youtube_dl  # Imported on first use: it is slow to load and most runs never download
+
+    def extract_info():
+        options = {"format": "bestaudio/best", "noplaylist": True, "quiet": True, "logger": MyLogger(external_logger)}
+        with youtube_dl.YoutubeDL(options) as ydl:
+            print("Resolving ", url)
+            return ydl.extract_info(url, download=False)
+
+    info = with_retries(extract_info, "metadata extraction")
+    if urlparse(info["url"]).scheme not in REMOTE_URL_SCHEMES:
+        raise ValueError(f"Unsupported media location for {url}")
+    return MediaSource(make_key(info.get("extractor_key"), info.get("id")), info["url"], info.get("title", url), info.get("http_headers"), info.get("duration"))
+
+
+def ffmpeg_segment_command(source, directory, segment_seconds, codec):
+    arguments = ["ffmpeg", "-hide_banner", "-nostdin", "-y"]
+    if urlparse(source.media_url).scheme in REMOTE_URL_SCHEMES:
+        arguments += ["-protocol_whitelist", REMOTE_PROTOCOLS, "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "30"]
+        if source.headers:
+            arguments += ["-headers", "".join(f"{name}: {value}\r\n" for name, value in source.headers.items())]
+    else:
+        arguments += ["-protocol_whitelist", "file"]
+    arguments += [
+        "-i", source.media_url,
+        "-vn", "-ac", "1", "-ar", str(TARGET_SAMPLE_RATE), *CODECS[codec][0],
+        "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+        os.path.join(directory, "chunk_%04d" + codec_extension(codec)),
+    ]
+    return arguments
+
+
+def iter_download_segments(source, segment_seconds=SEGMENT_SECONDS, codec=DEFAULT_CODEC, directory=DOWNLOAD_DIR, display_status=lambda text: None):
+    """
+    Yields the paths of compact audio segments of source in order, each as soon as ffmpeg has
+    finished writing it, while later segments are still downloading.
+
+    Cached segments are yielded straight away. Segments are cut at fixed times rather than at
+    silences, since the audio is not known in advance. They do not overlap, so their transcripts
+    are joined as they are.
+
+    While the next segment is still being written, None is yielded every POLL_INTERVAL, so that
+    the consumer can hand on results that finished in the meantime.
+    """
+    segment_directory = os.path.join(directory, source.key)
+    manifest_path = os.path.join(segment_directory, SEGMENTS_MANIFEST)
+    if os.path.exists(manifest_path):
+        os.utime(manifest_path)  # Marks the download as recently used for eviction
+        with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+            yield from (os.path.join(segment_directory, name) for name in json.load(manifest_file)["segments"])
+        return
+
+    # Its own directory, so that concurrent requests for the same media never touch each other's files
+    evict_downloads(directory)
+    work_directory = tempfile.mkdtemp(prefix=source.key + ".", suffix=PARTIAL_SUFFIX, dir=directory)
+    extension = codec_extension(codec)
+    segment_path = lambda index: os.path.join(work_directory, f"chunk_{index:04d}{extension}")
+
+    with open(os.path.join(work_directory, "ffmpeg.log"), "wb") as log_file:
+        process = subprocess.Popen(ffmpeg_segment_command(source, work_directory, segment_seconds, codec), stdout=subprocess.DEVNULL, stderr=log_file)
+        try:
+            index = 0
+            while process.poll() is None:
+                # ffmpeg only starts the next segment once the previous one is closed
+                if os.path.exists(segment_path(index + 1)):
+                    display_status(f"Downloaded {index + 1} segments of {source.title}, transcribing as they arrive....")
+                    yield segment_path(index)
+                    index += 1
+                else:
+                    time.sleep(POLL_INTERVAL)
+                    yield None
+        except BaseException:
+            process.kill()
+            raise
+
+    if process.returncode != 0:
+        with open(os.path.join(work_directory, "ffmpeg.log"), "r", encoding="utf-8", errors="replace") as log_file:
+            raise RuntimeError(f"Downloading {source.title} failed: {log_file.read()[-500:]}")
+
+    while os.path.exists(segment_path(index)):
+        yield segment_path(index)
+        index += 1
+
+    segments = sorted(name for name in os.listdir(work_directory) if name.endswith(extension))
+    publish_segments(work_directory, segment_directory, segments, source.title)
+
+
+def publish_segments(work_directory, segment_directory, segments, title):
+    """
+    Hard-links the finished segments into a new directory with their manifest, then renames it to
+    segment_directory. The work directory keeps its files, as the consumer may still be reading
+    them, and is removed by evict_downloads.
+    """
+    staging_directory = tempfile.mkdtemp(prefix=os.path.basename(segment_directory) + ".", suffix=PARTIAL_SUFFIX, dir=os.path.dirname(segment_directory))
+    for name in segments:
+        try:
+            os.link(os.path.join(work_directory, name), os.path.join(staging_directory, name))
+        except OSError:  # File systems without hard links
+            shutil.copy2(os.path.join(work_directory, name), os.path.join(staging_directory, name))
+    with open(os.path.join(staging_directory, SEGMENTS_MANIFEST), "w", encoding="utf-8") as manifest_file:
+        json.dump({"title": title, "segments": segments}, manifest_file)
+    try:
+        os.rename(staging_directory, segment_directory)
+    except OSError:
+        # Another request for the same media was published first
+        shutil.rmtree(staging_directory, ignore_errors=True)
+
+
+def evict_downloads(directory=DOWNLOAD_DIR, max_bytes=DOWNLOAD_MAX_BYTES, max_age=DOWNLOAD_MAX_AGE):
+    """
+    Removes downloads unused for max_age and unfinished ones that wrote nothing for
+    PARTIAL_MAX_AGE, then the least recently used until the rest fit in max_bytes. A download's
+    last use is its manifest's mtime, which every cache hit touches.
+    """
+    os.makedirs(directory, exist_ok=True)
+    now = time.time()
+    downloads = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        manifest_path = os.path.join(path, SEGMENTS_MANIFEST)
+        try:
+            files = [os.stat(os.path.join(path, file_name)) for file_name in os.listdir(path)]
+            complete = os.path.exists(manifest_path)
+            last_used = os.stat(manifest_path).st_mtime if complete else max((stat.st_mtime for stat in files), default=os.stat(path).st_mtime)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if now - last_used > (max_age if complete else PARTIAL_MAX_AGE):
+            shutil.rmtree(path, ignore_errors=True)
+        elif complete:
+            downloads.append((last_used, sum(stat.st_size for stat in files), path))
+
+    downloads.sort()
+    total_size = sum(size for _, size, _ in downloads)
+    for _, size, path in downloads:
+        if total_size <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+
+def download_video_audio(url, external_logger=lambda x: None, allow_files=ALLOW_FILE_URLS):
+    """
+    Downloads url as compact audio segments and returns their paths, in order.
+    """
+    return [path for path in iter_download_segments(resolve_source(url, external_logger, allow_files)) if path is not None]
+
 
 def delete_download(path):
     try:
@@ -93,4 +258,3 @@ def delete_download(path):
         print(f"File or directory not found: {path}")
     except Exception as e:
         print(f"An error occurred while trying to delete {path}: {str(e)}")
-        
\ No newline at end of file
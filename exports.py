@@ -0,0 +1,79 @@
+"""
+Download artifacts for generated notes, rendered off the script thread and cached by content.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from cache import hash_bytes
+from pipeline import create_pdf_file
+from tracing import NULL_TRACE
+
+EXPORT_CACHE_ENTRIES = 32  # Rendered note sets kept in memory
+
+
+def render_pdf_bytes(markdown: str) -> bytes:
+    return create_pdf_file(markdown).getvalue()
+
+
+class Export:
+    """
+    The markdown of one version of the notes, encoded once, and its PDF once rendered.
+    """
+    def __init__(self, markdown, markdown_bytes, pdf_future):
+        self.markdown = markdown
+        self.markdown_bytes = markdown_bytes
+        self.pdf_future = pdf_future
+
+    def pdf(self, timeout=0):
+        """
+        Returns the PDF bytes, or None if it is still rendering after timeout seconds.
+        Re-raises a rendering error; the ExportCache has already dropped the export by then, so
+        submitting the same notes again renders them again.
+        """
+        if timeout == 0 and not self.pdf_future.done():
+            return None
+        try:
+            return self.pdf_future.result(timeout=timeout)
+        except TimeoutError:
+            return None
+
+
+class ExportCache:
+    """
+    Starts rendering as soon as notes are submitted and keeps the most recent exports, so
+    identical content is never rendered twice. Safe to share between sessions.
+    """
+    def __init__(self, max_entries=EXPORT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.exports = OrderedDict()
+        self.lock = threading.Lock()
+        # Rendering is CPU-bound, so one at a time keeps it from starving the script threads
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+    def submit(self, markdown: str, trace=NULL_TRACE) -> Export:
+        markdown_bytes = markdown.encode("utf-8")
+        key = hash_bytes(markdown_bytes)
+        with self.lock:
+            export = self.exports.get(key)
+            if export is None:
+                export = Export(markdown, markdown_bytes, self.pool.submit(self._render, markdown, trace))
+                self.exports[key] = export
+                while len(self.exports) > self.max_entries:
+                    self.exports.popitem(last=False)
+            else:
+                self.exports.move_to_end(key)
+                return export
+        # Added outside the lock, as it runs right away if the render already finished
+        export.pdf_future.add_done_callback(lambda future: self._drop_failed(key, export))
+        return export
+
+    def _drop_failed(self, key, export):
+        if export.pdf_future.exception() is not None:
+            with self.lock:
+                if self.exports.get(key) is export:
+                    del self.exports[key]
+
+    def _render(self, markdown, trace):
+        with trace.span("pdf", characters=len(markdown)):
+            return render_pdf_bytes(markdown)
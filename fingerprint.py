@@ -0,0 +1,376 @@
+"""
+Acoustic fingerprints, so that re-encoded or trimmed copies of a recording reuse its transcript.
+
+The same meeting often arrives several times: the clerk's WAV, a streamed MP3, a trimmed m4a.
+Their bytes differ, so the content-addressed transcript cache misses, but the loudest peaks of
+their spectrograms sit at the same frequencies and times. Pairs of nearby peaks are hashed
+(both frequencies and the time between them) and stored with their time in a SQLite index. A
+new recording's hashes are looked up there; many hits that agree on the same time offset to one
+earlier recording mean that stretch of audio was heard before, and where.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+FINGERPRINT_DIR = os.environ.get("OPENREF_FINGERPRINT_DIR", "./fingerprints")
+FINGERPRINT_DB = os.path.join(FINGERPRINT_DIR, "fingerprints.db")
+SAMPLE_RATE = 8000  # Speech peaks sit well below 4 kHz, and MP3/AAC encoders keep them
+FRAME_SIZE = 1024
+HOP_SIZE = 256  # 32 ms per frame; coarser hops lose matches when a copy is trimmed half a hop off
+FRAMES_PER_SECOND = SAMPLE_RATE / HOP_SIZE
+BLOCK_FRAMES = 4096  # Frames decoded and analysed at a time, about two minutes
+PEAK_BANDS_HZ = (250, 500, 800, 1200, 1800, 2600, 3600)  # One candidate peak per band and frame
+PEAK_NEIGHBORHOOD = 8  # A peak must be its band's loudest within this many frames either side
+PEAK_FLOOR = 0.5  # Spectral magnitude below which a peak is treated as silence
+FAN_OUT = 6  # Later peaks each peak is paired with
+MAX_PAIR_FRAMES = 63  # Fits the 6 bits the time difference gets in a hash
+MAX_HASH_REPEATS = 32  # Hashes this common within one recording say little and are not looked up
+QUERY_BATCH = 900
+MATCH_TOLERANCE_FRAMES = 1
+COVERAGE_WINDOW_SECONDS = 5.0
+MIN_WINDOW_MATCHES = 8  # Hits at the aligned offset needed for a window to count as heard before
+MIN_WINDOW_MATCH_RATIO = 0.05  # ... and the share of the window's own hashes they must make up
+MIN_RUN_SECONDS = 30.0  # Covered windows only count in runs this long, as chance hits are scattered
+MIN_ALIGNMENT_MATCHES = 60
+MAX_ALIGNMENTS = 4
+FULL_MATCH_COVERAGE = 0.97  # A match this complete, both ways, reuses the earlier transcript as is
+MIN_GAP_SECONDS = 2.0  # Shorter stretches between reused segments are not worth a request
+GAP_PADDING_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    number INTEGER PRIMARY KEY,  -- Hashes refer to recordings by this to keep the index compact
+    id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    transcript TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    hash INTEGER NOT NULL,
+    recording INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (hash, recording, offset)
+) WITHOUT ROWID;
+"""
+
+
+class Fingerprint:
+    """
+    hashes and the frame offsets they occur at, as parallel arrays, for audio of duration seconds.
+    """
+    def __init__(self, hashes, offsets, duration):
+        self.hashes = hashes
+        self.offsets = offsets
+        self.duration = duration
+
+
+class Alignment:
+    """
+    Where a new recording repeats an earlier one: regions are (start, end) seconds in the new
+    recording, and shift is added to them to get the time in the earlier one.
+    """
+    def __init__(self, recording_id, shift, regions, matches):
+        self.recording_id = recording_id
+        self.shift = shift
+        self.regions = regions
+        self.matches = matches
+
+    @property
+    def covered_seconds(self):
+        return sum(end - start for start, end in self.regions)
+
+
+def iter_sample_blocks(path, block_frames=BLOCK_FRAMES):
+    """
+    Decodes path to mono SAMPLE_RATE float samples with ffmpeg, yielding blocks that overlap by
+    one frame so that every frame is analysed exactly once.
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-nostdin", "-i", path, "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    block_bytes = block_frames * HOP_SIZE * 2
+    carry = np.zeros(0, dtype=np.float32)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            samples = np.concatenate([carry, np.frombuffer(data[:len(data) // 2 * 2], dtype="<i2").astype(np.float32) / 32768.0])
+            frame_count = max(0, (len(samples) - FRAME_SIZE) // HOP_SIZE + 1)
+            if frame_count:
+                yield samples[:(frame_count - 1) * HOP_SIZE + FRAME_SIZE]
+            carry = samples[frame_count * HOP_SIZE:]
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {path} for fingerprinting")
+
+
+def spectral_peaks(samples):
+    """
+    Returns (frames, bins) of the spectrogram peaks in samples: per frame, the loudest bin of
+    each band, kept where it is also the loudest of its band in the neighbouring frames.
+    """
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE).astype(np.float32), axis=1))
+    band_edges = (np.array(PEAK_BANDS_HZ) * FRAME_SIZE / SAMPLE_RATE).astype(int)
+
+    peak_frames = []
+    peak_bins = []
+    rows = np.arange(len(spectrum))
+    for low, high in zip(band_edges[:-1], band_edges[1:]):
+        bins = spectrum[:, low:high].argmax(axis=1) + low
+        values = spectrum[rows, bins]
+        padded = np.pad(values, PEAK_NEIGHBORHOOD, constant_values=0)
+        neighborhood_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_NEIGHBORHOOD + 1).max(axis=1)
+        keep = (values >= neighborhood_max) & (values > PEAK_FLOOR)
+        peak_frames.append(rows[keep])
+        peak_bins.append(bins[keep])
+    return np.concatenate(peak_frames), np.concatenate(peak_bins)
+
+
+def peak_hashes(frames, bins):
+    """
+    Pairs each peak with the next FAN_OUT peaks. Returns (hashes, anchor frame offsets).
+    """
+    order = np.lexsort((bins, frames))
+    frames = frames[order].astype(np.int64)
+    bins = bins[order].astype(np.int64)
+    hashes = []
+    offsets = []
+    for distance in range(1, FAN_OUT + 1):
+        delta = frames[distance:] - frames[:-distance]
+        valid = (delta > 0) & (delta <= MAX_PAIR_FRAMES)
+        hashes.append(((bins[:-distance] << 16) | (bins[distance:] << 6) | delta)[valid])
+        offsets.append(frames[:-distance][valid])
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+def fingerprint_audio(path):
+    """
+    Fingerprints the audio file at path. Memory use is bounded by the block size, not the length.
+    """
+    all_frames = []
+    all_bins = []
+    frame_offset = 0
+    for samples in iter_sample_blocks(path):
+        frames, bins = spectral_peaks(samples)
+        all_frames.append(frames + frame_offset)
+        all_bins.append(bins)
+        frame_offset += (len(samples) - FRAME_SIZE) // HOP_SIZE + 1
+    if not all_frames:
+        return Fingerprint(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0.0)
+    hashes, offsets = peak_hashes(np.concatenate(all_frames), np.concatenate(all_bins))
+    return Fingerprint(hashes, offsets, frame_offset / FRAMES_PER_SECOND)
+
+
+def covered_windows(query_frames, window_hashes, window_frames, min_matches=MIN_WINDOW_MATCHES, min_ratio=MIN_WINDOW_MATCH_RATIO):
+    """
+    Returns the windows of the new recording with enough aligned hits, out of window_hashes, the
+    number of hashes each window has.
+    """
+    counts = np.bincount(query_frames // window_frames, minlength=len(window_hashes))
+    return set(np.flatnonzero((counts >= min_matches) & (counts >= min_ratio * window_hashes)).tolist())
+
+
+def window_runs(windows, min_run):
+    """
+    Keeps the windows that are part of a run of at least min_run consecutive windows.
+    """
+    kept = set()
+    run = []
+    for window in sorted(windows) + [None]:
+        if run and (window is None or window != run[-1] + 1):
+            if len(run) >= min_run:
+                kept.update(run)
+            run = []
+        if window is not None:
+            run.append(window)
+    return kept
+
+
+def windows_to_regions(windows, window_seconds, duration):
+    """
+    Merges window indices into sorted (start, end) second ranges, clipped to duration.
+    """
+    regions = []
+    for window in sorted(windows):
+        start, end = window * window_seconds, min(duration, (window + 1) * window_seconds)
+        if regions and regions[-1][1] >= start:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of transcribed recordings with their transcripts. Opens a short-lived connection
+    per call, like JobStore, so it is safe to use from any thread or process.
+    """
+    def __init__(self, path=FINGERPRINT_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def add(self, fingerprint, name, transcript, segments):
+        """
+        Indexes a transcribed recording. segments are its timed Whisper segments, which let
+        later copies reuse parts of it. Returns the recording's ID.
+        """
+        recording_id = uuid.uuid4().hex[:12]
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            number = connection.execute(
+                "INSERT INTO recordings (id, name, duration, transcript, segments, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (recording_id, name, fingerprint.duration, transcript, json.dumps(segments), time.time()),
+            ).lastrowid
+            connection.executemany(
+                "INSERT OR IGNORE INTO hashes (hash, recording, offset) VALUES (?, ?, ?)",
+                zip(fingerprint.hashes.tolist(), [number] * len(fingerprint.hashes), fingerprint.offsets.tolist()),
+            )
+            connection.execute("COMMIT")
+        return recording_id
+
+    def get_recording(self, recording_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        if row is None:
+            return None
+        recording = dict(row)
+        recording["segments"] = json.loads(recording["segments"])
+        return recording
+
+    def _lookup(self, hashes):
+        """
+        Returns (hashes, recording numbers, offsets) of every indexed occurrence of hashes.
+        """
+        rows = []
+        with self._connect() as connection:
+            for start in range(0, len(hashes), QUERY_BATCH):
+                batch = hashes[start:start + QUERY_BATCH]
+                rows += connection.execute(f"SELECT hash, recording, offset FROM hashes WHERE hash IN ({','.join('?' * len(batch))})", batch).fetchall()
+            numbers = dict(connection.execute("SELECT number, id FROM recordings").fetchall()) if rows else {}
+        found = np.array([tuple(row) for row in rows], dtype=np.int64).reshape(-1, 3)
+        return found[:, 0], found[:, 1], found[:, 2], numbers
+
+    def match(self, fingerprint):
+        """
+        Returns the Alignments of fingerprint with indexed recordings, best first. Each covers
+        windows of the new recording that no better alignment covers, in runs of at least
+        MIN_RUN_SECONDS (or the whole recording, when it is shorter).
+        """
+        unique_hashes, counts = np.unique(fingerprint.hashes, return_counts=True)
+        query_hashes = unique_hashes[counts <= MAX_HASH_REPEATS]
+        if not len(query_hashes):
+            return []
+        found_hashes, found_recordings, found_offsets, numbers = self._lookup(query_hashes.tolist())
+        if not len(found_hashes):
+            return []
+
+        # Pair every indexed occurrence with every occurrence of the same hash in the new recording
+        order = np.argsort(fingerprint.hashes, kind="stable")
+        sorted_hashes = fingerprint.hashes[order]
+        sorted_offsets = fingerprint.offsets[order]
+        left = np.searchsorted(sorted_hashes, found_hashes, "left")
+        pair_counts = np.searchsorted(sorted_hashes, found_hashes, "right") - left
+        found_index = np.repeat(np.arange(len(found_hashes)), pair_counts)
+        query_index = np.repeat(left, pair_counts) + np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+        query_frames = sorted_offsets[query_index]
+        recordings = found_recordings[found_index]
+        shifts = found_offsets[found_index] - query_frames
+
+        # Copies of the same audio agree on the shift between their timelines
+        keys, key_counts = np.unique(recordings << 32 | (shifts + (1 << 31)), return_counts=True)
+        window_frames = int(COVERAGE_WINDOW_SECONDS * FRAMES_PER_SECOND)
+        window_hashes = np.bincount(fingerprint.offsets // window_frames)
+        min_run = min(int(np.ceil(MIN_RUN_SECONDS / COVERAGE_WINDOW_SECONDS)), len(window_hashes))
+        alignments = []
+        covered = set()
+        for key in keys[np.argsort(-key_counts)][:MAX_ALIGNMENTS * 4]:
+            recording, shift = int(key >> 32), int((key & 0xFFFFFFFF) - (1 << 31))
+            aligned = (recordings == recording) & (np.abs(shifts - shift) <= MATCH_TOLERANCE_FRAMES)
+            aligned_frames = query_frames[aligned]
+            windows = window_runs(covered_windows(aligned_frames, window_hashes, window_frames) - covered, min_run)
+            matches = int(np.isin(aligned_frames // window_frames, list(windows)).sum())
+            if matches < MIN_ALIGNMENT_MATCHES:
+                continue
+            covered |= windows
+            regions = windows_to_regions(windows, COVERAGE_WINDOW_SECONDS, fingerprint.duration)
+            alignments.append(Alignment(numbers[recording], shift / FRAMES_PER_SECOND, regions, matches))
+            if len(alignments) == MAX_ALIGNMENTS:
+                break
+        return alignments
+
+
+def shift_segments(segments, shift, duration):
+    """
+    Moves timed segments of an earlier recording by -shift seconds into a new recording's
+    time, keeping those that fall within its duration.
+    """
+    shift_ms = round(shift * 1000)
+    shifted = [{**segment, "start_ms": segment["start_ms"] - shift_ms, "end_ms": segment["end_ms"] - shift_ms} for segment in segments]
+    return [segment for segment in shifted if segment["start_ms"] >= 0 and segment["end_ms"] <= duration * 1000 + 1000]
+
+
+def reuse_plan(fingerprint, alignments, recordings, full_match_coverage=FULL_MATCH_COVERAGE, min_gap_seconds=MIN_GAP_SECONDS, gap_padding_seconds=GAP_PADDING_SECONDS):
+    """
+    Splits a new recording into stretches whose transcript is reused and stretches that still
+    need transcribing. recordings maps the alignments' recording IDs to get_recording() results.
+
+    Returns [{"start", "end", "text", "segments"}] in time order, with text None for stretches
+    to transcribe, or None when nothing can be reused. A copy of a whole earlier recording gets
+    its exact transcript back, so notes cached for that transcript are reused too.
+    """
+    if not alignments:
+        return None
+    duration = fingerprint.duration
+    best = alignments[0]
+    prior = recordings[best.recording_id]
+    if best.covered_seconds >= full_match_coverage * duration and abs(prior["duration"] - duration) <= (1 - full_match_coverage) * max(duration, prior["duration"]):
+        return [{"start": 0.0, "end": duration, "text": prior["transcript"], "segments": shift_segments(prior["segments"], best.shift, duration)}]
+
+    # Partial reuse goes by the earlier recordings' timed segments, which entries indexed without them lack
+    reused = []
+    for alignment in alignments:
+        shifted = shift_segments(recordings[alignment.recording_id]["segments"], alignment.shift, duration)
+        for start, end in alignment.regions:
+            picked = [segment for segment in shifted if start <= (segment["start_ms"] + segment["end_ms"]) / 2000 < end]
+            if picked:
+                reused.append({"start": picked[0]["start_ms"] / 1000, "end": picked[-1]["end_ms"] / 1000, "text": " ".join(segment["text"] for segment in picked), "segments": picked})
+    if not reused:
+        return None
+
+    plan = []
+    position = 0.0
+    for piece in sorted(reused, key=lambda piece: piece["start"]) + [None]:
+        next_start = duration if piece is None else piece["start"]
+        if next_start - position >= min_gap_seconds:
+            # Padded so that words cut at the seams are heard whole; TranscriptMerger drops the overlap
+            plan.append({"start": max(0.0, position - gap_padding_seconds), "end": min(duration, next_start + gap_padding_seconds), "text": None, "segments": None})
+        if piece is None:
+            break
+        plan.append(piece)
+        position = max(position, piece["end"])
+    return plan
@@ -0,0 +1,107 @@
+# Groq on-demand prices in USD per million tokens (input, output)
+MODEL_PRICING = {
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama3-8b-8192": (0.05, 0.08),
+    "mixtral-8x7b-32768": (0.24, 0.24),
+    "gemma-7b-it": (0.07, 0.07),
+    "gemma2-9b-it": (0.20, 0.20),
+}
+DEFAULT_PRICING = (11.0, 11.0)  # Unknown models keep the old flat $0.000011 per token
+# Whisper is billed per hour of audio
+TRANSCRIPTION_PRICING = {
+    "whisper-large-v3": 0.111,
+}
+
+
+def token_costs(model_name, input_tokens, output_tokens):
+    """
+    Returns the (input, output) cost in USD of a completion.
+    """
+    input_price, output_price = MODEL_PRICING.get(model_name, DEFAULT_PRICING)
+    return input_tokens * input_price / 1e6, output_tokens * output_price / 1e6
+
+
+def transcription_cost(model_name, audio_seconds):
+    return audio_seconds / 3600 * TRANSCRIPTION_PRICING.get(model_name, 0.0)
+
+
+class GenerationStatistics:
+    def __init__(self, input_time=0,output_time=0,input_tokens=0,output_tokens=0,total_time=0,model_name="llama3-8b-8192"):
+        self.input_time = input_time
+        self.output_time = output_time
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.total_time = total_time # Sum of queue, prompt (input), and completion (output) times
+        self.model_name = model_name
+        # Priced per model when recorded, so totals over several models stay correct
+        self.input_cost, self.output_cost = token_costs(model_name, input_tokens, output_tokens)
+
+    @property
+    def cost(self):
+        return self.input_cost + self.output_cost
+
+    def get_input_speed(self):
+        """ 
+        Tokens per second calculation for input
+        """
+        if self.input_time != 0:
+            return self.input_tokens / self.input_time
+        else:
+            return 0
+    
+    def get_output_speed(self):
+        """ 
+        Tokens per second calculation for output
+        """
+        if self.output_time != 0:
+            return self.output_tokens / self.output_time
+        else:
+            return 0
+    
+    @classmethod
+    def from_usage(cls, usage, model_name):
+        """
+        Builds statistics from the usage block Groq returns with a completion.
+        """
+        return cls(input_time=usage.prompt_time, output_time=usage.completion_time, input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens, total_time=usage.total_time, model_name=model_name)
+
+    def add(self, other):
+        """
+        Add statistics from another GenerationStatistics object to this one.
+        """
+        if not isinstance(other, GenerationStatistics):
+            raise TypeError("Can only add GenerationStatistics objects")
+        
+        self.input_time += other.input_time
+        self.output_time += other.output_time
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.total_time += other.total_time
+        self.input_cost += other.input_cost
+        self.output_cost += other.output_cost
+
+    def to_dict(self):
+        return {
+            "model_name": self.model_name,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "input_time": self.input_time,
+            "output_time": self.output_time,
+            "total_time": self.total_time,
+            "input_speed": self.get_input_speed(),
+            "output_speed": self.get_output_speed(),
+            "cost": self.cost,
+        }
+
+    def __str__(self):
+        total_tokens = self.input_tokens + self.output_tokens
+        cost = self.cost
+        
+        return (f"\n## {self.get_output_speed():.2f} T/s ⚡\nRound trip time: {self.total_time:.2f}s  Model: {self.model_name}\n"
+                f"Total cost: ${cost:.6f}\n\n"
+                f"| Metric          | Input          | Output          | Total          |\n"
+                f"|-----------------|----------------|-----------------|----------------|\n"
+                f"| Speed (T/s)     | {self.get_input_speed():.2f}            | {self.get_output_speed():.2f}            | {(total_tokens) / self.total_time if self.total_time != 0 else 0:.2f}            |\n"
+                f"| Tokens          | {self.input_tokens}            | {self.output_tokens}            | {total_tokens}            |\n"
+                f"| Cost ($)        | {self.input_cost:.6f}            | {self.output_cost:.6f}            | {cost:.6f}            |\n"
+                f"| Inference Time (s) | {self.input_time:.2f}            | {self.output_time:.2f}            | {self.total_time:.2f}            |")
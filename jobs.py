@@ -0,0 +1,170 @@
+"""
+SQLite-backed job queue for note generation that runs outside the Streamlit script.
+
+The UI submits a job and can reattach to it by ID after a rerun or refresh. Worker processes
+(see worker.py) claim queued jobs and checkpoint the transcript, the outline and every section
+as they go, so a restarted worker resumes from the last finished section.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+JOBS_DIR = os.environ.get("OPENREF_JOBS_DIR", "./jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.db")
+JOBS_AUDIO_DIR = os.path.join(JOBS_DIR, "audio")
+STALE_AFTER = 120  # Seconds without a heartbeat before a running job is considered abandoned
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    template TEXT NOT NULL,
+    outline_model TEXT NOT NULL,
+    content_model TEXT NOT NULL,
+    audio_path TEXT NOT NULL,
+    compact INTEGER NOT NULL DEFAULT 1,
+    transcript TEXT,
+    outline TEXT,
+    error TEXT,
+    worker TEXT,
+    heartbeat REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    job_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, title)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+
+class JobStore:
+    """
+    Jobs and their checkpoints. Opens a short-lived connection per call, so it is safe to use
+    from any thread or process.
+    """
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+            # Databases created before jobs recorded the compaction setting
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            if "compact" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN compact INTEGER NOT NULL DEFAULT 1")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def create_job(self, audio_file, template, outline_model, content_model, compact=True):
+        """
+        Copies the audio next to the database and queues a job for it. Returns the job ID.
+        compact is whether the worker compacts the transcript before prompting.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(JOBS_AUDIO_DIR, exist_ok=True)
+        extension = os.path.splitext(getattr(audio_file, "name", "") or "")[1] or ".wav"
+        audio_path = os.path.join(JOBS_AUDIO_DIR, job_id + extension)
+        audio_file.seek(0)
+        with open(audio_path, "wb") as output:
+            shutil.copyfileobj(audio_file, output)
+        audio_file.seek(0)
+
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, template, outline_model, content_model, audio_path, compact, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, template, outline_model, content_model, audio_path, int(compact), now, now),
+            )
+        return job_id
+
+    def claim_next_job(self, worker):
+        """
+        Atomically takes the oldest queued job, or a running job whose worker stopped heartbeating.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?) ORDER BY created LIMIT 1",
+                (QUEUED, RUNNING, now - STALE_AFTER),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute("UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, updated = ? WHERE id = ?", (RUNNING, worker, now, now, row["id"]))
+            connection.execute("COMMIT")
+        return dict(row)
+
+    def update_job(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def finish_job(self, job_id, status, error=None):
+        """
+        Records a terminal status and deletes the job's copy of the audio, which is never read again.
+        """
+        job = self.get_job(job_id)
+        self.update_job(job_id, status=status, error=error)
+        try:
+            os.remove(job["audio_path"])
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self, job_id):
+        self.update_job(job_id, heartbeat=time.time())
+
+    def save_outline(self, job_id, outline):
+        self.update_job(job_id, outline=json.dumps(outline))
+
+    def save_section(self, job_id, title, position, content, done=False):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO sections (job_id, title, position, content, done) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (job_id, title) DO UPDATE SET content = excluded.content, done = excluded.done",
+                (job_id, title, position, content, int(done)),
+            )
+
+    def get_job(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, status):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created", (status,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_sections(self, job_id):
+        """
+        Returns [(title, content, done)] in outline order.
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT title, content, done FROM sections WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()
+        return [(row["title"], row["content"], bool(row["done"])) for row in rows]
+
+    def completed_sections(self, job_id):
+        return {title: content for title, content, done in self.get_sections(job_id) if done}
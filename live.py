@@ -0,0 +1,175 @@
+import threading
+import wave
+from collections import deque
+from io import BytesIO
+
+from audio import TARGET_SAMPLE_RATE
+from generation_statistics import GenerationStatistics
+from mapreduce import summarize_window, WINDOW_TOKENS, WORDS_PER_TOKEN
+from notes import Notes
+from retrieval import BM25Index, tokenize
+from transcription import find_overlap, OverlappingChunk, CHUNK_OVERLAP_SECONDS
+
+LIVE_WINDOW_SECONDS = 30.0  # Fixed length of the windows cut from the live audio stream
+LIVE_MAX_RECENT_WORDS = 6000  # Raw transcript kept in memory; older words are folded into summaries
+LIVE_REFRESH_EVERY = 3  # Windows between refreshes of the affected sections
+LIVE_SECTIONS_PER_WINDOW = 2  # How many sections one window can mark as affected
+
+# Used when the selected template leaves the outline to the LLM
+LIVE_DEFAULT_SECTIONS = {
+    "Discussion": "Summary of the topics discussed",
+    "Decisions": "Decisions made and votes taken",
+    "Action Items": "Tasks, owners and deadlines",
+}
+
+
+class LiveAudioBuffer:
+    """
+    Collects a continuous audio stream and cuts it into fixed windows of 16-bit mono PCM, each
+    starting CHUNK_OVERLAP_SECONDS before the previous one ended, so a word spoken across a cut
+    is heard whole at least once.
+
+    Audio arrives on the WebRTC thread while the script thread takes the windows, so nothing is
+    lost while a window is being transcribed or the notes are being refreshed.
+    """
+    def __init__(self, window_seconds=LIVE_WINDOW_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS, sample_rate=TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.window_bytes = int(window_seconds * sample_rate) * 2
+        self.overlap_bytes = int(overlap_seconds * sample_rate) * 2
+        self.lock = threading.Lock()
+        self.resampler = None
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.samples = bytearray()  # Audio not yet in a finished window
+            self.windows = deque()  # (pcm, overlapping) in order
+            self.continued = False  # Whether the next window overlaps the previous one
+
+    def add_frames(self, frames):
+        """
+        Adds av.AudioFrames from the stream, in order, converted to 16-bit mono PCM.
+        """
+        import av  # Installed with streamlit-webrtc, which is only loaded for live sessions
+
+        if self.resampler is None:
+            self.resampler = av.AudioResampler(format="s16", layout="mono", rate=self.sample_rate)
+        for frame in frames:
+            for resampled in self.resampler.resample(frame):
+                self.add_samples(resampled.to_ndarray().tobytes())
+
+    def add_samples(self, pcm):
+        with self.lock:
+            self.samples += pcm
+            while len(self.samples) >= self.window_bytes:
+                self.windows.append((bytes(self.samples[:self.window_bytes]), self.continued))
+                self.samples = self.samples[self.window_bytes - self.overlap_bytes:]
+                self.continued = True
+
+    def end_stream(self):
+        """
+        Closes the last, shorter window once the stream stops. Safe to call repeatedly.
+        """
+        with self.lock:
+            if len(self.samples) > (self.overlap_bytes if self.continued else 0):
+                self.windows.append((bytes(self.samples), self.continued))
+            self.samples = bytearray()
+            self.continued = False
+
+    def next_window(self):
+        """
+        Returns the oldest finished window as (WAV file, overlapping), or None. It stays queued
+        until window_done(), so a window interrupted by a rerun is transcribed again.
+        """
+        with self.lock:
+            if not self.windows:
+                return None
+            pcm, overlapping = self.windows[0]
+        window_file = BytesIO()
+        with wave.open(window_file, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(pcm)
+        window_file.seek(0)
+        window_file.name = "window.wav"
+        return window_file, overlapping
+
+    def window_done(self):
+        with self.lock:
+            self.windows.popleft()
+
+
+class LiveSession:
+    """
+    Rolling transcript and notes for a meeting that is transcribed window by window while it
+    is recorded (see LiveAudioBuffer).
+
+    Only text is kept, never audio, and the raw transcript is capped at LIVE_MAX_RECENT_WORDS:
+    older words are summarized, so memory stays bounded however long the session runs.
+    """
+    def __init__(self, client, sections, summary_model="llama3-8b-8192"):
+        self.client = client
+        self.summary_model = summary_model
+        self.notes = Notes({})
+        for title, description in sections.items():
+            self.notes.add_section((), title, description)
+        self.section_index = BM25Index([f"{title}: {description}" for title, description in sections.items()])
+        self.section_titles = list(sections)
+
+        self.recent_words = []
+        self.summaries = []
+        self.window_count = 0
+        self.refreshed_at = 0  # window_count when the affected sections were last all refreshed
+        self.affected = set()
+        self.statistics = GenerationStatistics(model_name=summary_model)
+
+    def add_window(self, text):
+        """
+        Appends a transcribed window and marks the sections it is most relevant to as affected.
+        The words an OverlappingChunk repeats from the previous window are dropped.
+        """
+        self.window_count += 1
+        words = text.split()
+        if isinstance(text, OverlappingChunk):
+            words = words[find_overlap(self.recent_words, words):]
+        self.recent_words.extend(words)
+        self._fold_old_words()
+
+        matches = self.section_index.search(text, LIVE_SECTIONS_PER_WINDOW)
+        if not matches and tokenize(text):
+            matches = [0]  # Nothing specific matched, so it belongs to the general section
+        self.affected.update(self.section_titles[index] for index in matches)
+
+    def _fold_old_words(self):
+        window_words = int(WINDOW_TOKENS * WORDS_PER_TOKEN)
+        while len(self.recent_words) > LIVE_MAX_RECENT_WORDS:
+            oldest = " ".join(self.recent_words[:window_words])
+            self.recent_words = self.recent_words[window_words:]
+            window_statistics, summary = summarize_window(self.client, oldest, len(self.summaries), None, self.summary_model)
+            self.statistics.add(window_statistics)
+            self.summaries.append(summary)
+
+    def refresh_due(self, force=False):
+        return bool(self.affected) and (force or self.window_count - self.refreshed_at >= LIVE_REFRESH_EVERY)
+
+    def affected_sections(self):
+        """
+        Returns (title, description) for the sections to regenerate, in outline order. Each stays
+        affected until mark_refreshed(), so a refresh cut short by a rerun is not lost.
+        """
+        return [(title, self.notes.structure[title]) for title in self.section_titles if title in self.affected]
+
+    def mark_refreshed(self, title):
+        self.affected.discard(title)
+        if not self.affected:
+            self.refreshed_at = self.window_count
+
+    def transcript_index(self):
+        """
+        Index over everything heard so far: summaries of folded-out windows plus the recent transcript.
+        """
+        return BM25Index.from_transcript("\n\n".join(self.summaries + [" ".join(self.recent_words)]))
+
+    def transcript(self):
+        return " ".join(self.recent_words)
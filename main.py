@@ -1,135 +1,362 @@
+import sys
+import time
+# Taken before the other imports, so the first run in a process includes their cost
+script_started = time.perf_counter()
+cold_start = "pipeline" not in sys.modules
+
 import streamlit as st
-from groq import Groq
 import json
 import os
+import subprocess
+import threading
 from io import BytesIO
-from md2pdf.core import md2pdf
+from urllib.parse import urlparse
 from dotenv import load_dotenv
-from download import download_video_audio, delete_download, MAX_FILE_SIZE, FILE_TOO_LARGE_MESSAGE
-from audio_recorder_streamlit import audio_recorder
+from download import delete_download, ALLOW_FILE_URLS, FILE_TOO_LARGE_MESSAGE, REMOTE_URL_SCHEMES
+from cache import DiskCache, hash_bytes
+from clients import create_groq_client
+from exports import ExportCache
+from tracing import start_metrics_server, Trace
+from uploads import AudioHandle, current_rss_bytes, memory_available, peak_rss_bytes
+from generation_statistics import GenerationStatistics
+from notes import Notes
+from pipeline import compact_for_prompts, generate_section, iter_transcript, iter_url_transcript, needs_map_reduce, stream_notes, transcribe_audio
+from streaming import StreamingTranscript
+from jobs import JobStore, DONE, FAILED
+from archive import Archive, format_timestamp
+from fingerprint import FingerprintIndex
+from live import LiveAudioBuffer, LiveSession, LIVE_DEFAULT_SECTIONS, LIVE_WINDOW_SECONDS
+from transcription import merge_transcripts, OverlappingChunk
+from retrieval import DEFAULT_TOP_K
+from section_scheduler import SECTION_DONE, SECTION_RESET, DEFAULT_MAX_CONCURRENCY
 
 
 from prompt_templates import PROMPT_TEMPLATES
+from rate_limit import RateLimiter, RateLimitedClient
 
 load_dotenv()
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", None)
 audio_file_path = None
+API_KEY_CACHE_ENTRIES = 32  # Clients and rate limiters kept for the most recently used API keys
+API_KEY_CACHE_TTL = 24 * 60 * 60  # Seconds before a key's client and rate limiter are dropped
 
 
 if 'api_key' not in st.session_state:
     st.session_state.api_key = GROQ_API_KEY
 
-if 'groq' not in st.session_state:
-    if GROQ_API_KEY:
-        st.session_state.groq = Groq()
-
 st.set_page_config(
     page_title="OpenRef",
     page_icon="👐",
 )
-      
-class GenerationStatistics:
-    def __init__(self, input_time=0,output_time=0,input_tokens=0,output_tokens=0,total_time=0,model_name="llama3-8b-8192"):
-        self.input_time = input_time
-        self.output_time = output_time
-        self.input_tokens = input_tokens
-        self.output_tokens = output_tokens
-        self.total_time = total_time # Sum of queue, prompt (input), and completion (output) times
-        self.model_name = model_name
-
-    def get_input_speed(self):
-        """ 
-        Tokens per second calculation for input
-        """
-        if self.input_time != 0:
-            return self.input_tokens / self.input_time
-        else:
-            return 0
-    
-    def get_output_speed(self):
-        """ 
-        Tokens per second calculation for output
-        """
-        if self.output_time != 0:
-            return self.output_tokens / self.output_time
+
+@st.cache_resource(show_spinner=False, max_entries=API_KEY_CACHE_ENTRIES, ttl=API_KEY_CACHE_TTL)
+def get_groq_client(api_key):
+    """
+    One client, and one pool of keep-alive connections, per API key, shared by every session.
+    """
+    return create_groq_client(api_key)
+
+if 'groq' not in st.session_state:
+    if GROQ_API_KEY:
+        st.session_state.groq = get_groq_client(GROQ_API_KEY)
+
+@st.cache_resource
+def get_disk_cache():
+    """
+    One on-disk cache per server process, shared by every session.
+    """
+    return DiskCache()
+
+disk_cache = get_disk_cache()
+
+@st.cache_resource
+def start_metrics_endpoint(port):
+    """
+    Prometheus metrics for the whole server process, at http://<host>:<port>/metrics.
+    """
+    return start_metrics_server(port)
+
+if os.environ.get("OPENREF_METRICS_PORT"):
+    start_metrics_endpoint(int(os.environ["OPENREF_METRICS_PORT"]))
+
+@st.cache_resource(max_entries=API_KEY_CACHE_ENTRIES, ttl=API_KEY_CACHE_TTL)
+def get_rate_limiter(api_key):
+    """
+    Rate limits belong to the API key, so every session using the same key shares one limiter.
+    """
+    return RateLimiter()
+
+def rate_limited_groq(fallback_models=()):
+    return RateLimitedClient(st.session_state.groq, get_rate_limiter(st.session_state.groq.api_key), fallback_models)
+
+@st.cache_resource
+def get_export_cache():
+    return ExportCache()
+
+def display_downloads(notes):
+    """
+    Download buttons that stay up across reruns. The PDF was started when generation finished,
+    so it is usually ready by the time the buttons render.
+    """
+    export = get_export_cache().submit(notes.get_markdown_content())
+    st.download_button(
+        label='Download Text',
+        data=export.markdown_bytes,
+        file_name='generated_notes.txt',
+        mime='text/plain'
+    )
+
+    try:
+        pdf_bytes = export.pdf()
+    except Exception as e:
+        # Only the PDF button is replaced; the failed render is not cached, so a rerun tries again
+        st.error(f"The PDF could not be rendered: {e}")
+        return
+    if pdf_bytes is not None:
+        st.download_button(
+            label='Download PDF',
+            data=pdf_bytes,
+            file_name='generated_notes.pdf',
+            mime='application/pdf'
+        )
+    elif st.button("PDF is still rendering, refresh"):
+        st.rerun()
+
+def session_audio_handle(source_id, data, name):
+    """
+    Writes the session's current audio to disk once. Reruns with the same upload or recording
+    reuse the file, and a new one replaces it.
+    """
+    audio_handle = st.session_state.get("audio_handle")
+    if audio_handle is None or audio_handle.source_id != source_id:
+        if audio_handle is not None:
+            audio_handle.delete()
+        audio_handle = AudioHandle.create(data, name, source_id)
+        st.session_state.audio_handle = audio_handle
+    return audio_handle
+
+def record_memory(stage):
+    st.session_state.peak_rss = max(st.session_state.get("peak_rss", 0), current_rss_bytes())
+    print(f"Memory after {stage}: {current_rss_bytes() / 1e6:.0f} MB resident, session peak {st.session_state.peak_rss / 1e6:.0f} MB, process peak {peak_rss_bytes() / 1e6:.0f} MB")
+
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 1.0
+JOB_WORKER_RESTART_DELAY = 10.0  # Minimum seconds between starts, so workers that fail on start do not spin
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+@st.cache_resource
+def get_job_store():
+    return JobStore()
+
+@st.cache_resource
+def get_job_workers():
+    """
+    The worker processes this server started, shared by every session.
+    """
+    return {"process": None, "started": 0.0, "lock": threading.Lock()}
+
+def start_job_workers(restart_only=False):
+    """
+    Starts the background worker processes the first time a job is submitted, and again once
+    they have exited. Returns a message about the exit, or None while they are running. With
+    restart_only, workers are only restarted, never started, as they may be run on their own.
+    """
+    workers = get_job_workers()
+    with workers["lock"]:
+        process = workers["process"]
+        if (process is None and restart_only) or (process is not None and process.poll() is None):
+            return None
+        message = None
+        if process is not None:
+            message = f"The job workers exited with code {process.returncode}; see the server log."
+            print(f"[error]: {message}")
+            if time.monotonic() - workers["started"] < JOB_WORKER_RESTART_DELAY:
+                return message
+        workers["process"] = subprocess.Popen([sys.executable, WORKER_SCRIPT, "--workers", str(JOB_WORKERS)])
+        workers["started"] = time.monotonic()
+        return message and message + " They were restarted."
+
+def display_job(job_id):
+    """
+    Shows a background job's checkpoints, refreshed until it finishes without holding up the
+    script thread. Safe to call again after a refresh.
+    """
+    job_store = get_job_store()
+    job = job_store.get_job(job_id)
+    if job is None:
+        st.error(f"No job with ID {job_id}")
+        return
+
+    st.caption(f"Background job {job_id}. Reopen this page with ?job={job_id} to reattach.")
+    if job["status"] not in (DONE, FAILED):
+        display_job_progress(job_id)
+        return
+
+    sections = job_store.get_sections(job_id)
+    st.markdown("\n\n".join(f"## {title}\n{content}" for title, content, _ in sections if content))
+    if job["status"] == FAILED:
+        st.error(job["error"])
+        return
+    notes = Notes(json.loads(job["outline"]) if job["outline"] else {})
+    for title, content, _ in sections:
+        notes.contents[title] = content
+    st.session_state.notes = notes
+    get_export_cache().submit(notes.get_markdown_content())
+
+@st.experimental_fragment(run_every=JOB_POLL_INTERVAL)
+def display_job_progress(job_id):
+    """
+    Reruns on its own every JOB_POLL_INTERVAL while the job runs, then reruns the whole page to
+    show the finished notes.
+    """
+    job = get_job_store().get_job(job_id)
+    if job["status"] in (DONE, FAILED):
+        st.rerun()
+    worker_failure = start_job_workers(restart_only=True)
+    if worker_failure:
+        st.error(worker_failure)
+    sections = get_job_store().get_sections(job_id)
+    finished = sum(1 for _, _, done in sections if done)
+    st.write(f"Status: {job['status']} ({finished}/{len(sections)} sections finished)")
+    st.markdown("\n\n".join(f"## {title}\n{content}" for title, content, _ in sections if content))
+
+@st.cache_resource
+def get_archive():
+    return Archive()
+
+@st.cache_resource
+def get_fingerprint_index():
+    return FingerprintIndex()
+
+def display_archive_hits(query):
+    hits = get_archive().search(query)
+    if not hits:
+        st.write("No matches.")
+    for hit in hits:
+        if hit["start_ms"] is not None:
+            location = f"at {format_timestamp(hit['start_ms'])}"
         else:
-            return 0
-    
-    def add(self, other):
-        """
-        Add statistics from another GenerationStatistics object to this one.
-        """
-        if not isinstance(other, GenerationStatistics):
-            raise TypeError("Can only add GenerationStatistics objects")
-        
-        self.input_time += other.input_time
-        self.output_time += other.output_time
-        self.input_tokens += other.input_tokens
-        self.output_tokens += other.output_tokens
-        self.total_time += other.total_time
-
-    def __str__(self):
-        total_tokens = self.input_tokens + self.output_tokens
-        cost = total_tokens * 0.000011  # $0.000011 per token
-        
-        return (f"\n## {self.get_output_speed():.2f} T/s ⚡\nRound trip time: {self.total_time:.2f}s  Model: {self.model_name}\n"
-                f"Total cost: ${cost:.6f}\n\n"
-                f"| Metric          | Input          | Output          | Total          |\n"
-                f"|-----------------|----------------|-----------------|----------------|\n"
-                f"| Speed (T/s)     | {self.get_input_speed():.2f}            | {self.get_output_speed():.2f}            | {(total_tokens) / self.total_time if self.total_time != 0 else 0:.2f}            |\n"
-                f"| Tokens          | {self.input_tokens}            | {self.output_tokens}            | {total_tokens}            |\n"
-                f"| Cost ($)        | {self.input_tokens * 0.000011:.6f}            | {self.output_tokens * 0.000011:.6f}            | {cost:.6f}            |\n"
-                f"| Inference Time (s) | {self.input_time:.2f}            | {self.output_time:.2f}            | {self.total_time:.2f}            |")
-
-class NoteSection:
+            location = f"in {hit['title']}" if hit["title"] else "in the transcript"
+        st.markdown(f"**{hit['meeting_title']}** · {time.strftime('%Y-%m-%d', time.localtime(hit['created']))} · {location}\n\n{hit['snippet']}")
+      
+LIVE_POLL_INTERVAL = 2.0  # Seconds between checks for newly recorded live windows
+
+@st.experimental_fragment(run_every=LIVE_POLL_INTERVAL)
+def display_live_session(live_session, live_audio, stream_stopped, content_model, top_k):
+    """
+    Transcribes the live windows recorded since the last run, shows the notes and regenerates
+    the sections the new windows affected. Reruns on its own while the stream keeps recording.
+    """
+    client = rate_limited_groq()
+    if stream_stopped:
+        live_audio.end_stream()
+    while (window := live_audio.next_window()) is not None:
+        window_file, overlapping = window
+        with st.spinner("Transcribing the latest window...."):
+            text = transcribe_audio(client, window_file)
+        live_session.add_window(OverlappingChunk(text) if overlapping else text)
+        live_audio.window_done()
+
+    live_placeholders = {title: st.empty() for title in live_session.notes.contents}
+    for title, content in live_session.notes.contents.items():
+        live_placeholders[title].markdown(f"## {title}\n{content or '_Waiting for the meeting to cover this._'}")
+
+    if live_session.refresh_due(force=st.session_state.pop("live_refresh_requested", False)):
+        transcript_index = live_session.transcript_index()
+        for title, description in live_session.affected_sections():
+            # Regenerated from everything heard so far, replacing the previous version of the section
+            refreshed = ""
+            last_render = 0.0
+            for chunk in generate_section(client, transcript=transcript_index.context_for(title + ": " + description, top_k), existing_notes="", section=(title + ": " + description), model=content_model):
+                if isinstance(chunk, str):
+                    refreshed += chunk
+                    # Throttled like NoteSection, as every render re-sends the whole section
+                    if time.monotonic() - last_render >= RENDER_INTERVAL:
+                        live_placeholders[title].markdown(f"## {title}\n{refreshed}")
+                        last_render = time.monotonic()
+            live_placeholders[title].markdown(f"## {title}\n{refreshed}")
+            live_session.notes.contents[title] = refreshed
+            live_session.mark_refreshed(title)
+
+    with st.expander(f"Rolling transcript ({live_session.window_count} windows)"):
+        st.markdown(live_session.transcript())
+
+RENDER_INTERVAL = 0.1  # Minimum seconds between re-renders of the same section
+RENDER_MAX_PENDING_CHARS = 400  # Render sooner once this much unseen text has piled up
+MAX_RENDERS_PER_SECOND = 20  # Cap on placeholder updates per session, across all sections
+
+class NoteSection(Notes):
     def __init__(self, structure, transcript):
-        self.structure = structure
-        self.contents = {title: "" for title in self.flatten_structure(structure)}
+        super().__init__(structure)
         self.placeholders = {title: st.empty() for title in self.flatten_structure(structure)}
 
+        # Render buffer: tokens are coalesced and flushed on a time or size budget
+        self.pending_chars = {title: 0 for title in self.contents}
+        self.last_render = {title: 0.0 for title in self.contents}
+        self.last_session_render = 0.0
+        self.render_count = 0
+        self.render_seconds = 0.0
+        self.render_started = time.monotonic()
+
         st.markdown("## Raw transcript:")
         st.markdown(transcript)
         st.markdown("---")
 
-    def flatten_structure(self, structure):
-        sections = []
-        for title, content in structure.items():
-            sections.append(title)
-            if isinstance(content, dict):
-                sections.extend(self.flatten_structure(content))
-        return sections
+    def add_section(self, path, title, description=None):
+        super().add_section(path, title, description)
+        if title not in self.placeholders:
+            # Outline entries arrive in order, so appending placeholders keeps the outline order
+            self.placeholders[title] = st.empty()
+            self.pending_chars[title] = 0
+            self.last_render[title] = 0.0
 
     def update_content(self, title, new_content):
         try:
             self.contents[title] += new_content
-            self.display_content(title)
+            self.pending_chars[title] += len(new_content)
         except TypeError as e:
-            pass
+            return
+
+        now = time.monotonic()
+        due = now - self.last_render[title] >= RENDER_INTERVAL or self.pending_chars[title] >= RENDER_MAX_PENDING_CHARS
+        if due and now - self.last_session_render >= 1 / MAX_RENDERS_PER_SECOND:
+            self.display_content(title)
 
     def display_content(self, title):
+        started = time.monotonic()
         if self.contents[title].strip():
             self.placeholders[title].markdown(f"## {title}\n{self.contents[title]}")
+            self.render_count += 1
+        now = time.monotonic()
+        self.render_seconds += now - started
+        self.last_render[title] = now
+        self.last_session_render = now
+        self.pending_chars[title] = 0
+
+    def flush(self, title=None):
+        """
+        Renders any buffered text, for one section or for all of them. Call when a stream ends.
+        """
+        for pending_title in ([title] if title is not None else list(self.contents)):
+            if self.pending_chars.get(pending_title):
+                self.display_content(pending_title)
 
-    def return_existing_contents(self, level=1) -> str:
-        existing_content = ""
-        for title, content in self.structure.items():
-            if self.contents[title].strip():  # Only include title if there is content
-                existing_content += f"{'#' * level} {title}\n{self.contents[title]}.\n\n"
-            if isinstance(content, dict):
-                existing_content += self.get_markdown_content(content, level + 1)
-        return existing_content
+    def renders_per_second(self):
+        elapsed = time.monotonic() - self.render_started
+        return self.render_count / elapsed if elapsed > 0 else 0
 
-    def display_structure(self, structure=None, level=1):
-        if structure is None:
-            structure = self.structure
-        
-        for title, content in structure.items():
-            if self.contents[title].strip():  # Only display title if there is content
-                st.markdown(f"{'#' * level} {title}")
-                self.placeholders[title].markdown(self.contents[title])
-            if isinstance(content, dict):
-                self.display_structure(content, level + 1)
+    def complete_section(self, title):
+        """
+        Marks a section as finished: flushes its buffered text and appends it to the notes context.
+        """
+        self.flush(title)
+        super().complete_section(title)
+
+    def reset_section(self, title):
+        super().reset_section(title)
+        self.pending_chars[title] = 0
+        self.placeholders[title].empty()
 
     def display_toc(self, structure, columns, level=1, col_index=0):
         for title, content in structure.items():
@@ -140,113 +367,6 @@ class NoteSection:
                 col_index = self.display_toc(content, columns, level + 1, col_index)
         return col_index
 
-    def get_markdown_content(self, structure=None, level=1):
-        """
-        Returns the markdown styled pure string with the contents.
-        """
-        if structure is None:
-            structure = self.structure
-        
-        markdown_content = ""
-        for title, content in structure.items():
-            if self.contents[title].strip():  # Only include title if there is content
-                markdown_content += f"{'#' * level} {title}\n{self.contents[title]}.\n\n"
-            if isinstance(content, dict):
-                markdown_content += self.get_markdown_content(content, level + 1)
-        return markdown_content
-
-def create_markdown_file(content: str) -> BytesIO:
-    """
-    Create a Markdown file from the provided content.
-    """
-    markdown_file = BytesIO()
-    markdown_file.write(content.encode('utf-8'))
-    markdown_file.seek(0)
-    return markdown_file
-
-def create_pdf_file(content: str):
-    """
-    Create a PDF file from the provided content.
-    """
-    pdf_buffer = BytesIO()
-    md2pdf(pdf_buffer, md_content=content)
-    pdf_buffer.seek(0)
-    return pdf_buffer
-
-def transcribe_audio(audio_file):
-    """
-    Transcribes audio using Groq's Whisper API.
-    """
-    transcription = st.session_state.groq.audio.transcriptions.create(
-      file=audio_file,
-      model="whisper-large-v3",
-      prompt="",
-      response_format="json",
-      language="en",
-      temperature=0.0 
-    )
-
-    results = transcription.text
-    return results
-
-def generate_notes_structure(transcript: str, model: str = "llama3-70b-8192"):
-    template = PROMPT_TEMPLATES[selected_template]
-    completion = st.session_state.groq.chat.completions.create(
-        model=model,
-        messages=[
-            {
-                "role": "system",
-                "content": template["system"] + " Always return valid JSON with string values only, no placeholders."
-            },
-            {
-                "role": "user",
-                "content": f"### Transcript {transcript}\n\n### Example\n\n{template['shot_example']}### Instructions\n\nCreate a structure for comprehensive notes on the above transcribed audio. Use only text content, no placeholders."
-            }
-        ],
-        temperature=0.2,  # Lower temperature for more consistent JSON
-        max_tokens=8000,
-        top_p=1,
-        stream=False,
-        response_format={"type": "json_object"},
-        stop=None,
-    )
-
-    usage = completion.usage
-    statistics_to_return = GenerationStatistics(input_time=usage.prompt_time, output_time=usage.completion_time, input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens, total_time=usage.total_time, model_name=model)
-
-    return statistics_to_return, completion.choices[0].message.content
-
-def generate_section(transcript: str, existing_notes: str, section: str, model: str = "llama3-8b-8192"):
-    stream = st.session_state.groq.chat.completions.create(
-        model=model,
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an expert writer. Generate a comprehensive note for the section provided based factually on the transcript provided. Do *not* repeat any content from previous sections."
-            },
-            {
-                "role": "user",
-                "content": f"### Transcript\n\n{transcript}\n\n### Existing Notes\n\n{existing_notes}\n\n### Instructions\n\nGenerate comprehensive notes for this section only based on the transcript: \n\n{section}"
-            }
-        ],
-        temperature=0.3,
-        max_tokens=8000,
-        top_p=1,
-        stream=True,
-        stop=None,
-    )
-
-    for chunk in stream:
-        tokens = chunk.choices[0].delta.content
-        if tokens:
-            yield tokens
-        if x_groq := chunk.x_groq:
-            if not x_groq.usage:
-                continue
-            usage = x_groq.usage
-            statistics_to_return = GenerationStatistics(input_time=usage.prompt_time, output_time=usage.completion_time, input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens, total_time=usage.total_time, model_name=model)
-            yield statistics_to_return
-
 # Initialize
 if 'button_disabled' not in st.session_state:
     st.session_state.button_disabled = False
@@ -309,53 +429,61 @@ try:
         outline_selected_model = st.selectbox("Outline generation:", outline_model_options)
         content_model_options = ["llama3-8b-8192", "llama3-70b-8192", "mixtral-8x7b-32768", "gemma-7b-it", "gemma2-9b-it"]
         content_selected_model = st.selectbox("Content generation:", content_model_options)
+        max_parallel_sections = st.slider("Parallel section requests:", min_value=1, max_value=12, value=DEFAULT_MAX_CONCURRENCY, help="How many sections are generated at the same time.")
+        live_summaries = st.checkbox("Provisional notes while transcribing", value=True, disabled="sections" in PROMPT_TEMPLATES[selected_template], help="Summarizes the transcript in windows as audio chunks finish, and reuses those summaries for long meetings. Templates with fixed sections never need them, so they are skipped.")
+        reroute_rate_limited = st.checkbox("Reroute sections when a model is rate limited", value=False, help="Sections and summaries may move to another content model while the selected one is saturated.")
+        compact_transcripts = st.checkbox("Compact the transcript before prompting", value=True, help="Removes filler words and repeated phrases from the text the models read. The raw transcript is still shown and archived.")
+        batch_sections = st.checkbox("Write short meetings in one request", value=True, help="When the transcript and outline fit the content model's context, all sections come from a single request instead of one per section. This sends the transcript once instead of once per section, at the cost of writing the sections one after another.")
+        passages_per_section = st.slider("Transcript passages per section:", min_value=2, max_value=20, value=DEFAULT_TOP_K, help="Each section only sees the transcript passages most relevant to it.")
 
         
         # Add note about rate limits
-        st.info("Important: Different models have different token and rate limits which may cause runtime errors.")
+        st.info("Important: Different models have different token and rate limits. Requests are queued and retried to stay within them, which can slow generation down.")
+
+        cache_stats = disk_cache.stats()
+        if cache_stats:
+            st.caption("Cache: " + ", ".join(f"{namespace} {counts['hits']} hits / {counts['misses']} misses" for namespace, counts in cache_stats.items()))
+
+        st.write(f"---")
+        st.write("# Background Jobs")
+        run_in_background = st.checkbox("Run as a background job", value=False, disabled=not GROQ_API_KEY, help="The job keeps running if the page is refreshed or closed. Requires GROQ_API_KEY in the environment.")
+        attached_job_id = st.text_input("Attach to job ID:", st.query_params.get("job", ""))
     
 
     if st.button('End Generation and Download Notes'):
-        if "notes" in st.session_state:
-
-            # Create markdown file
-            markdown_file = create_markdown_file(st.session_state.notes.get_markdown_content())
-            st.download_button(
-                label='Download Text',
-                data=markdown_file,
-                file_name='generated_notes.txt',
-                mime='text/plain'
-            )
-
-            # Create pdf file (styled)
-            pdf_file = create_pdf_file(st.session_state.notes.get_markdown_content())
-            st.download_button(
-                label='Download PDF',
-                data=pdf_file,
-                file_name='generated_notes.pdf',
-                mime='application/pdf'
-            )
-            st.session_state.button_disabled = False
-        else:
+        st.session_state.button_disabled = False
+        if "notes" not in st.session_state:
             raise ValueError("Please generate content first before downloading the notes.")
 
+    if "notes" in st.session_state and not st.session_state.button_disabled:
+        display_downloads(st.session_state.notes)
+
+    with st.expander("Search past meetings"):
+        archive_query = st.text_input("Search the transcripts and notes of earlier meetings:", "")
+        if archive_query.strip():
+            display_archive_hits(archive_query)
+
     audio_file = None
+    audio_handle = None
     youtube_link = None
     groq_input_key = None
 
     input_method = st.radio(
         "Choose input method:",
-        ["Upload audio file", "Record audio"]
+        ["Upload audio file", "Media URL", "Record audio", "Live session"]
     )
 
     if input_method == "Upload audio file":
-        audio_file = st.file_uploader("Upload an audio file", type=["mp3", "wav", "m4a"])
-        if audio_file:
-            audio_bytes = audio_file.read()
-            st.audio(audio_bytes)
-            audio_file.seek(0)
+        uploaded_file = st.file_uploader("Upload an audio file", type=["mp3", "wav", "m4a"])
+        if uploaded_file:
+            audio_handle = session_audio_handle(uploaded_file.file_id, uploaded_file, uploaded_file.name)
+            st.audio(audio_handle.path, format=audio_handle.mime_type)
+
+    elif input_method == "Media URL":
+        youtube_link = st.text_input("Enter a YouTube or other media link" + (" (file:// for local media)" if ALLOW_FILE_URLS else "") + ":", "").strip()
             
     elif input_method == "Record audio":
+        from audio_recorder_streamlit import audio_recorder
         st.write("Click below to record audio")
         audio_bytes = audio_recorder(
             pause_threshold=120.0,
@@ -363,9 +491,46 @@ try:
             neutral_color="#6aa36f"
         )
         if audio_bytes:
-            st.audio(audio_bytes)
-            audio_file = BytesIO(audio_bytes)
-            audio_file.name = "recording.wav"
+            audio_handle = session_audio_handle(hash_bytes(audio_bytes), audio_bytes, "recording.wav")
+            st.audio(audio_handle.path, format=audio_handle.mime_type)
+
+    elif input_method == "Live session":
+        if 'groq' not in st.session_state:
+            st.warning("Set GROQ_API_KEY in the environment to use live sessions.")
+            st.stop()
+
+        from streamlit_webrtc import webrtc_streamer, WebRtcMode
+        if 'live_audio' not in st.session_state:
+            st.session_state.live_audio = LiveAudioBuffer()
+        live_audio = st.session_state.live_audio
+
+        async def capture_audio(frames):
+            # Runs on the WebRTC thread for every frame, while the page transcribes and refreshes
+            live_audio.add_frames(frames)
+            return frames
+
+        st.write(f"Start the stream and leave it running for the whole meeting. The audio is transcribed in {LIVE_WINDOW_SECONDS:.0f} second windows while it is recorded, and the notes follow.")
+        live_stream = webrtc_streamer(
+            key="live_stream",
+            mode=WebRtcMode.SENDONLY,
+            media_stream_constraints={"audio": True, "video": False},
+            queued_audio_frames_callback=capture_audio,
+        )
+
+        template = PROMPT_TEMPLATES[selected_template]
+        start_new_session = st.button("Start new live session")
+        if 'live_session' not in st.session_state or start_new_session:
+            st.session_state.live_session = LiveSession(rate_limited_groq(), template.get("sections", LIVE_DEFAULT_SECTIONS), summary_model=str(content_selected_model))
+            live_audio.clear()
+        live_session = st.session_state.live_session
+        if st.button("Refresh all notes now"):
+            st.session_state.live_refresh_requested = True
+
+        display_live_session(live_session, live_audio, not live_stream.state.playing, str(content_selected_model), passages_per_section)
+
+        # Makes the live notes available to the download button
+        st.session_state.notes = live_session.notes
+        st.stop()
 
 
     with st.form("groqform"):
@@ -403,6 +568,8 @@ try:
                 else:
                     placeholder.empty()
 
+        print(f"{'Cold start' if cold_start else 'Rerun'} rendered in {(time.perf_counter() - script_started) * 1000:.0f} ms")
+
         if submitted:
             # Clear previous session data
             if 'notes' in st.session_state:
@@ -410,8 +577,12 @@ try:
             st.session_state.statistics_text = ""
             placeholder.empty()
 
-            if input_method == "Upload audio file" and audio_file is None:
+            if input_method == "Upload audio file" and audio_handle is None:
                 st.error("Please upload an audio file")
+            elif input_method == "Media URL" and not youtube_link:
+                st.error("Please enter a media URL")
+            elif input_method == "Media URL" and urlparse(youtube_link).scheme not in REMOTE_URL_SCHEMES + (("file",) if ALLOW_FILE_URLS else ()):
+                st.error("Please enter an http or https link")
             elif input_method == "Record audio" and 'audio_recorder' not in st.session_state:
                 st.error("Please record some audio first")
             else:
@@ -419,62 +590,132 @@ try:
             
             audio_file_path = None
 
+            if not memory_available():
+                enable()
+                st.error("The server is low on memory. Please try again in a few minutes.")
+                st.stop()
+
 
             if not GROQ_API_KEY:
-                st.session_state.groq = Groq(api_key=groq_input_key)
+                st.session_state.groq = get_groq_client(groq_input_key)
+            # The outline model is left out so outline requests are never rerouted
+            fallback_models = [model for model in content_model_options if model != outline_selected_model] if reroute_rate_limited else ()
+            client = rate_limited_groq(fallback_models)
+
+            # Jobs are created from audio files; media URLs are streamed in the page
+            if run_in_background and audio_handle is not None:
+                with audio_handle.open() as audio_file:
+                    job_id = get_job_store().create_job(audio_file, selected_template, str(outline_selected_model), str(content_selected_model), compact=compact_transcripts)
+                start_job_workers()
+                # Shown by the rerun through the job ID, outside this form
+                st.query_params["job"] = job_id
+                enable()
+                st.rerun()
+
+            total_generation_statistics = GenerationStatistics(model_name=str(content_selected_model))
+            trace = Trace(template=selected_template, outline_model=str(outline_selected_model), content_model=str(content_selected_model))
+            meeting_span = trace.span("meeting").start()
 
             display_status("Transcribing audio in background....")
-            transcription_text = transcribe_audio(audio_file)
+            # Window summaries start on the first chunks while later audio is still being transcribed.
+            # They only feed map-reduce, which templates with fixed sections never run
+            summarize_windows = live_summaries and "sections" not in PROMPT_TEMPLATES[selected_template]
+            streaming_transcript = StreamingTranscript(client, summary_model=str(content_selected_model), max_workers=max_parallel_sections) if summarize_windows else None
+            provisional_placeholder = st.empty()
+            transcript_chunks = []
+            transcript_segments = []
+            if input_method == "Media URL":
+                transcript_source = iter_url_transcript(client, youtube_link, cache=disk_cache, display_status=display_status, trace=trace, segments=transcript_segments)
+            else:
+                # Opened only now and closed once transcribed, so no rerun leaves a descriptor behind
+                audio_file = audio_handle.open()
+                transcript_source = iter_transcript(client, audio_file, cache=disk_cache, display_status=display_status, trace=trace, segments=transcript_segments, fingerprints=get_fingerprint_index())
+            try:
+                for chunk_text in transcript_source:
+                    transcript_chunks.append(chunk_text)
+                    if streaming_transcript is not None:
+                        streaming_transcript.add_chunk(chunk_text)
+                        ready_summaries = streaming_transcript.ready_summaries()
+                        if ready_summaries:
+                            provisional_placeholder.markdown("## Provisional notes\n\n" + "\n\n".join(ready_summaries))
+            except BaseException:
+                # Queued window summaries would otherwise keep running, and being billed, behind the error
+                if streaming_transcript is not None:
+                    streaming_transcript.cancel()
+                raise
+            finally:
+                if audio_file is not None:
+                    audio_file.close()
+
+            transcription_text = merge_transcripts(transcript_chunks)
+            prompt_transcript = transcription_text
+            if compact_transcripts:
+                prompt_transcript, compaction_report = compact_for_prompts(transcription_text, trace)
+                st.caption(str(compaction_report))
+
+            partial_summaries = None
+            if streaming_transcript is not None:
+                # Waited for only when map-reduce will read them; otherwise they would hold up the sections
+                wait_for_summaries = needs_map_reduce(prompt_transcript, selected_template, str(outline_selected_model))
+                if wait_for_summaries:
+                    display_status("Reconciling transcript summaries....")
+                with trace.span("window_summaries", model=str(content_selected_model), waited=wait_for_summaries) as span:
+                    window_statistics, _, partial_summaries = streaming_transcript.finish(wait=wait_for_summaries)
+                    span.add_statistics(window_statistics)
+                total_generation_statistics.add(window_statistics)
 
             display_statistics()
-            
-
-            display_status("Generating notes structure....")
-            large_model_generation_statistics, notes_structure = generate_notes_structure(transcription_text, model=str(outline_selected_model))
-            print("Structure: ",notes_structure)
-
-            display_status("Generating notes ...")
-            total_generation_statistics = GenerationStatistics(model_name=str(content_selected_model))
+            record_memory("transcription")
+
+            provisional_placeholder.empty()
+
+            notes = NoteSection(structure={}, transcript=transcription_text)
+            st.session_state.notes = notes
+
+            def stream_section_content():
+                # Sections appear as their outline entries are parsed and start generating right away
+                note_events = stream_notes(client, notes, prompt_transcript, selected_template, outline_model=str(outline_selected_model), content_model=str(content_selected_model), max_concurrency=max_parallel_sections, top_k=passages_per_section, cache=disk_cache, display_status=display_status, partial_summaries=partial_summaries, trace=trace, batch_sections=batch_sections)
+                for title, chunk in note_events:
+                    # Check if GenerationStatistics data is returned instead of str tokens
+                    if type(chunk) == GenerationStatistics:
+                        total_generation_statistics.add(chunk)
+
+                        st.session_state.statistics_text = str(total_generation_statistics)
+                        display_statistics()
+                    elif chunk is SECTION_DONE:
+                        notes.complete_section(title)
+                    elif chunk is SECTION_RESET:
+                        notes.reset_section(title)
+                    elif chunk is not None:
+                        clear_status()
+                        notes.update_content(title, chunk)
+
+                notes.flush()
+                print(f"Rendered {notes.render_count} section updates ({notes.renders_per_second():.1f}/s)")
+                trace.record("ui_render", notes.render_seconds, renders=notes.render_count)
+
+            stream_section_content()
             clear_status()
-
-
-            try:
-                notes_structure_json = json.loads(notes_structure)
-                notes = NoteSection(structure=notes_structure_json,transcript=transcription_text)
-                
-                if 'notes' not in st.session_state:
-                    st.session_state.notes = notes
-
-                st.session_state.notes.display_structure()
-
-                def stream_section_content(sections):
-                    for title, content in sections.items():
-                        if isinstance(content, str):
-                            content_stream = generate_section(transcript=transcription_text, existing_notes=notes.return_existing_contents(), section=(title + ": " + content),model=str(content_selected_model))
-                            for chunk in content_stream:
-                                # Check if GenerationStatistics data is returned instead of str tokens
-                                chunk_data = chunk
-                                if type(chunk_data) == GenerationStatistics:
-                                    total_generation_statistics.add(chunk_data)
-                                    
-                                    st.session_state.statistics_text = str(total_generation_statistics)
-                                    display_statistics()
-                                elif chunk is not None:
-                                    st.session_state.notes.update_content(title, chunk)
-                        elif isinstance(content, dict):
-                            stream_section_content(content)
-
-                stream_section_content(notes_structure_json)
-            except json.JSONDecodeError:
+            if not notes.contents:
                 st.error("Failed to decode the notes structure. Please try again.")
-
+            else:
+                # Rendered in the background, so the downloads are ready when they are asked for
+                get_export_cache().submit(notes.get_markdown_content(), trace)
+                meeting_source = youtube_link if input_method == "Media URL" else audio_handle.source_id
+                get_archive().add_meeting(youtube_link or audio_handle.name, transcription_text, list(notes.contents.items()), segments=transcript_segments, template=selected_template, source=meeting_source)
+
+            meeting_span.set(cost=trace.total_cost(), sections=len(notes.contents))
+            meeting_span.end()
+            record_memory("generation")
             enable()
 
+    if not submitted and attached_job_id:
+        display_job(attached_job_id.strip())
+
 except Exception as e:
     st.session_state.button_disabled = False
 
     if hasattr(e, 'status_code') and e.status_code == 413:
-        # In the future, this limitation will be fixed as ScribeWizard will automatically split the audio file and transcribe each part.
         st.error(FILE_TOO_LARGE_MESSAGE)
     else:
         st.error(e)
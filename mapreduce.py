@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_statistics import GenerationStatistics
+from retrieval import split_passages
+from tokens import CHARS_PER_TOKEN, context_window, estimate_tokens, fits_in_context
+
+DIRECT = "direct"
+MAP_REDUCE = "map_reduce"
+
+OUTLINE_MAX_TOKENS = 1800  # The outline request's max_tokens: room for the JSON outline itself
+OUTLINE_RESERVED_TOKENS = OUTLINE_MAX_TOKENS + 200  # ... plus the outline instructions
+WINDOW_TOKENS = 2500
+SUMMARY_MAX_TOKENS = 400
+MAX_REDUCE_LEVELS = 3
+WORDS_PER_TOKEN = 0.75
+
+
+def choose_generation_mode(transcript: str, model: str, reserved_tokens: int = OUTLINE_RESERVED_TOKENS) -> str:
+    """
+    Picks DIRECT when the whole transcript fits the outline model's context, MAP_REDUCE otherwise.
+    """
+    return DIRECT if fits_in_context(transcript, model, reserved_tokens) else MAP_REDUCE
+
+
+def split_windows(text: str, window_tokens: int = WINDOW_TOKENS):
+    """
+    Splits text into consecutive windows of roughly window_tokens tokens each.
+    """
+    return split_passages(text, passage_words=int(window_tokens * WORDS_PER_TOKEN), overlap_words=0)
+
+
+def summarize_window(client, window: str, index: int, total=None, model: str = "llama3-8b-8192"):
+    """
+    Summarizes one transcript window. Returns (GenerationStatistics, summary).
+
+    total may be None when windows are summarized while the transcript is still arriving.
+    """
+    part = f"Part {index + 1} of {total}" if total else f"Part {index + 1}"
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert meeting note taker. Summarize the transcript excerpt factually and concisely, keeping every decision, figure, name, date and action item."
+            },
+            {
+                "role": "user",
+                "content": f"### Transcript {part}\n\n{window}\n\n### Instructions\n\nSummarize this part of the transcript as dense bullet points."
+            }
+        ],
+        temperature=0.2,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        top_p=1,
+        stream=False,
+        stop=None,
+    )
+    return GenerationStatistics.from_usage(completion.usage, model), completion.choices[0].message.content
+
+
+def summarize_windows(client, windows, model: str = "llama3-8b-8192", max_workers: int = 4):
+    """
+    Summarizes all windows concurrently. Returns (GenerationStatistics, summaries) with summaries in window order.
+    """
+    statistics = GenerationStatistics(model_name=model)
+    if not windows:
+        return statistics, []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda item: summarize_window(client, item[1], item[0], len(windows), model), enumerate(windows)))
+    for window_statistics, _ in results:
+        statistics.add(window_statistics)
+    return statistics, [summary for _, summary in results]
+
+
+def join_summaries(summaries) -> str:
+    return "\n\n".join(f"### Part {index + 1}\n{summary}" for index, summary in enumerate(summaries))
+
+
+def map_reduce_transcript(client, transcript: str, outline_model: str, summary_model: str = "llama3-8b-8192", max_workers: int = 4, reserved_tokens: int = OUTLINE_RESERVED_TOKENS, partial_summaries=None):
+    """
+    Condenses a transcript that is too long for the outline model.
+
+    Windows are summarized in parallel (map). If the joined summaries still do not fit, they are
+    summarized again, up to MAX_REDUCE_LEVELS times. Returns (GenerationStatistics, partial_summaries,
+    condensed_text), where partial_summaries are the first-level summaries used to feed sections and
+    condensed_text is what the outline model receives. Pass partial_summaries when the windows were
+    already summarized, for example while the audio was still being transcribed.
+    """
+    if partial_summaries is None:
+        statistics, partial_summaries = summarize_windows(client, split_windows(transcript), summary_model, max_workers)
+    else:
+        statistics = GenerationStatistics(model_name=summary_model)
+    condensed = join_summaries(partial_summaries)
+    for _ in range(MAX_REDUCE_LEVELS - 1):
+        if fits_in_context(condensed, outline_model, reserved_tokens):
+            break
+        level_statistics, summaries = summarize_windows(client, split_windows(condensed), summary_model, max_workers)
+        statistics.add(level_statistics)
+        condensed = join_summaries(summaries)
+
+    if not fits_in_context(condensed, outline_model, reserved_tokens):
+        # Last resort: keep the outline request valid rather than letting the API reject it
+        print(f"Condensed transcript still too long ({estimate_tokens(condensed)} tokens), truncating")
+        budget = max(0, context_window(outline_model) - reserved_tokens)
+        condensed = condensed[:budget * CHARS_PER_TOKEN]
+    return statistics, partial_summaries, condensed
@@ -0,0 +1,102 @@
+from tokens import estimate_tokens
+
+
+class Notes:
+    """
+    UI-independent container for generated notes: section contents plus the running context
+    of finished sections that later section prompts are given.
+    """
+    def __init__(self, structure):
+        self.structure = structure
+        self.contents = {title: "" for title in self.flatten_structure(structure)}
+
+        # Append-only context of finished sections, so prompts never rebuild it from the structure
+        self.levels = self.section_levels(structure)
+        self.context_parts = []  # (title, markdown, estimated tokens) in completion order
+        self.context_text = ""
+
+    def flatten_structure(self, structure):
+        sections = []
+        for title, content in structure.items():
+            sections.append(title)
+            if isinstance(content, dict):
+                sections.extend(self.flatten_structure(content))
+        return sections
+
+    def section_levels(self, structure, level=1):
+        levels = {}
+        for title, content in structure.items():
+            levels[title] = level
+            if isinstance(content, dict):
+                levels.update(self.section_levels(content, level + 1))
+        return levels
+
+    def add_section(self, path, title, description=None):
+        """
+        Adds a section under the parent titles in path, as it arrives from a streamed outline.
+        A description of None adds a group that will hold subsections.
+        """
+        parent = self.structure
+        for parent_title in path:
+            parent = parent.setdefault(parent_title, {})
+        parent[title] = description if description is not None else {}
+        self.contents.setdefault(title, "")
+        self.levels[title] = len(path) + 1
+
+    def update_content(self, title, new_content):
+        try:
+            self.contents[title] += new_content
+        except TypeError as e:
+            pass
+
+    def reset_section(self, title):
+        """
+        Discards a section's content so far, before it is generated again.
+        """
+        self.contents[title] = ""
+
+    def complete_section(self, title):
+        """
+        Marks a section as finished and appends it to the notes context.
+        """
+        if self.contents[title].strip():
+            part = f"{'#' * self.levels.get(title, 1)} {title}\n{self.contents[title]}.\n\n"
+            self.context_parts.append((title, part, estimate_tokens(part)))
+            self.context_text += part
+
+    def return_existing_contents(self, token_budget=None) -> str:
+        """
+        Returns the notes of finished sections for use as prompt context.
+
+        With a token_budget only the most recent sections that fit are kept in full; older
+        ones are reduced to their titles.
+        """
+        if token_budget is None:
+            return self.context_text
+
+        kept = []
+        used = 0
+        parts = list(self.context_parts)  # Snapshot, other threads may append meanwhile
+        for index in range(len(parts) - 1, -1, -1):
+            if used + parts[index][2] > token_budget:
+                earlier_titles = ", ".join(title for title, _, _ in parts[:index + 1])
+                kept.append(f"Earlier sections already covered: {earlier_titles}.\n\n")
+                break
+            kept.append(parts[index][1])
+            used += parts[index][2]
+        return "".join(reversed(kept))
+
+    def get_markdown_content(self, structure=None, level=1):
+        """
+        Returns the markdown styled pure string with the contents.
+        """
+        if structure is None:
+            structure = self.structure
+
+        markdown_content = ""
+        for title, content in structure.items():
+            if self.contents[title].strip():  # Only include title if there is content
+                markdown_content += f"{'#' * level} {title}\n{self.contents[title]}.\n\n"
+            if isinstance(content, dict):
+                markdown_content += self.get_markdown_content(content, level + 1)
+        return markdown_content
@@ -0,0 +1,243 @@
+import json
+
+WHITESPACE = " \t\r\n"
+
+
+def iter_outline_entries(structure, path=()):
+    """
+    Yields (path, title, description) for a complete outline, in the same shape the parser emits.
+    """
+    for title, content in structure.items():
+        if isinstance(content, dict):
+            yield path, title, None
+            yield from iter_outline_entries(content, path + (title,))
+        else:
+            yield path, title, str(content)
+
+
+class IncrementalOutlineParser:
+    """
+    Incremental parser for the notes outline JSON, fed with streamed tokens.
+
+    feed() returns the outline entries completed by the new text as (path, title, description)
+    tuples, where path is the tuple of parent titles. Nested objects are reported as soon as they
+    open, with description None, so their children can be placed under them. A truncated or
+    malformed tail never discards entries that were already complete; parsing simply stops there.
+    """
+    def __init__(self):
+        self.structure = {}
+        self.stack = []  # Open containers: {"type", "path", "target", "key", "expect"}
+        self.started = False
+        self.finished = False
+        self.failed = False
+        self.in_string = False
+        self.escaped = False
+        self.string_chars = []
+        self.literal_chars = []
+
+    def feed(self, text):
+        entries = []
+        for char in text:
+            if self.finished or self.failed:
+                break
+            self._feed_char(char, entries)
+        return entries
+
+    def close(self):
+        """
+        Ends the stream. Returns the outline parsed so far, keeping every complete entry.
+        """
+        self.finished = True
+        return self.structure
+
+    @property
+    def complete(self):
+        """
+        Whether the whole outline object was read, rather than a truncated or malformed start of it.
+        """
+        return self.started and not self.stack and not self.failed
+
+    def _feed_char(self, char, entries):
+        if not self.started:
+            # Skip anything the model writes before the object, such as a code fence
+            if char == "{":
+                self.started = True
+                self.stack.append({"type": "object", "path": (), "target": self.structure, "key": None, "expect": "key"})
+            return
+
+        if self.in_string:
+            if self.escaped:
+                self.escaped = False
+            elif char == "\\":
+                self.escaped = True
+            elif char == '"':
+                self.in_string = False
+                self._complete_string(entries)
+                return
+            self.string_chars.append(char)
+            return
+
+        frame = self.stack[-1]
+        if self.literal_chars:
+            if char not in ",}]" and char not in WHITESPACE:
+                self.literal_chars.append(char)
+                return
+            self._complete_value(self._literal_value(), entries)
+
+        if char in WHITESPACE:
+            return
+        if char == '"':
+            self.in_string = True
+            self.string_chars = []
+        elif char == ":" and frame["expect"] == "colon":
+            frame["expect"] = "value"
+        elif char == ",":
+            frame["expect"] = "key" if frame["type"] == "object" else "value"
+        elif char == "{" and frame["expect"] == "value":
+            self._open_object(frame, entries)
+        elif char == "[" and frame["expect"] == "value":
+            self.stack.append({"type": "array", "path": frame["path"], "target": [], "key": None, "expect": "value"})
+        elif char in "}]":
+            self._close_container(entries)
+        elif frame["expect"] == "value":
+            self.literal_chars = [char]
+        else:
+            self.failed = True  # Malformed; keep what we have
+
+    def _complete_string(self, entries):
+        try:
+            value = json.loads('"' + "".join(self.string_chars) + '"')
+        except json.JSONDecodeError:
+            value = "".join(self.string_chars)
+        frame = self.stack[-1]
+        if frame["type"] == "object" and frame["expect"] == "key":
+            frame["key"] = value
+            frame["expect"] = "colon"
+        else:
+            self._complete_value(value, entries)
+
+    def _literal_value(self):
+        value = "".join(self.literal_chars)
+        self.literal_chars = []
+        return value
+
+    def _complete_value(self, value, entries):
+        frame = self.stack[-1]
+        if frame["type"] == "array":
+            frame["target"].append(str(value))
+        elif frame["key"] is not None:
+            frame["target"][frame["key"]] = str(value)
+            if not frame.get("detached"):
+                entries.append((frame["path"], frame["key"], str(value)))
+            frame["key"] = None
+        frame["expect"] = "comma"
+
+    def _open_object(self, frame, entries):
+        if frame["type"] == "array" or frame.get("detached"):
+            # Objects inside arrays do not map onto sections; parse and drop them
+            child = {"type": "object", "path": frame["path"], "target": {}, "key": None, "expect": "key", "detached": True}
+        else:
+            target = {}
+            frame["target"][frame["key"]] = target
+            entries.append((frame["path"], frame["key"], None))
+            child = {"type": "object", "path": frame["path"] + (frame["key"],), "target": target, "key": None, "expect": "key"}
+            frame["key"] = None
+        frame["expect"] = "comma"
+        self.stack.append(child)
+
+    def _close_container(self, entries):
+        closed = self.stack.pop()
+        if not self.stack:
+            self.finished = True
+        elif closed["type"] == "array":
+            # A list of strings becomes one bulleted description
+            self._complete_value("\n".join(f"- {item}" for item in closed["target"]), entries)
+
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class IncrementalSectionParser:
+    """
+    Demultiplexes a streamed JSON object of {key: "string"} pairs, such as the batched sections
+    response, without waiting for each string to finish.
+
+    feed() returns (key, text) pairs with the value text decoded from the new tokens, and
+    (key, None) once a value's string is closed. Parsing stops at anything other than a flat
+    object of strings, keeping everything already returned.
+    """
+    def __init__(self):
+        self.expect = "start"  # start, key, colon, value, comma
+        self.finished = False
+        self.in_string = False
+        self.escape = None  # Escape sequence read so far, including the backslash
+        self.key = None
+        self.key_chars = []
+
+    def feed(self, text):
+        events = []
+        value_chars = []
+        for char in text:
+            if self.finished:
+                break
+            if self.in_string:
+                if self.escape is not None:
+                    self.escape += char
+                    char = self._decode_escape()
+                    if char is None:
+                        continue
+                    self.escape = None
+                elif char == "\\":
+                    self.escape = char
+                    continue
+                elif char == '"':
+                    self.in_string = False
+                    self._close_string(events, value_chars)
+                    value_chars = []
+                    continue
+                (self.key_chars if self.expect == "key" else value_chars).append(char)
+                continue
+
+            if char in WHITESPACE:
+                continue
+            if self.expect == "start":
+                # Skip anything the model writes before the object, such as a code fence
+                if char == "{":
+                    self.expect = "key"
+            elif char == '"' and self.expect in ("key", "value"):
+                self.in_string = True
+                self.key_chars = []
+            elif char == ":" and self.expect == "colon":
+                self.expect = "value"
+            elif char == "," and self.expect == "comma":
+                self.expect = "key"
+            else:
+                self.finished = True  # The closing brace, or something malformed
+        if value_chars:
+            events.append((self.key, "".join(value_chars)))
+        return events
+
+    def _close_string(self, events, value_chars):
+        if self.expect == "key":
+            self.key = "".join(self.key_chars)
+            self.expect = "colon"
+            return
+        if value_chars:
+            events.append((self.key, "".join(value_chars)))
+        events.append((self.key, None))
+        self.expect = "comma"
+
+    def _decode_escape(self):
+        """
+        The decoded text once self.escape is a complete escape sequence, otherwise None.
+        """
+        if self.escape[1] != "u":
+            return ESCAPES.get(self.escape[1], self.escape[1])
+        if len(self.escape) < 6:
+            return None
+        try:
+            if 0xD800 <= int(self.escape[2:6], 16) < 0xDC00 and len(self.escape) < 12:
+                return None  # A high surrogate, wait for the low one that follows it
+            return json.loads('"' + self.escape + '"')
+        except ValueError:
+            return self.escape
@@ -0,0 +1,489 @@
+"""
+UI-independent note generation pipeline, shared by the Streamlit app and the batch CLI.
+"""
+import shutil
+import tempfile
+from io import BytesIO
+
+from cache import hash_file, make_key
+from compaction import compact_transcript
+from download import iter_download_segments, resolve_source, ALLOW_FILE_URLS
+from fingerprint import fingerprint_audio, reuse_plan
+from generation_statistics import GenerationStatistics
+from outline_parser import IncrementalOutlineParser, IncrementalSectionParser, iter_outline_entries
+from mapreduce import choose_generation_mode, map_reduce_transcript, MAP_REDUCE, OUTLINE_MAX_TOKENS, OUTLINE_RESERVED_TOKENS
+from prompt_templates import PROMPT_TEMPLATES
+from retrieval import BM25Index, DEFAULT_TOP_K
+from section_scheduler import SectionScheduler, DEFAULT_MAX_CONCURRENCY, SECTION_DONE, SECTION_RESET
+from tokens import estimate_tokens, fits_in_context
+from tracing import traced_stream, METRICS, NULL_TRACE
+from transcription import iter_file_transcripts, iter_planned_transcripts, iter_transcript_chunks, local_audio_path, merge_segments, merge_transcripts, save_audio_file, WHISPER_MODEL
+
+DEFAULT_OUTLINE_MODEL = "llama3-70b-8192"
+DEFAULT_CONTENT_MODEL = "llama3-8b-8192"
+EXISTING_NOTES_TOKEN_BUDGET = 1500  # Prior notes sent with each section prompt
+SECTION_SYSTEM_PROMPT = "You are an expert writer. Generate a comprehensive note for the section provided based factually on the transcript provided. Do *not* repeat any content from previous sections."
+BATCHED_SECTIONS_SYSTEM_PROMPT = "You are an expert writer. Generate comprehensive notes for each of the sections listed based factually on the transcript provided. Do *not* repeat content between sections. Always return valid JSON with string values only."
+BATCHED_SECTIONS_INSTRUCTION = "Write the notes for every section listed above"
+BATCHED_SECTION_TOKENS = 400  # Output reserved per section when all sections share one response
+BATCHED_MAX_OUTPUT_TOKENS = 8000
+
+
+def create_pdf_file(content: str):
+    """
+    Create a PDF file from the provided content.
+    """
+    from md2pdf.core import md2pdf  # WeasyPrint takes seconds to import, so only load it for PDFs
+
+    pdf_buffer = BytesIO()
+    md2pdf(pdf_buffer, md_content=content)
+    pdf_buffer.seek(0)
+    return pdf_buffer
+
+
+def transcribe_audio(client, audio_file, cache=None, display_status=lambda text: None, trace=NULL_TRACE, segments=None, fingerprints=None):
+    """
+    Transcribes audio using Groq's Whisper API, splitting long recordings into parallel chunks.
+    """
+    return merge_transcripts(iter_transcript(client, audio_file, cache, display_status, trace, segments, fingerprints))
+
+
+def match_fingerprint(audio_file, fingerprints, trace=NULL_TRACE):
+    """
+    Fingerprints audio_file and looks it up in the FingerprintIndex. Returns (fingerprint, reuse
+    plan or None); the fingerprint is None when the audio cannot be decoded.
+    """
+    with trace.span("fingerprint") as span:
+        try:
+            with tempfile.TemporaryDirectory(prefix="openref_") as workdir:
+                fingerprint = fingerprint_audio(local_audio_path(audio_file) or save_audio_file(audio_file, workdir))
+        except RuntimeError as e:
+            print(f"[warning]: {e}")
+            return None, None
+        alignments = fingerprints.match(fingerprint)
+        plan = reuse_plan(fingerprint, alignments, {alignment.recording_id: fingerprints.get_recording(alignment.recording_id) for alignment in alignments})
+        reused_seconds = sum(piece["end"] - piece["start"] for piece in plan or [] if piece["text"] is not None)
+        span.set(audio_seconds=fingerprint.duration, hashes=len(fingerprint.hashes), reused_seconds=reused_seconds)
+    METRICS.increment("openref_fingerprint_reused_seconds_total", reused_seconds)
+    return fingerprint, plan
+
+
+def iter_transcript(client, audio_file, cache=None, display_status=lambda text: None, trace=NULL_TRACE, segments=None, fingerprints=None):
+    """
+    Yields transcript chunks in order as they are transcribed. Join them with TranscriptMerger.
+
+    Once the last chunk is read, segments (if given) holds Whisper's timed segments in order.
+
+    With a FingerprintIndex, audio that is new to the cache is looked up by its sound, so a
+    re-encoded or trimmed copy of an earlier recording only transcribes what is new in it, and
+    the result is indexed for the next copy.
+    """
+    # Keyed on the audio content only, so switching templates or models reuses the transcript
+    cache_key = make_key(hash_file(audio_file), WHISPER_MODEL, "en")
+    cached = cache.get("transcript", cache_key) if cache else None
+    if cached is not None:
+        trace.record("transcription", 0.0, model=WHISPER_MODEL, cached=True)
+        if segments is not None:
+            segments.extend(cached.get("segments", []))  # Older entries were cached without them
+        yield cached["text"]
+        return
+
+    chunks = []
+    chunk_segments = []  # Always collected, so the cached transcript can be archived later
+    fingerprint = plan = None
+    if fingerprints is not None and shutil.which("ffmpeg") is not None:
+        display_status("Checking whether this recording was transcribed before....")
+        fingerprint, plan = match_fingerprint(audio_file, fingerprints, trace)
+    if plan is not None:
+        transcribed = [piece for piece in plan if piece["text"] is None]
+        display_status(f"Reusing the transcript of an earlier copy, transcribing {sum(piece['end'] - piece['start'] for piece in transcribed):.0f}s of new audio....")
+        transcript_chunks = iter_planned_transcripts(client, audio_file, plan, trace=trace, segments=chunk_segments)
+    else:
+        transcript_chunks = iter_transcript_chunks(client, audio_file, display_status=display_status, trace=trace, segments=chunk_segments)
+    for chunk in traced_stream(trace.span("transcription", model=WHISPER_MODEL), transcript_chunks, first_item="first_chunk"):
+        chunks.append(chunk)
+        yield chunk
+    chunk_segments = merge_segments(chunk_segments)
+    if segments is not None:
+        segments.extend(chunk_segments)
+    transcript = merge_transcripts(chunks)
+    if cache:
+        cache.set("transcript", cache_key, {"text": transcript, "segments": chunk_segments})
+    if fingerprint is not None and (plan is None or transcribed):
+        # Exact copies add nothing the index does not already hold
+        fingerprints.add(fingerprint, getattr(audio_file, "name", None) or "audio", transcript, chunk_segments)
+
+
+def iter_url_transcript(client, url, cache=None, display_status=lambda text: None, trace=NULL_TRACE, segments=None, allow_files=ALLOW_FILE_URLS):
+    """
+    Yields transcript chunks for media at url in order, transcribing segments while the rest
+    of the media is still downloading. segments is filled as in iter_transcript. file:// URLs
+    are only read with allow_files (see download.resolve_source).
+    """
+    display_status("Fetching media information....")
+    source = resolve_source(url, allow_files=allow_files)
+    # Keyed on the source ID rather than the audio, so a repeated URL needs no download at all
+    cache_key = make_key(source.key, WHISPER_MODEL, "en")
+    cached = cache.get("transcript", cache_key) if cache else None
+    if cached is not None:
+        trace.record("transcription", 0.0, model=WHISPER_MODEL, cached=True, source=source.title)
+        if segments is not None:
+            segments.extend(cached.get("segments", []))
+        yield cached["text"]
+        return
+
+    chunks = []
+    chunk_segments = []
+    audio_paths = iter_download_segments(source, display_status=display_status)
+    for chunk in traced_stream(trace.span("transcription", model=WHISPER_MODEL, source=source.title), iter_file_transcripts(client, audio_paths, trace=trace, segments=chunk_segments), first_item="first_chunk"):
+        chunks.append(chunk)
+        yield chunk
+    chunk_segments = merge_segments(chunk_segments)
+    if segments is not None:
+        segments.extend(chunk_segments)
+    if cache:
+        cache.set("transcript", cache_key, {"text": merge_transcripts(chunks), "segments": chunk_segments})
+
+
+def compact_for_prompts(transcript: str, trace=NULL_TRACE, **options):
+    """
+    Compacts the transcript that the prompts are built from (see compaction.compact_transcript)
+    and records the token reduction. Returns (compacted transcript, CompactionReport).
+    """
+    with trace.span("compaction") as span:
+        compacted, report = compact_transcript(transcript, **options)
+        span.set(**report.to_dict())
+    METRICS.increment("openref_compaction_saved_tokens_total", report.saved_tokens)
+    return compacted, report
+
+
+def generate_notes_structure(client, transcript: str, template_name: str, model: str = DEFAULT_OUTLINE_MODEL, cache=None):
+    """
+    Streams the notes outline JSON. Yields str tokens and, at the end, GenerationStatistics.
+    """
+    template = PROMPT_TEMPLATES[template_name]
+    messages = [
+        {
+            "role": "system",
+            "content": template["system"] + " Always return valid JSON with string values only, no placeholders."
+        },
+        {
+            "role": "user",
+            "content": f"### Transcript {transcript}\n\n### Example\n\n{template['shot_example']}### Instructions\n\nCreate a structure for comprehensive notes on the above transcribed audio. Use only text content, no placeholders."
+        }
+    ]
+    cache_key = make_key(model, template_name, messages)
+    cached = cache.get("outline", cache_key) if cache else None
+    if cached is not None:
+        yield cached["structure"]
+        return
+
+    # JSON mode cannot be combined with streaming, so validity relies on the prompt and on the
+    # incremental parser, which skips any preamble and keeps the sections it managed to parse
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.2,  # Lower temperature for more consistent JSON
+        max_tokens=OUTLINE_MAX_TOKENS,  # Reserved when deciding whether the transcript fits the model
+        top_p=1,
+        stream=True,
+        stop=None,
+    )
+
+    generated = []
+    parser = IncrementalOutlineParser()  # Validates the outline before it is cached
+    finish_reason = None
+    for chunk in stream:
+        tokens = chunk.choices[0].delta.content
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        if tokens:
+            generated.append(tokens)
+            parser.feed(tokens)
+            yield tokens
+        if x_groq := chunk.x_groq:
+            if not x_groq.usage:
+                continue
+            yield GenerationStatistics.from_usage(x_groq.usage, model)
+
+    # A truncated or malformed outline is not cached, so that trying again makes a new request
+    if cache and finish_reason == "stop" and parser.close() and parser.complete:
+        cache.set("outline", cache_key, {"structure": "".join(generated)})
+
+
+def generate_section(client, transcript: str, existing_notes: str, section: str, model: str = DEFAULT_CONTENT_MODEL, cache=None):
+    # Existing notes are left out of the key: with concurrent sections they depend on timing,
+    # which would make identical reruns miss the cache
+    cache_key = make_key(model, SECTION_SYSTEM_PROMPT, transcript, section)
+    cached = cache.get("section", cache_key) if cache else None
+    if cached is not None:
+        yield cached["text"]
+        return
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": SECTION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": f"### Transcript Excerpts\n\n{transcript}\n\n### Existing Notes\n\n{existing_notes}\n\n### Instructions\n\nGenerate comprehensive notes for this section only based on the transcript: \n\n{section}"
+            }
+        ],
+        temperature=0.3,
+        max_tokens=8000,
+        top_p=1,
+        stream=True,
+        stop=None,
+    )
+
+    generated = []
+    for chunk in stream:
+        tokens = chunk.choices[0].delta.content
+        if tokens:
+            generated.append(tokens)
+            yield tokens
+        if x_groq := chunk.x_groq:
+            if not x_groq.usage:
+                continue
+            usage = x_groq.usage
+            statistics_to_return = GenerationStatistics(input_time=usage.prompt_time, output_time=usage.completion_time, input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens, total_time=usage.total_time, model_name=model)
+            yield statistics_to_return
+
+    if cache:
+        cache.set("section", cache_key, {"text": "".join(generated)})
+
+
+def batched_sections_prompt(transcript: str, sections) -> str:
+    numbered_sections = "\n".join(f"{index + 1}. {title}: {description}" for index, (title, description) in enumerate(sections))
+    return f"### Transcript\n\n{transcript}\n\n### Sections\n\n{numbered_sections}\n\n### Instructions\n\n{BATCHED_SECTIONS_INSTRUCTION}, based on the transcript. Return a JSON object with one key per section number (\"1\", \"2\", ...) in the listed order, whose value is that section's notes as a markdown string."
+
+
+def batched_output_tokens(sections) -> int:
+    """
+    The output budget of one request writing all sections, both reserved and requested.
+    """
+    return BATCHED_SECTION_TOKENS * max(1, len(sections))
+
+
+def fits_batched_sections(transcript: str, sections, model: str = DEFAULT_CONTENT_MODEL) -> bool:
+    """
+    Whether one request can write all (title, description) sections: the transcript, the
+    section list and room for every section's notes fit the model's context.
+    """
+    output_tokens = batched_output_tokens(sections)
+    instructions = BATCHED_SECTIONS_SYSTEM_PROMPT + batched_sections_prompt("", sections)
+    return output_tokens <= BATCHED_MAX_OUTPUT_TOKENS and fits_in_context(transcript, model, estimate_tokens(instructions) + output_tokens)
+
+
+def generate_sections_batched(client, transcript: str, sections, model: str = DEFAULT_CONTENT_MODEL, cache=None):
+    """
+    Streams the notes for all (title, description) sections from a single request, which sends
+    the transcript and instructions once instead of once per section. The model answers with a
+    JSON object keyed by section number that is demultiplexed while it streams.
+
+    Yields (title, item) pairs: each section's notes as they are decoded, SECTION_DONE once its
+    JSON string is closed, and at the end (None, GenerationStatistics). Sections the response
+    leaves out, leaves empty or is cut off in get no SECTION_DONE, so they can be generated on
+    their own.
+    """
+    messages = [
+        {
+            "role": "system",
+            "content": BATCHED_SECTIONS_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": batched_sections_prompt(transcript, sections)
+        }
+    ]
+    cache_key = make_key(model, messages)
+    cached = cache.get("sections", cache_key) if cache else None
+    if cached is not None:
+        for title, text in cached["sections"].items():
+            yield title, text
+            yield title, SECTION_DONE
+        return
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.3,
+        max_tokens=batched_output_tokens(sections),  # What fits_batched_sections reserved, and what the rate limiter counts
+        top_p=1,
+        stream=True,
+        stop=None,
+    )
+
+    # Keys are section numbers, but a model that repeats the titles instead is understood too
+    titles = {str(index + 1): title for index, (title, _) in enumerate(sections)}
+    titles.update({title: title for title, _ in sections})
+    parser = IncrementalSectionParser()
+    written = {}
+    generated = {}
+    finish_reason = None
+    for chunk in stream:
+        tokens = chunk.choices[0].delta.content
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        if tokens:
+            for key, text in parser.feed(tokens):
+                title = titles.get(key)
+                if title is None or title in generated:
+                    continue
+                if text is not None:
+                    written[title] = written.get(title, "") + text
+                    yield title, text
+                elif written.get(title):
+                    generated[title] = written[title]
+                    yield title, SECTION_DONE
+        if x_groq := chunk.x_groq:
+            if not x_groq.usage:
+                continue
+            yield None, GenerationStatistics.from_usage(x_groq.usage, model)
+
+    if cache and finish_reason == "stop" and len(generated) == len(sections):
+        cache.set("sections", cache_key, {"sections": generated})
+
+
+def outline_reserved_tokens(template_name: str) -> int:
+    template = PROMPT_TEMPLATES[template_name]
+    return OUTLINE_RESERVED_TOKENS + estimate_tokens(template["system"] + template["shot_example"])
+
+
+def needs_map_reduce(transcript: str, template_name: str, outline_model: str = DEFAULT_OUTLINE_MODEL) -> bool:
+    """
+    Whether the transcript is map-reduced before the outline: the template leaves the outline to
+    the model, and the transcript does not fit the outline model's context.
+    """
+    if "sections" in PROMPT_TEMPLATES[template_name]:
+        # The template fixes the section schema, so there is no outline call to prepare for
+        return False
+    return choose_generation_mode(transcript, outline_model, outline_reserved_tokens(template_name)) == MAP_REDUCE
+
+
+def prepare_outline_source(client, transcript: str, template_name: str, outline_model: str = DEFAULT_OUTLINE_MODEL, content_model: str = DEFAULT_CONTENT_MODEL, max_workers: int = DEFAULT_MAX_CONCURRENCY, display_status=lambda text: None, partial_summaries=None, trace=NULL_TRACE):
+    """
+    Decides what the outline model reads and what sections retrieve their context from.
+
+    A local token estimate picks between outlining the transcript directly and map-reducing it
+    first, reusing partial_summaries produced while transcribing if there are any.
+    Returns (GenerationStatistics, outline source text, BM25Index).
+    """
+    statistics = GenerationStatistics(model_name=content_model)
+    # Decide locally whether the transcript fits the outline model before sending anything
+    if needs_map_reduce(transcript, template_name, outline_model):
+        display_status("Transcript is longer than the outline model's context, summarizing it in parts....")
+        with trace.span("map_reduce", reused_summaries=len(partial_summaries or [])) as span:
+            map_statistics, partial_summaries, outline_source = map_reduce_transcript(client, transcript, outline_model=outline_model, summary_model=content_model, max_workers=max_workers, reserved_tokens=outline_reserved_tokens(template_name), partial_summaries=partial_summaries or None)
+            span.add_statistics(map_statistics)
+        statistics.add(map_statistics)
+        # Sections are fed from the partial summaries relevant to them
+        return statistics, outline_source, BM25Index(partial_summaries, full_text=outline_source)
+
+    return statistics, transcript, BM25Index.from_transcript(transcript)
+
+
+def stream_notes(client, notes, transcript: str, template_name: str, outline_model: str = DEFAULT_OUTLINE_MODEL, content_model: str = DEFAULT_CONTENT_MODEL, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, top_k: int = DEFAULT_TOP_K, cache=None, display_status=lambda text: None, partial_summaries=None, outline=None, completed_sections=None, on_outline=lambda structure: None, trace=NULL_TRACE, batch_sections=True):
+    """
+    Builds the outline into notes and generates every section concurrently.
+
+    Templates with a fixed section schema skip the outline call. Otherwise the outline is
+    streamed through an incremental JSON parser and each section is dispatched as soon as its
+    entry is complete, while the rest of the outline is still arriving.
+
+    With batch_sections, short meetings whose transcript and outline fit the content model's
+    context get all their sections from one request instead, which saves sending the
+    transcript once per section. Sections are then held back until the outline is complete.
+
+    To resume interrupted work, pass the saved outline and a {title: content} dict of sections
+    that already finished; those are restored into notes instead of being generated again.
+    on_outline receives the complete outline once it is known. Stages are recorded on trace.
+
+    Yields (title, item) events: str tokens, GenerationStatistics, SECTION_DONE and
+    SECTION_RESET, after which the section's text so far is to be discarded. Sections are added
+    to notes (on the consuming thread) before their first event.
+    """
+    completed_sections = completed_sections or {}
+    template = PROMPT_TEMPLATES[template_name]
+    if outline is None and "sections" in template:
+        outline = template["sections"]
+
+    if outline is None:
+        statistics, outline_source, transcript_index = prepare_outline_source(client, transcript, template_name, outline_model, content_model, max_concurrency, display_status, partial_summaries, trace)
+        yield None, statistics
+    else:
+        # The outline is already known, so there is no outline call to prepare for
+        outline_source, transcript_index = transcript, BM25Index.from_transcript(transcript)
+
+    with SectionScheduler(max_concurrency=max_concurrency) as scheduler:
+        def section_events(title, description):
+            # Called when a worker picks the section up, so sections queued behind the concurrency
+            # limit still see every section finished before them in the existing notes
+            section_stream = generate_section(client, transcript=transcript_index.context_for(title + ": " + description, top_k), existing_notes=notes.return_existing_contents(EXISTING_NOTES_TOKEN_BUDGET), section=(title + ": " + description), model=content_model, cache=cache)
+            # Spans start when a worker picks the section up, so they include rate limit waits
+            return traced_stream(trace.span("section", section=title, model=content_model), section_stream)
+
+        def batched_events(sections):
+            written = set()
+            finished = set()
+            with trace.span("sections_batch", model=content_model, sections=len(sections)) as span:
+                try:
+                    for title, item in generate_sections_batched(client, transcript, sections, model=content_model, cache=cache):
+                        if isinstance(item, GenerationStatistics):
+                            span.add_statistics(item)
+                            title = sections[0][0]  # Events without a title belong to the outline stages
+                        elif item is SECTION_DONE:
+                            finished.add(title)
+                        elif isinstance(item, str):
+                            span.mark("first_token")
+                            written.add(title)
+                        yield title, item
+                except Exception as e:
+                    print(f"[warning]: Batched sections failed, generating them one by one: {e}")
+                    span.set(error=str(e))
+            for title, description in sections:
+                if title not in finished:
+                    # Left out, left empty or cut off in the batched response, or the request failed, so it is generated on its own
+                    if title in written:
+                        yield title, SECTION_RESET
+                    yield from ((title, item) for item in section_events(title, description))
+                    yield title, SECTION_DONE
+
+        # Only sections of meetings short enough for a batch wait for the rest of the outline
+        held_sections = [] if batch_sections and fits_batched_sections(transcript, [], content_model) else None
+
+        def add_entry(path, title, description):
+            notes.add_section(path, title, description)
+            if title in completed_sections:
+                notes.update_content(title, completed_sections[title])
+                notes.complete_section(title)
+            elif description is not None and held_sections is not None:
+                held_sections.append((title, description))
+            elif description is not None:
+                scheduler.submit(title, lambda: section_events(title, description))
+
+        if outline is not None:
+            for path, title, description in iter_outline_entries(outline):
+                add_entry(path, title, description)
+            on_outline(outline)
+        else:
+            display_status("Generating notes structure....")
+            parser = IncrementalOutlineParser()
+            outline_stream = generate_notes_structure(client, outline_source, template_name, model=outline_model, cache=cache)
+            for item in traced_stream(trace.span("outline", model=outline_model), outline_stream):
+                if isinstance(item, GenerationStatistics):
+                    yield None, item
+                    continue
+                for path, title, description in parser.feed(item):
+                    add_entry(path, title, description)
+                yield from scheduler.iter_events(block=False)
+            on_outline(parser.close())
+
+        if held_sections and fits_batched_sections(transcript, held_sections, content_model):
+            scheduler.submit_batch([title for title, _ in held_sections], lambda: batched_events(held_sections))
+        else:
+            for title, description in held_sections or ():
+                scheduler.submit(title, lambda title=title, description=description: section_events(title, description))
+
+        yield from scheduler.iter_events()
@@ -1,6 +1,15 @@
+# Templates may declare a fixed "sections" schema ({title: description}). When present, the notes
+# structure is built locally from it and the outline model is not called. Templates without it are
+# outlined by the LLM from the transcript.
 PROMPT_TEMPLATES = {
     "Municipality General Meeting": {
         "system": "Write a JSON structure for a formal municipality meeting summary. The response must be valid JSON that follows this structure: {\"Meeting Overview\":\"Description of the general agenda and purpose\", \"Key Decisions\":\"List of major decisions made\", \"Action Items\":\"List of specific tasks and assignments\", \"Next Steps\":\"Follow-up actions and future planning\"}",
+        "sections": {
+            "Meeting Overview": "Description of the general agenda and purpose",
+            "Key Decisions": "List of major decisions made",
+            "Action Items": "List of specific tasks and assignments",
+            "Next Steps": "Follow-up actions and future planning"
+        },
         "shot_example": '''
 # 🏛️ Municipality General Meeting Summary
 
@@ -21,6 +30,12 @@ PROMPT_TEMPLATES = {
     },
     "Municipality Budget Meeting": {
         "system": "Write a JSON structure for a municipal budget meeting summary. The response must be valid JSON that follows this structure: {\"Budget Overview\":\"Summary of total budget and allocations\", \"Financial Discussions\":\"Key points from budget deliberations\", \"Approved Changes\":\"List of approved budget modifications\", \"Financial Action Items\":\"Specific financial tasks and responsibilities\"}",
+        "sections": {
+            "Budget Overview": "Summary of total budget and allocations",
+            "Financial Discussions": "Key points from budget deliberations",
+            "Approved Changes": "List of approved budget modifications",
+            "Financial Action Items": "Specific financial tasks and responsibilities"
+        },
         "shot_example": '''
 # 💰 Municipality Budget Meeting Summary
 
@@ -45,6 +60,12 @@ PROMPT_TEMPLATES = {
     },
     "Municipality Citizen Engagement Meeting": {
         "system": "Write a JSON structure for a citizen engagement meeting summary. The response must be valid JSON that follows this structure: {\"Meeting Participants\":\"Overview of attendees and roles\", \"Community Topics\":\"Key issues raised by citizens\", \"Proposed Solutions\":\"Suggested resolutions and approaches\", \"Community Action Items\":\"Specific follow-up tasks and commitments\"}",
+        "sections": {
+            "Meeting Participants": "Overview of attendees and roles",
+            "Community Topics": "Key issues raised by citizens",
+            "Proposed Solutions": "Suggested resolutions and approaches",
+            "Community Action Items": "Specific follow-up tasks and commitments"
+        },
         "shot_example": '''
 # 🏘️ Citizen Engagement Meeting Summary
 
@@ -0,0 +1,261 @@
+"""
+Client-side rate limiting for Groq calls.
+
+Every request goes through a RateLimiter that keeps per-model token buckets for requests and
+tokens per minute, so concurrent sections queue locally instead of running into 429s. When a
+429 still happens, the request is retried after the server's retry-after (or a jittered
+backoff) and the model's concurrency limit is halved, then grows back one slot at a time.
+"""
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from tokens import context_window, estimate_tokens
+from tracing import METRICS
+
+# (requests per minute, tokens per minute), Groq's free-tier limits at the time of writing.
+# Paid plans can override them with OPENREF_RATE_LIMITS='{"llama3-8b-8192": [100, 100000]}'.
+MODEL_RATE_LIMITS = {
+    "llama3-70b-8192": (30, 6000),
+    "llama3-8b-8192": (30, 30000),
+    "mixtral-8x7b-32768": (30, 5000),
+    "gemma-7b-it": (30, 15000),
+    "gemma2-9b-it": (30, 15000),
+    "whisper-large-v3": (20, None),
+}
+DEFAULT_RATE_LIMIT = (30, 6000)
+
+EXPECTED_COMPLETION_TOKENS = 1000  # Reserved up front per completion, corrected from the reported usage
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+FALLBACK_AFTER = 5.0  # Seconds a call may wait for its own model before it is rerouted
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+INCREASE_AFTER = 5  # Successful requests before a model's concurrency limit grows by one
+RETRY_STATUS_CODES = (429, 500, 502, 503)
+
+
+def configured_rate_limits():
+    limits = dict(MODEL_RATE_LIMITS)
+    overrides = os.environ.get("OPENREF_RATE_LIMITS")
+    if overrides:
+        limits.update({model: tuple(limit) for model, limit in json.loads(overrides).items()})
+    return limits
+
+
+class TokenBucket:
+    """
+    Refills continuously up to per_minute. Usage corrections may drive it negative, which makes
+    later callers wait until the debt is paid back.
+    """
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request larger than the whole bucket only has to wait for a full bucket
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class ModelBudget:
+    def __init__(self, requests_per_minute, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.limit = INITIAL_CONCURRENCY
+        self.active = 0
+        self.successes = 0
+
+    def wait_time(self, tokens, now):
+        """
+        Seconds until a request of `tokens` may start, or None while all concurrency slots are taken.
+        """
+        if self.active >= self.limit:
+            return None
+        waits = [self.blocked_until - now, self.requests.wait_time(1, now)]
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(0.0, *waits)
+
+
+class RateLimiter:
+    """
+    Budgets for every model used with one API key. Thread-safe; share one instance per key.
+
+    share scales the limits down when several processes use the same key, e.g. 0.5 for each of
+    two worker processes.
+    """
+    def __init__(self, limits=None, share=1.0):
+        self.limits = limits if limits is not None else configured_rate_limits()
+        self.share = share
+        self.budgets = {}
+        self.condition = threading.Condition()
+
+    def _budget(self, model):
+        if model not in self.budgets:
+            requests_per_minute, tokens_per_minute = self.limits.get(model, DEFAULT_RATE_LIMIT)
+            self.budgets[model] = ModelBudget(max(1, requests_per_minute * self.share), tokens_per_minute and max(1, tokens_per_minute * self.share))
+        return self.budgets[model]
+
+    def acquire(self, model, tokens, fallback_models=(), fits=lambda model: True):
+        """
+        Blocks until a request of `tokens` may be sent and returns the model to send it to.
+
+        That is `model`, unless it has kept the caller waiting for FALLBACK_AFTER seconds and one
+        of fallback_models (whose context also fits the request) is free right now.
+        """
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self._budget(model).wait_time(tokens, now)
+                if wait == 0:
+                    METRICS.observe("openref_rate_limit_wait_seconds", now - started, model=model)
+                    return self._take(model, tokens)
+
+                if now - started + (wait or 0) >= FALLBACK_AFTER:
+                    for fallback_model in fallback_models:
+                        if fallback_model != model and fits(fallback_model) and self._budget(fallback_model).wait_time(tokens, now) == 0:
+                            print(f"{model} is saturated, rerouting a request to {fallback_model}")
+                            METRICS.increment("openref_rerouted_requests_total", model=model, fallback_model=fallback_model)
+                            METRICS.observe("openref_rate_limit_wait_seconds", now - started, model=fallback_model)
+                            return self._take(fallback_model, tokens)
+
+                self.condition.wait(timeout=min(wait or 1.0, 1.0))
+
+    def _take(self, model, tokens):
+        budget = self._budget(model)
+        budget.active += 1
+        budget.requests.take(1)
+        if budget.tokens:
+            budget.tokens.take(tokens)
+        return model
+
+    def release(self, model, reserved, used=None, failed=False, retry_after=None):
+        """
+        Frees the request's slot. used corrects the token reservation with the reported usage;
+        retry_after marks a 429, which blocks the model and halves its concurrency limit.
+        """
+        with self.condition:
+            budget = self._budget(model)
+            budget.active -= 1
+            if used is not None and budget.tokens:
+                budget.tokens.take(used - reserved)
+            if retry_after is not None:
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + retry_after)
+                budget.limit = max(1, budget.limit // 2)
+                budget.successes = 0
+            elif not failed:
+                budget.successes += 1
+                if budget.successes >= INCREASE_AFTER and budget.limit < MAX_CONCURRENCY:
+                    budget.limit += 1
+                    budget.successes = 0
+            self.condition.notify_all()
+
+
+def retry_delay(error, attempt):
+    """
+    The server's retry-after if it sent one, otherwise exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after) + random.uniform(0, 1)
+    except (TypeError, ValueError):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class RateLimitedClient:
+    """
+    Stands in for a Groq client wherever the pipeline calls chat.completions.create or
+    audio.transcriptions.create.
+
+    Chat requests for a model in fallback_models may be rerouted to another model in that list
+    while their own model is saturated.
+    """
+    def __init__(self, client, limiter, fallback_models=()):
+        # Retries are handled here, with the limiter's view of every concurrent request
+        self.client = client.with_options(max_retries=0) if hasattr(client, "with_options") else client
+        self.limiter = limiter
+        self.fallback_models = list(fallback_models)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create_transcription))
+
+    def _call(self, model, tokens, request, fallback_models=(), fits=lambda model: True):
+        """
+        Sends request(model) with retries. Returns (response, model) with the model's slot still held.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            used_model = self.limiter.acquire(model, tokens, fallback_models, fits)
+            try:
+                return request(used_model), used_model
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                if status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                    self.limiter.release(used_model, tokens, used=0, failed=True)
+                    raise
+                delay = retry_delay(e, attempt)
+                print(f"{used_model} returned {status_code}, retrying in {delay:.1f}s")
+                METRICS.increment("openref_retries_total", model=used_model, status=status_code)
+                if status_code == 429:
+                    self.limiter.release(used_model, tokens, used=0, retry_after=delay)
+                else:
+                    self.limiter.release(used_model, tokens, used=0, failed=True)
+                    time.sleep(delay)
+
+    def _create_completion(self, **kwargs):
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in kwargs.get("messages", []))
+        completion_tokens = min(kwargs.get("max_tokens") or EXPECTED_COMPLETION_TOKENS, EXPECTED_COMPLETION_TOKENS)
+        reserved = prompt_tokens + completion_tokens
+        fallback_models = self.fallback_models if kwargs["model"] in self.fallback_models else ()
+
+        response, model = self._call(
+            kwargs["model"],
+            reserved,
+            lambda model: self.client.chat.completions.create(**{**kwargs, "model": model}),
+            fallback_models,
+            fits=lambda model: reserved <= context_window(model),
+        )
+        if kwargs.get("stream"):
+            return self._track_stream(response, model, reserved)
+        self.limiter.release(model, reserved, used=response.usage.total_tokens)
+        return response
+
+    def _track_stream(self, stream, model, reserved):
+        """
+        Holds the model's slot until the stream is consumed, then settles its reported usage.
+        """
+        used = None
+        failed = True
+        try:
+            for chunk in stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq and x_groq.usage:
+                    used = x_groq.usage.total_tokens
+                yield chunk
+            failed = False
+        finally:
+            self.limiter.release(model, reserved, used=used, failed=failed)
+
+    def _create_transcription(self, **kwargs):
+        audio_file = kwargs.get("file")
+
+        def request(model):
+            if hasattr(audio_file, "seek"):
+                audio_file.seek(0)  # A retry has to upload the file from the start again
+            return self.client.audio.transcriptions.create(**kwargs)
+
+        response, model = self._call(kwargs["model"], 0, request)
+        self.limiter.release(model, 0)
+        return response
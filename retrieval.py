@@ -0,0 +1,81 @@
+import math
+import re
+from collections import Counter
+
+PASSAGE_WORDS = 180
+PASSAGE_OVERLAP_WORDS = 30
+DEFAULT_TOP_K = 6
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "i", "in", "is", "it",
+    "its", "of", "on", "or", "so", "that", "the", "their", "there", "this", "to", "was", "we", "were", "will",
+    "with", "you", "they", "our", "what", "which", "who", "all", "any", "list", "description", "summary",
+}
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9']+", text.lower()) if word not in STOPWORDS]
+
+
+def split_passages(transcript, passage_words=PASSAGE_WORDS, overlap_words=PASSAGE_OVERLAP_WORDS):
+    """
+    Splits a transcript into overlapping passages of roughly passage_words words.
+    """
+    words = transcript.split()
+    if len(words) <= passage_words:
+        return [" ".join(words)] if words else []
+    step = passage_words - overlap_words
+    return [" ".join(words[start:start + passage_words]) for start in range(0, len(words) - overlap_words, step)]
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over transcript passages, built once per transcript.
+    """
+    def __init__(self, passages, k1=1.5, b=0.75, full_text=None):
+        self.passages = passages
+        self.full_text = full_text if full_text is not None else PASSAGE_SEPARATOR.join(passages)
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(passage)) for passage in passages]
+        self.lengths = [sum(frequencies.values()) for frequencies in self.term_frequencies]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        document_frequencies = Counter(term for frequencies in self.term_frequencies for term in frequencies)
+        total = len(passages)
+        self.idf = {term: math.log(1 + (total - count + 0.5) / (count + 0.5)) for term, count in document_frequencies.items()}
+
+    @classmethod
+    def from_transcript(cls, transcript, passage_words=PASSAGE_WORDS, overlap_words=PASSAGE_OVERLAP_WORDS):
+        return cls(split_passages(transcript, passage_words, overlap_words), full_text=transcript)
+
+    def score(self, query_terms, index):
+        frequencies = self.term_frequencies[index]
+        length_norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.average_length or 1))
+        total = 0.0
+        for term in query_terms:
+            frequency = frequencies.get(term)
+            if frequency:
+                total += self.idf[term] * frequency * (self.k1 + 1) / (frequency + length_norm)
+        return total
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """
+        Returns the indices of the top_k passages for the query, best match first.
+        """
+        query_terms = set(tokenize(query))
+        scores = [(self.score(query_terms, index), index) for index in range(len(self.passages))]
+        ranked = sorted((item for item in scores if item[0] > 0), key=lambda item: (-item[0], item[1]))
+        return [index for _, index in ranked[:top_k]]
+
+    def context_for(self, query, top_k=DEFAULT_TOP_K):
+        """
+        Returns the top_k passages for the query joined in transcript order, ready for a prompt.
+
+        Falls back to the opening passages when nothing matches, and to the whole transcript
+        when it is too short to be worth filtering.
+        """
+        if len(self.passages) <= top_k:
+            return self.full_text
+        indices = self.search(query, top_k) or list(range(top_k))
+        return PASSAGE_SEPARATOR.join(self.passages[index] for index in sorted(indices))
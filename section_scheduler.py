@@ -0,0 +1,101 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_CONCURRENCY = 4
+SECTION_DONE = object()  # Emitted once per section after its last item
+SECTION_RESET = object()  # The section's text so far is discarded, as it is written again from the start
+
+
+class SectionScheduler:
+    """
+    Runs section generators concurrently and funnels their items back to a single consumer.
+
+    Streamlit elements may only be updated from the script thread, so the workers never touch
+    the UI. They push (title, item) pairs onto a queue that the script thread drains with
+    iter_events(), in whatever order the tokens arrive.
+    """
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(max_concurrency)), thread_name_prefix="section")
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.cancelled = threading.Event()
+
+    def submit(self, title, factory):
+        """
+        Schedules factory(), which must return an iterable of items, to run on a worker.
+        """
+        self.pending += 1
+        self.pool.submit(self._run, title, factory)
+
+    def _run(self, title, factory):
+        try:
+            if self.cancelled.is_set():
+                return
+            for item in factory():
+                if self.cancelled.is_set():
+                    break
+                self.queue.put((title, item))
+        except Exception as e:
+            self.queue.put((title, e))
+        finally:
+            self.queue.put((title, SECTION_DONE))
+
+    def submit_batch(self, titles, factory):
+        """
+        Schedules factory(), which must return an iterable of (title, item) pairs for all of
+        titles, e.g. a single request that writes several sections. It emits each section's
+        SECTION_DONE itself; sections it leaves unfinished are marked done when it ends.
+        """
+        self.pending += len(titles)
+        self.pool.submit(self._run_batch, titles, factory)
+
+    def _run_batch(self, titles, factory):
+        unfinished = list(titles)
+        try:
+            if self.cancelled.is_set():
+                return
+            for title, item in factory():
+                if self.cancelled.is_set():
+                    break
+                if item is SECTION_DONE:
+                    # Each title is counted once, and the last one only once the factory ends,
+                    # so that items after it (such as the usage) still reach the consumer
+                    if title not in unfinished or unfinished == [title]:
+                        continue
+                    unfinished.remove(title)
+                self.queue.put((title, item))
+        except Exception as e:
+            self.queue.put((titles[0], e))
+        finally:
+            for title in unfinished:
+                self.queue.put((title, SECTION_DONE))
+
+    def iter_events(self, block=True):
+        """
+        Yields (title, item) pairs until every submitted section is done.
+
+        With block=False it returns as soon as the queue is momentarily empty.
+        A worker exception is re-raised here after cancelling the remaining sections.
+        """
+        while self.pending:
+            try:
+                title, item = self.queue.get(block=block)
+            except queue.Empty:
+                return
+            if item is SECTION_DONE:
+                self.pending -= 1
+            elif isinstance(item, Exception):
+                self.shutdown()
+                raise item
+            yield title, item
+
+    def shutdown(self):
+        self.cancelled.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_statistics import GenerationStatistics
+from mapreduce import summarize_window, WINDOW_TOKENS, WORDS_PER_TOKEN
+from transcription import TranscriptMerger
+
+
+class StreamingTranscript:
+    """
+    Consumes transcript chunks as transcription completes them and summarizes each full window
+    in the background, so provisional notes exist long before the last chunk lands.
+
+    finish() flushes the final partial window and returns everything needed to reconcile the
+    outline: the stitched transcript and the per-window summaries in order. A failed summary is
+    logged and left out, never raised, as the summaries are only a head start for map-reduce.
+    """
+    def __init__(self, client, summary_model="llama3-8b-8192", max_workers=4, window_tokens=WINDOW_TOKENS):
+        self.client = client
+        self.summary_model = summary_model
+        self.window_words = int(window_tokens * WORDS_PER_TOKEN)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="window")
+        self.merger = TranscriptMerger()
+        self.buffer = []
+        self.futures = []
+
+    def add_chunk(self, text):
+        """
+        Adds the next transcript chunk (in order) and schedules summaries for any full windows.
+        """
+        self.buffer.extend(self.merger.add(text).split())
+        while len(self.buffer) >= self.window_words:
+            self._submit_window(self.buffer[:self.window_words])
+            self.buffer = self.buffer[self.window_words:]
+
+    def _submit_window(self, words):
+        index = len(self.futures)
+        self.futures.append(self.pool.submit(summarize_window, self.client, " ".join(words), index, None, self.summary_model))
+
+    def ready_summaries(self):
+        """
+        Returns the summaries finished so far, stopping at the first window still in flight.
+        """
+        summaries = []
+        for future in self.futures:
+            if not future.done():
+                break
+            if future.exception() is None:
+                summaries.append(future.result()[1])
+        return summaries
+
+    def transcript(self):
+        return self.merger.text()
+
+    def finish(self, wait=True):
+        """
+        Returns (GenerationStatistics, transcript, partial_summaries).
+
+        With wait, the final partial window is summarized too and every window is waited for.
+        Otherwise windows still queued are cancelled, and only finished ones are counted in the
+        statistics. partial_summaries is None unless every window was summarized. A transcript
+        shorter than one window gets no summaries, since it never needs map-reduce.
+        """
+        if not wait:
+            self.cancel()
+        elif self.buffer and self.futures:
+            self._submit_window(self.buffer)
+            self.buffer = []
+        statistics = GenerationStatistics(model_name=self.summary_model)
+        summaries = [] if wait else None
+        for future in self.futures:
+            if future.cancelled() or not (wait or future.done()):
+                continue
+            try:
+                window_statistics, summary = future.result()
+            except Exception as e:
+                print(f"[warning]: Window summary failed, map-reduce will summarize the transcript itself: {e}")
+                summaries = None
+                continue
+            statistics.add(window_statistics)
+            if summaries is not None:
+                summaries.append(summary)
+        self.pool.shutdown(wait=False)
+        return statistics, self.transcript(), summaries
+
+    def cancel(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,39 @@
+from compaction import collapse_repeats, compact_transcript, remove_filler_words
+
+
+def compact(text):
+    return compact_transcript(text)[0]
+
+
+def test_removes_fillers_and_keeps_sentence_ends():
+    assert compact("So, um, the budget was, uh, approved um.") == "So, the budget was, approved."
+    assert compact("Um, the motion carried.") == "the motion carried."
+
+
+def test_keeps_words_that_look_like_fillers():
+    assert compact("The ER was full. The budget is 5 mm thick.") == "The ER was full. The budget is 5 mm thick."
+    assert compact("Hm, noted. The UM delegation agreed.") == "Hm, noted. The UM delegation agreed."
+    assert compact("Er, the er nurse") == "Er, the er nurse"
+
+
+def test_collapses_stutters_and_loops():
+    assert compact("I I I think we should") == "I think we should"
+    assert compact("Thank you. Thank you. Thank you. Thank you.") == "Thank you."
+    assert compact("we need to we need to fund it") == "we need to fund it"
+
+
+def test_keeps_grammatical_and_numeric_repeats():
+    assert compact("He said that that was fine") == "He said that that was fine"
+    assert compact("item 1 2 1 2 passed") == "item 1 2 1 2 passed"
+    assert compact("the vote was 5 5 5 against") == "the vote was 5 5 5 against"
+    assert compact("in 2024 2024 and 2025") == "in 2024 2024 and 2025"
+
+
+def test_counts_removed_words():
+    words, removed = remove_filler_words("um well uh yes".split())
+    assert (words, removed) == (["well", "yes"], 2)
+    words, removed = collapse_repeats("no no no way".split())
+    assert (words, removed) == (["no", "way"], 2)
+    _, report = compact_transcript("um um the the the plan")
+    assert report.filler_words == 2 and report.repeated_words == 2
+    assert report.saved_tokens == report.original_tokens - report.compacted_tokens
@@ -0,0 +1,87 @@
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from fingerprint import fingerprint_audio, reuse_plan, FingerprintIndex
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="fingerprinting decodes with ffmpeg")
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_recording(path, seconds, seed):
+    """
+    Writes speech-like audio: harmonic tones at a new pitch every 150-400 ms, pauses and noise.
+    """
+    generator = np.random.default_rng(seed)
+    pieces = []
+    length_so_far = 0
+    while length_so_far < seconds * SAMPLE_RATE:
+        length = int(generator.uniform(0.15, 0.4) * SAMPLE_RATE)
+        times = np.arange(length) / SAMPLE_RATE
+        if generator.random() < 0.15:
+            piece = np.zeros(length)
+        else:
+            pitch = generator.uniform(90, 250)
+            piece = sum(generator.uniform(0.1, 1) / harmonic * np.sin(2 * np.pi * pitch * harmonic * times) for harmonic in range(1, 16)) * np.hanning(length)
+        pieces.append(piece)
+        length_so_far += length
+    audio = np.concatenate(pieces)[:seconds * SAMPLE_RATE]
+    audio = audio / np.abs(audio).max() * 0.5 + generator.normal(0, 0.01, len(audio))
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes((audio * 32767).astype("<i2").tobytes())
+    return str(path)
+
+
+def segments_every(seconds, duration):
+    return [{"start_ms": round(start * 1000), "end_ms": round((start + seconds - 0.2) * 1000), "text": f"segment at {start:g}"} for start in np.arange(0, duration, seconds)]
+
+
+@pytest.fixture(scope="module")
+def indexed(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("indexed")
+    index = FingerprintIndex(str(directory / "fingerprints.db"))
+    for seed in range(5):
+        path = synthetic_recording(directory / f"indexed_{seed}.wav", 120, seed)
+        index.add(fingerprint_audio(path), path, f"transcript {seed}", segments_every(5, 120))
+    return index, directory
+
+
+def test_unrelated_audio_does_not_match(indexed, tmp_path):
+    index, _ = indexed
+    for seed in range(10, 20):
+        fingerprint = fingerprint_audio(synthetic_recording(tmp_path / f"query_{seed}.wav", 90, seed))
+        alignments = index.match(fingerprint)
+        assert alignments == []
+        assert reuse_plan(fingerprint, alignments, {}) is None
+
+
+def test_re_encoded_copy_reuses_the_transcript(indexed, tmp_path):
+    index, directory = indexed
+    copy = str(tmp_path / "copy.mp3")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-i", str(directory / "indexed_3.wav"), "-b:a", "32k", copy], check=True)
+    fingerprint = fingerprint_audio(copy)
+    alignments = index.match(fingerprint)
+    recordings = {alignment.recording_id: index.get_recording(alignment.recording_id) for alignment in alignments}
+    plan = reuse_plan(fingerprint, alignments, recordings)
+    assert len(alignments) == 1 and abs(alignments[0].shift) < 0.1
+    assert [piece["text"] for piece in plan] == ["transcript 3"]
+
+
+def test_trimmed_copy_reuses_the_aligned_segments(indexed, tmp_path):
+    index, directory = indexed
+    copy = str(tmp_path / "trimmed.m4a")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-ss", "20", "-t", "60", "-i", str(directory / "indexed_1.wav"), "-c:a", "aac", copy], check=True)
+    fingerprint = fingerprint_audio(copy)
+    alignments = index.match(fingerprint)
+    recordings = {alignment.recording_id: index.get_recording(alignment.recording_id) for alignment in alignments}
+    plan = reuse_plan(fingerprint, alignments, recordings)
+    assert len(alignments) == 1 and abs(alignments[0].shift - 20) < 0.1
+    assert all(piece["text"] is not None for piece in plan)
+    assert plan[0]["segments"][0] == {"start_ms": 0, "end_ms": 4800, "text": "segment at 20"}
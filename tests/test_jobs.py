@@ -0,0 +1,74 @@
+import io
+import json
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import jobs
+from archive import Archive
+from jobs import JobStore, RUNNING, STALE_AFTER
+from prompt_templates import PROMPT_TEMPLATES
+from worker import run_job
+
+TEMPLATE = "Municipality General Meeting"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_AUDIO_DIR", str(tmp_path / "audio"))
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def create_job(store):
+    audio_file = io.BytesIO(b"RIFF")
+    audio_file.name = "meeting.wav"
+    return store.create_job(audio_file, TEMPLATE, "outline-model", "content-model", compact=False)
+
+
+class BatchedSectionsClient:
+    """
+    Answers the batched sections request with one line of notes per listed section.
+    """
+    def __init__(self):
+        self.requested = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        titles = re.findall(r"^\d+\. ([^:\n]+):", prompt.split("### Sections")[1], re.MULTILINE)
+        self.requested.append(titles)
+        answer = json.dumps({str(index + 1): f"Notes on {title}" for index, title in enumerate(titles)})
+        delta = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=answer), finish_reason="stop")], x_groq=None)
+        return iter([delta])
+
+
+def test_running_job_is_reclaimed_once_its_heartbeat_is_stale(store):
+    job_id = create_job(store)
+    assert store.claim_next_job("first")["id"] == job_id
+    assert store.claim_next_job("second") is None
+
+    store.update_job(job_id, heartbeat=time.time() - STALE_AFTER - 1)
+    job = store.claim_next_job("second")
+    assert job["id"] == job_id
+    assert store.get_job(job_id)["worker"] == "second"
+    assert store.get_job(job_id)["status"] == RUNNING
+
+
+def test_resumed_job_keeps_finished_sections(store, tmp_path):
+    job_id = create_job(store)
+    titles = list(PROMPT_TEMPLATES[TEMPLATE]["sections"])
+    store.claim_next_job("first")
+    store.update_job(job_id, transcript="The council approved the parking permits.", heartbeat=time.time() - STALE_AFTER - 1)
+    store.save_section(job_id, titles[0], 0, "Saved overview", done=True)
+    store.save_section(job_id, titles[1], 1, "Half written")
+
+    job = store.claim_next_job("second")
+    client = BatchedSectionsClient()
+    run_job(store, job, client, cache=None, archive=Archive(str(tmp_path / "archive.db")), fingerprints=None)
+
+    assert client.requested == [titles[1:]]
+    sections = store.get_sections(job_id)
+    assert sections[0] == (titles[0], "Saved overview", True)
+    assert sections[1:] == [(title, f"Notes on {title}", True) for title in titles[1:]]
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from outline_parser import IncrementalOutlineParser, IncrementalSectionParser
+
+OUTLINE = {
+    "Budget \"2024\"": {
+        "Revenue": "Taxes and fees",
+        "Spending": ["Roads", "Parks été"],
+    },
+    "Next Steps": "Vote on the résumé \U0001F600\nin March",
+}
+
+
+def feed_outline(text, chunk_size):
+    parser = IncrementalOutlineParser()
+    entries = []
+    for start in range(0, len(text), chunk_size):
+        entries.extend(parser.feed(text[start:start + chunk_size]))
+    return parser, entries
+
+
+def feed_sections(text, chunk_size):
+    parser = IncrementalSectionParser()
+    events = []
+    for start in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[start:start + chunk_size]))
+    return events
+
+
+def joined_sections(events):
+    texts = {}
+    closed = []
+    for key, text in events:
+        if text is None:
+            closed.append(key)
+        else:
+            texts[key] = texts.get(key, "") + text
+    return texts, closed
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_outline_parser_matches_json_for_any_chunk_split(chunk_size):
+    text = "```json\n" + json.dumps(OUTLINE, indent=2) + "\n```"
+    parser, entries = feed_outline(text, chunk_size)
+    assert parser.complete
+    assert parser.close() == {
+        "Budget \"2024\"": {"Revenue": "Taxes and fees", "Spending": "- Roads\n- Parks été"},
+        "Next Steps": OUTLINE["Next Steps"],
+    }
+    assert [(path, title) for path, title, _ in entries] == [
+        ((), "Budget \"2024\""),
+        (("Budget \"2024\"",), "Revenue"),
+        (("Budget \"2024\"",), "Spending"),
+        ((), "Next Steps"),
+    ]
+
+
+def test_outline_parser_keeps_complete_entries_of_a_truncated_outline():
+    text = json.dumps(OUTLINE)
+    parser, entries = feed_outline(text[:text.index("Vote") + 4], 5)
+    assert not parser.complete
+    assert parser.close() == {"Budget \"2024\"": {"Revenue": "Taxes and fees", "Spending": "- Roads\n- Parks été"}}
+    assert entries[-1][1] == "Spending"
+
+
+def test_outline_parser_stops_at_malformed_input():
+    parser, _ = feed_outline('{"Overview": "Kept", Unquoted: "x", "Lost": "y"}', 4)
+    assert not parser.complete
+    assert parser.close() == {"Overview": "Kept"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 1000])
+def test_section_parser_decodes_escapes_split_across_chunks(chunk_size):
+    sections = {"1": "Line one\nLine \"two\" \\ tab\there", "2": "café \U0001F600 done"}
+    # ensure_ascii writes é and the emoji's surrogate pair, so escapes straddle chunk ends
+    events = feed_sections("Here you go:\n" + json.dumps(sections, ensure_ascii=True), chunk_size)
+    texts, closed = joined_sections(events)
+    assert texts == sections
+    assert closed == ["1", "2"]
+
+
+def test_section_parser_streams_text_before_the_string_closes():
+    parser = IncrementalSectionParser()
+    assert parser.feed('{"1": "Hello') == [("1", "Hello")]
+    assert parser.feed(' world", "2"') == [("1", " world"), ("1", None)]
+
+
+def test_section_parser_does_not_close_a_truncated_section():
+    text = json.dumps({"1": "First section", "2": "Second section cut off"})
+    texts, closed = joined_sections(feed_sections(text[:text.index("cut")], 3))
+    assert closed == ["1"]
+    assert texts["2"] == "Second section "
+
+
+def test_section_parser_stops_at_nested_values():
+    texts, closed = joined_sections(feed_sections('{"1": "Kept", "2": {"nested": "dropped"}, "3": "Lost"}', 4))
+    assert texts == {"1": "Kept"}
+    assert closed == ["1"]
@@ -0,0 +1,109 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter, RateLimitedClient, retry_delay, INCREASE_AFTER, INITIAL_CONCURRENCY
+
+LIMITS = {"main": (6000, None), "small": (6000, None), "backup": (6000, None)}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class FakeClient:
+    """
+    Raises the given errors in turn, then answers every completion.
+    """
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.models = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.models.append(kwargs["model"])
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+
+
+def create(client, model="main"):
+    return client.chat.completions.create(model=model, messages=[{"role": "user", "content": "Hello"}], max_tokens=10)
+
+
+def test_retry_delay_prefers_retry_after():
+    assert retry_delay(StatusError(429, {"retry-after": "2.5"}), attempt=0) == 3.5
+    assert retry_delay(StatusError(429), attempt=3) == 8.0
+    assert retry_delay(StatusError(429), attempt=20) == rate_limit.BACKOFF_MAX
+
+
+def test_429_blocks_the_model_and_halves_its_concurrency(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: low)
+    limiter = RateLimiter(LIMITS)
+    client = FakeClient([StatusError(429, {"retry-after": "0.2"})])
+    started = time.monotonic()
+    create(RateLimitedClient(client, limiter))
+    assert time.monotonic() - started >= 0.2
+    assert client.models == ["main", "main"]
+    budget = limiter.budgets["main"]
+    assert budget.limit == INITIAL_CONCURRENCY // 2
+    assert budget.active == 0
+
+
+def test_server_errors_are_retried_after_a_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    limiter = RateLimiter(LIMITS)
+    client = FakeClient([StatusError(503), StatusError(500)])
+    create(RateLimitedClient(client, limiter))
+    assert sleeps == [1.0, 2.0]
+    assert limiter.budgets["main"].limit == INITIAL_CONCURRENCY
+    assert limiter.budgets["main"].active == 0
+
+
+def test_other_errors_are_raised_and_free_the_slot():
+    limiter = RateLimiter(LIMITS)
+    client = FakeClient([StatusError(400)])
+    with pytest.raises(StatusError):
+        create(RateLimitedClient(client, limiter))
+    assert client.models == ["main"]
+    assert limiter.budgets["main"].active == 0
+
+
+def test_successes_raise_the_concurrency_limit():
+    limiter = RateLimiter(LIMITS)
+    client = RateLimitedClient(FakeClient(), limiter)
+    for _ in range(INCREASE_AFTER):
+        create(client)
+    assert limiter.budgets["main"].limit == INITIAL_CONCURRENCY + 1
+
+
+def test_blocked_model_falls_back_to_a_free_model_that_fits(monkeypatch):
+    monkeypatch.setattr(rate_limit, "FALLBACK_AFTER", 0.0)
+    limiter = RateLimiter(LIMITS)
+    limiter.release(limiter.acquire("main", 10), 10, retry_after=60)
+    client = FakeClient()
+    rate_limited = RateLimitedClient(client, limiter, fallback_models=["main", "small", "backup"])
+    monkeypatch.setattr(rate_limit, "context_window", lambda model: 1 if model == "small" else 8192)
+    create(rate_limited)
+    assert client.models == ["backup"]
+    assert limiter.budgets["backup"].active == 0
+
+
+def test_model_outside_the_fallback_list_waits_for_itself(monkeypatch):
+    monkeypatch.setattr(rate_limit, "FALLBACK_AFTER", 0.0)
+    limiter = RateLimiter(LIMITS)
+    limiter.release(limiter.acquire("main", 10), 10, retry_after=0.2)
+    client = FakeClient()
+    create(RateLimitedClient(client, limiter, fallback_models=["small", "backup"]))
+    assert client.models == ["main"]
@@ -0,0 +1,28 @@
+CHARS_PER_TOKEN = 4  # Rough average for English text with the Llama and Mixtral tokenizers
+DEFAULT_CONTEXT_WINDOW = 8192
+
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "gemma-7b-it": 8192,
+    "gemma2-9b-it": 8192,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate, good enough to decide what fits in a prompt.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def context_window(model: str) -> int:
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def fits_in_context(text: str, model: str, reserved_tokens: int = 0) -> bool:
+    """
+    Whether text plus reserved_tokens (instructions and expected output) fits the model's context.
+    """
+    return estimate_tokens(text) + reserved_tokens <= context_window(model)
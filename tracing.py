@@ -0,0 +1,270 @@
+"""
+Per-stage tracing and metrics for the note generation pipeline.
+
+A Trace covers one meeting. Every stage (transcription chunks, map-reduce, outline, sections,
+UI rendering, PDF export) records a span with its duration, model, tokens and cost. Finished
+spans are appended to a JSONL file and aggregated into process-wide METRICS, which can be
+served in the Prometheus text format for p50/p95 latency and cost dashboards.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generation_statistics import GenerationStatistics
+
+TRACE_FILE = os.environ.get("OPENREF_TRACE_FILE", "./traces/spans.jsonl")
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms, rendered in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            histogram = self.histograms[key]
+            for index, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render_prometheus(self):
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{_format_labels(labels)} {value}" for (counter_name, labels), value in sorted(self.counters.items()) if counter_name == name]
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+METRICS = Metrics()
+
+
+class Span:
+    """
+    One timed stage. Use as a context manager, or call start() and end() when the stage does
+    not fit in one block.
+    """
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.started = None
+        self.started_at = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        return self
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def mark(self, event):
+        """
+        Records the time from the span's start to the first occurrence of event, e.g. "first_token".
+        """
+        self.attributes.setdefault(f"time_to_{event}", time.perf_counter() - self.started)
+
+    def add_statistics(self, statistics):
+        """
+        Copies model, tokens, Groq-reported times and cost from a GenerationStatistics.
+        """
+        self.set(
+            model=statistics.model_name,
+            input_tokens=self.attributes.get("input_tokens", 0) + statistics.input_tokens,
+            output_tokens=self.attributes.get("output_tokens", 0) + statistics.output_tokens,
+            inference_time=self.attributes.get("inference_time", 0) + statistics.total_time,
+            cost=self.attributes.get("cost", 0) + statistics.cost,
+        )
+
+    def end(self, error=None):
+        if error is not None:
+            self.attributes["error"] = str(error)
+        self.trace.finish(self, time.perf_counter() - self.started)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is GeneratorExit:
+            self.set(cancelled=True)  # The consumer stopped early, e.g. a rerun interrupted it
+            exc = None
+        self.end(exc)
+
+
+def traced_stream(span, items, first_item="first_token"):
+    """
+    Passes a stream of str pieces and GenerationStatistics through unchanged, recording on span
+    the time to the first piece and the usage. The span starts when the stream is first read.
+    """
+    with span:
+        for item in items:
+            if isinstance(item, str):
+                span.mark(first_item)
+            elif isinstance(item, GenerationStatistics):
+                span.add_statistics(item)
+            yield item
+
+
+class Trace:
+    """
+    Spans for one meeting. Safe to record from the section and transcription worker threads.
+    """
+    def __init__(self, path=TRACE_FILE, metrics=METRICS, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.path = path
+        self.metrics = metrics
+        self.attributes = attributes
+        self.lock = threading.Lock()
+        self.spans = []
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def record(self, name, duration, **attributes):
+        """
+        Adds a span for a stage whose duration was measured elsewhere.
+        """
+        span = Span(self, name, attributes)
+        span.started_at = time.time() - duration
+        self.finish(span, duration)
+
+    def finish(self, span, duration):
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": span.span_id,
+            "name": span.name,
+            "start": span.started_at,
+            "duration": duration,
+            **self.attributes,
+            **span.attributes,
+        }
+        with self.lock:
+            self.spans.append(record)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as trace_file:
+                    trace_file.write(json.dumps(record, default=str) + "\n")
+
+        model = span.attributes.get("model", "")
+        self.metrics.observe("openref_stage_duration_seconds", duration, stage=span.name, model=model)
+        if "time_to_first_token" in span.attributes:
+            self.metrics.observe("openref_time_to_first_token_seconds", span.attributes["time_to_first_token"], stage=span.name, model=model)
+        if span.attributes.get("cost"):
+            self.metrics.observe("openref_cost_dollars", span.attributes["cost"], buckets=COST_BUCKETS, stage=span.name, model=model)
+            if span.name != "meeting":  # The meeting total would count every stage twice
+                self.metrics.increment("openref_cost_dollars_total", span.attributes["cost"], stage=span.name, model=model)
+        for kind in ("input", "output"):
+            if span.attributes.get(f"{kind}_tokens") and span.name != "meeting":
+                self.metrics.increment("openref_tokens_total", span.attributes[f"{kind}_tokens"], stage=span.name, model=model, kind=kind)
+        if "error" in span.attributes:
+            self.metrics.increment("openref_stage_errors_total", stage=span.name)
+
+    def total_cost(self):
+        with self.lock:
+            return sum(span.get("cost", 0) for span in self.spans if span["name"] != "meeting")
+
+
+class NullSpan:
+    def start(self):
+        return self
+
+    def set(self, **attributes):
+        pass
+
+    def mark(self, event):
+        pass
+
+    def add_statistics(self, statistics):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+class NullTrace:
+    """
+    Default for callers that do not trace. Records nothing.
+    """
+    def span(self, name, **attributes):
+        return NullSpan()
+
+    def record(self, name, duration, **attributes):
+        pass
+
+    def total_cost(self):
+        return 0
+
+
+NULL_TRACE = NullTrace()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port, host="0.0.0.0", metrics=METRICS):
+    """
+    Serves metrics at http://host:port/metrics from a background thread.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
@@ -0,0 +1,275 @@
+import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from audio import codec_extension, detect_silences, extract_segment, plan_segments, precondition_audio, probe_duration, speech_bounds, DEFAULT_CODEC
+from generation_statistics import transcription_cost
+from tracing import NULL_TRACE
+
+WHISPER_MODEL = "whisper-large-v3"
+CHUNK_MAX_BYTES = 24 * 1024 * 1024  # Stay safely below the per-request upload limit
+CHUNK_MAX_SECONDS = 10 * 60  # Shorter chunks give the worker pool more to parallelise
+CHUNK_OVERLAP_SECONDS = 1.5  # Only used when a chunk has to be cut outside a silence
+MAX_TRANSCRIPTION_WORKERS = 8
+MAX_OVERLAP_WORDS = 30
+
+
+def transcribe_chunk(client, audio_file, model=WHISPER_MODEL, language="en", segments=None, offset=0.0):
+    """
+    Transcribes a single audio file (or chunk) using Groq's Whisper API.
+
+    With a segments list, the verbose response is requested and its timed segments are appended
+    to the list, shifted by offset seconds to the chunk's position in the whole recording.
+    """
+    transcription = client.audio.transcriptions.create(
+        file=audio_file,
+        model=model,
+        prompt="",
+        response_format="json" if segments is None else "verbose_json",
+        language=language,
+        temperature=0.0
+    )
+    if segments is not None:
+        segments.extend(timed_segments(getattr(transcription, "segments", None) or [], offset))
+    return transcription.text
+
+
+def timed_segments(whisper_segments, offset=0.0):
+    """
+    Converts Whisper's segments to {"start_ms", "end_ms", "text"} in recording time.
+    """
+    timed = []
+    for segment in whisper_segments:
+        segment = segment if isinstance(segment, dict) else vars(segment)
+        text = segment.get("text", "").strip()
+        if text:
+            timed.append({"start_ms": round((offset + segment["start"]) * 1000), "end_ms": round((offset + segment["end"]) * 1000), "text": text})
+    return timed
+
+
+def merge_segments(segments):
+    """
+    Sorts segments collected from concurrent chunks and drops the ones repeated where chunks overlap.
+    """
+    merged = []
+    for segment in sorted(segments, key=lambda segment: segment["start_ms"]):
+        if merged and segment["start_ms"] < merged[-1]["end_ms"]:
+            continue  # Within one chunk Whisper's segments never overlap
+        merged.append(segment)
+    return merged
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def find_overlap(previous_words, next_words, max_words=MAX_OVERLAP_WORDS, min_words=2):
+    """
+    Returns how many leading words of next_words repeat the tail of previous_words.
+    """
+    tail = [_normalize_word(word) for word in previous_words[-max_words:]]
+    head = [_normalize_word(word) for word in next_words[:max_words]]
+    for size in range(min(len(tail), len(head)), min_words - 1, -1):
+        if tail[-size:] == head[:size]:
+            return size
+    return 0
+
+
+class OverlappingChunk(str):
+    """
+    A chunk transcript whose audio starts before the previous chunk's ended, as at a hard cut,
+    so its first words may repeat the previous chunk's last ones.
+    """
+
+
+class TranscriptMerger:
+    """
+    Incrementally joins chunk transcripts in order, dropping words duplicated at the seams.
+    Only OverlappingChunks are deduplicated: after a cut in a silence, a repeated phrase was
+    really said twice.
+    """
+    def __init__(self, max_overlap_words=MAX_OVERLAP_WORDS):
+        self.max_overlap_words = max_overlap_words
+        self.tail = []  # Last words seen, enough to detect the next overlap
+        self.pieces = []
+
+    def add(self, text):
+        """
+        Adds the next chunk and returns the part of it that is new.
+        """
+        words = text.split()
+        if self.tail and isinstance(text, OverlappingChunk):
+            words = words[find_overlap(self.tail, words, self.max_overlap_words):]
+        self.tail = (self.tail + words)[-self.max_overlap_words:]
+        piece = " ".join(words)
+        if piece:
+            self.pieces.append(piece)
+        return piece
+
+    def text(self):
+        return " ".join(self.pieces)
+
+
+def merge_transcripts(texts, max_overlap_words=MAX_OVERLAP_WORDS):
+    """
+    Joins chunk transcripts in order, dropping words duplicated at the seams of OverlappingChunks.
+    """
+    merger = TranscriptMerger(max_overlap_words)
+    for text in texts:
+        merger.add(text)
+    return merger.text()
+
+
+def save_audio_file(audio_file, directory):
+    """
+    Copies an uploaded file-like object to disk so ffmpeg can read it. Returns the new path.
+    """
+    name = getattr(audio_file, "name", "audio.wav") or "audio.wav"
+    path = os.path.join(directory, "source" + os.path.splitext(name)[1])
+    audio_file.seek(0)
+    with open(path, "wb") as output:
+        shutil.copyfileobj(audio_file, output)
+    audio_file.seek(0)
+    return path
+
+
+def local_audio_path(audio_file):
+    """
+    Path of a file object opened from disk, or None for in-memory files such as uploads.
+    """
+    try:
+        audio_file.fileno()
+    except (AttributeError, OSError):
+        return None
+    name = getattr(audio_file, "name", None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+
+def iter_transcript_chunks(client, audio_file, model=WHISPER_MODEL, language="en", max_workers=MAX_TRANSCRIPTION_WORKERS, max_chunk_seconds=CHUNK_MAX_SECONDS, codec=DEFAULT_CODEC, trim_silence=True, display_status=lambda text: None, trace=NULL_TRACE, segments=None):
+    """
+    Transcribes audio of any length, yielding chunk transcripts in order as soon as each is ready.
+
+    The audio is first pre-conditioned locally (mono, 16 kHz, silence trimmed, compact codec).
+    Short results are sent as a single request. Longer ones are split at silence boundaries
+    into chunks that fit the upload limit and transcribed concurrently. Chunks overlap slightly
+    at hard cuts, where they are yielded as OverlappingChunks, so join them with TranscriptMerger.
+
+    With a segments list, Whisper's timed segments are collected into it in recording time,
+    unordered; sort them with merge_segments.
+    """
+    if shutil.which("ffmpeg") is None:
+        # Without ffmpeg we cannot pre-process or split, so fall back to a single request.
+        # The duration is unknown too, so this span has no cost.
+        with trace.span("transcription_chunk", model=model):
+            text = transcribe_chunk(client, audio_file, model, language, segments)
+        yield text
+        return
+
+    with tempfile.TemporaryDirectory(prefix="openref_") as workdir:
+        # Files already on disk are read in place rather than copied
+        source_path = local_audio_path(audio_file) or save_audio_file(audio_file, workdir)
+        leading_silence = 0.0
+        silences = None
+        if trim_silence:
+            # Detected here rather than in precondition_audio, so timestamps can be shifted back by the trimmed start
+            source_duration = probe_duration(source_path)
+            silences = detect_silences(source_path, duration=source_duration)
+            leading_silence = speech_bounds(source_duration, silences)[0]
+        source_path, original_bytes, preconditioned_bytes = precondition_audio(source_path, workdir, codec=codec, trim_silence=trim_silence, silences=silences)
+        saved = original_bytes - preconditioned_bytes
+        print(f"Pre-conditioned audio: {original_bytes} -> {preconditioned_bytes} bytes ({saved} saved)")
+        display_status(f"Compressed audio from {original_bytes / 1e6:.1f} MB to {preconditioned_bytes / 1e6:.1f} MB, transcribing....")
+
+        duration = probe_duration(source_path)
+        if preconditioned_bytes <= CHUNK_MAX_BYTES and duration <= max_chunk_seconds:
+            with trace.span("transcription_chunk", model=model, audio_seconds=duration, cost=transcription_cost(model, duration)):
+                with open(source_path, "rb") as preconditioned_file:
+                    text = transcribe_chunk(client, preconditioned_file, model, language, segments, leading_silence)
+            yield text
+            return
+
+        chunk_bounds = plan_segments(duration, detect_silences(source_path, duration=duration), max_chunk_seconds, CHUNK_OVERLAP_SECONDS)
+        print(f"Splitting {duration:.0f}s of audio into {len(chunk_bounds)} chunks")
+
+        def transcribe_segment(indexed_segment):
+            index, (start, end) = indexed_segment
+            with trace.span("transcription_chunk", model=model, chunk=index, audio_seconds=end - start, cost=transcription_cost(model, end - start)):
+                chunk_path = extract_segment(source_path, start, end, os.path.join(workdir, f"chunk_{index:04d}{codec_extension(codec)}"), codec=codec)
+                with open(chunk_path, "rb") as chunk_file:
+                    text = transcribe_chunk(client, chunk_file, model, language, segments, leading_silence + start)
+            return OverlappingChunk(text) if index and start < chunk_bounds[index - 1][1] else text
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # map() hands results back in chunk order while later chunks are still in flight
+            yield from pool.map(transcribe_segment, enumerate(chunk_bounds))
+
+
+def iter_file_transcripts(client, paths, model=WHISPER_MODEL, language="en", max_workers=MAX_TRANSCRIPTION_WORKERS, trace=NULL_TRACE, segments=None):
+    """
+    Transcribes already pre-conditioned audio files as paths produces them, e.g. the segments of
+    a download that is still running, and yields the transcripts in order as soon as each is ready.
+    paths may yield None while the next file is not ready, to let finished transcripts through.
+
+    The files are taken to be consecutive parts of one recording when collecting segments.
+    """
+    def transcribe_path(index, path, offset, duration):
+        with trace.span("transcription_chunk", model=model, chunk=index, audio_seconds=duration, cost=transcription_cost(model, duration)):
+            with open(path, "rb") as chunk_file:
+                return transcribe_chunk(client, chunk_file, model, language, segments, offset)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        offset = 0.0
+        index = 0
+        for path in paths:
+            if path is not None:
+                duration = probe_duration(path)
+                pending.append(pool.submit(transcribe_path, index, path, offset, duration))
+                offset += duration
+                index += 1
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_planned_transcripts(client, audio_file, plan, model=WHISPER_MODEL, language="en", max_workers=MAX_TRANSCRIPTION_WORKERS, max_chunk_seconds=CHUNK_MAX_SECONDS, codec=DEFAULT_CODEC, trace=NULL_TRACE, segments=None):
+    """
+    Yields the transcripts of a fingerprint.reuse_plan in order: reused stretches as they are,
+    the others cut out of audio_file and transcribed concurrently. Join them with
+    TranscriptMerger. Reused segments are collected into segments too.
+    """
+    pieces = []
+    for piece in plan:
+        if piece["text"] is not None or piece["end"] - piece["start"] <= max_chunk_seconds:
+            pieces.append(piece)
+            continue
+        start = piece["start"]
+        while start < piece["end"]:
+            pieces.append({**piece, "start": start, "end": min(piece["end"], start + max_chunk_seconds)})
+            start += max_chunk_seconds - CHUNK_OVERLAP_SECONDS
+
+    def overlapping(index, text):
+        # Stretches to transcribe are padded into their neighbours and long ones overlap at their cuts
+        return OverlappingChunk(text) if index and pieces[index]["start"] < pieces[index - 1]["end"] else text
+
+    with tempfile.TemporaryDirectory(prefix="openref_") as workdir:
+        source_path = local_audio_path(audio_file) or save_audio_file(audio_file, workdir)
+
+        def transcribe_piece(indexed_piece):
+            index, piece = indexed_piece
+            if piece["text"] is not None:
+                if segments is not None:
+                    segments.extend(piece["segments"])
+                return overlapping(index, piece["text"])
+            start, end = piece["start"], piece["end"]
+            with trace.span("transcription_chunk", model=model, chunk=index, audio_seconds=end - start, cost=transcription_cost(model, end - start)):
+                chunk_path = extract_segment(source_path, start, end, os.path.join(workdir, f"chunk_{index:04d}{codec_extension(codec)}"), codec=codec)
+                with open(chunk_path, "rb") as chunk_file:
+                    return overlapping(index, transcribe_chunk(client, chunk_file, model, language, segments, start))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            yield from pool.map(transcribe_piece, enumerate(pieces))
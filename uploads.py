@@ -0,0 +1,91 @@
+"""
+Disk-backed audio for the Streamlit sessions, and the process memory checks that guard them.
+
+An upload or recording is written to disk once; playback, pre-processing and the Whisper
+upload all read that one file instead of holding more copies of the audio in memory.
+"""
+import mimetypes
+import os
+import resource
+import shutil
+import tempfile
+import time
+import uuid
+
+UPLOAD_DIR = os.environ.get("OPENREF_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "openref_uploads"))
+UPLOAD_MAX_AGE = 24 * 60 * 60  # Files left behind by sessions that ended without cleaning up
+COPY_CHUNK_SIZE = 1024 * 1024
+MEMORY_LIMIT_BYTES = int(os.environ.get("OPENREF_MEMORY_LIMIT_MB", "2048")) * 1024 * 1024
+
+
+class AudioHandle:
+    """
+    One session's audio on disk. source_id identifies what it was created from, so reruns
+    with the same upload or recording reuse the file.
+    """
+    def __init__(self, path, name, source_id):
+        self.path = path
+        self.name = name
+        self.source_id = source_id
+
+    @classmethod
+    def create(cls, data, name, source_id, directory=UPLOAD_DIR):
+        """
+        Writes data (bytes or a file-like object, copied in chunks) to a new file in directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        remove_stale_uploads(directory)
+        path = os.path.join(directory, uuid.uuid4().hex + (os.path.splitext(name)[1] or ".wav"))
+        with open(path, "wb") as output:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                output.write(data)
+            else:
+                data.seek(0)
+                shutil.copyfileobj(data, output, COPY_CHUNK_SIZE)
+        return cls(path, name, source_id)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def mime_type(self):
+        return mimetypes.guess_type(self.name)[0] or "audio/wav"
+
+    def open(self):
+        """
+        A binary file object for the pipeline. Its name is the on-disk path, which lets the
+        transcription skip copying it again.
+        """
+        return open(self.path, "rb")
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def remove_stale_uploads(directory=UPLOAD_DIR, max_age=UPLOAD_MAX_AGE):
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def current_rss_bytes():
+    """
+    Resident memory of this process, from /proc where available, else the peak as an upper bound.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024  # Linux reports kilobytes
+
+
+def memory_available(limit=MEMORY_LIMIT_BYTES):
+    return current_rss_bytes() < limit
@@ -0,0 +1,123 @@
+"""
+Worker processes for background note generation jobs.
+
+    python worker.py --workers 2
+
+Each worker claims queued jobs from the job store and checkpoints the transcript, the outline
+and each section as it goes. A job whose worker died is picked up again once its heartbeat is
+stale and resumes from the last finished section.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from clients import create_groq_client
+
+from archive import Archive
+from fingerprint import FingerprintIndex
+from cache import DiskCache
+from jobs import JobStore, DONE, FAILED, STALE_AFTER
+from notes import Notes
+from pipeline import compact_for_prompts, transcribe_audio, stream_notes
+from rate_limit import RateLimiter, RateLimitedClient
+from section_scheduler import SECTION_DONE, SECTION_RESET
+from tracing import Trace
+
+PROGRESS_INTERVAL = 1.0  # Seconds between checkpoints of a section that is still streaming
+POLL_INTERVAL = 2.0
+
+
+def run_job(store, job, client, cache, archive, fingerprints):
+    job_id = job["id"]
+    trace = Trace(job_id=job_id, template=job["template"])
+    transcript = job["transcript"]
+    segments = []  # Lost if the job resumes after transcription, then the archive indexes untimed passages
+    if transcript is None:
+        with open(job["audio_path"], "rb") as audio_file:
+            transcript = transcribe_audio(client, audio_file, cache=cache, trace=trace, segments=segments, fingerprints=fingerprints)
+        store.update_job(job_id, transcript=transcript)
+
+    # Deterministic, so a resumed job prompts with the same text its outline was made from
+    prompt_transcript, _ = compact_for_prompts(transcript, trace) if job["compact"] else (transcript, None)
+    outline = json.loads(job["outline"]) if job["outline"] else None
+    completed = store.completed_sections(job_id)
+    if completed:
+        print(f"Resuming job {job_id} with {len(completed)} finished sections")
+
+    notes = Notes({})
+    last_saved = {}
+    events = stream_notes(client, notes, prompt_transcript, job["template"], outline_model=job["outline_model"], content_model=job["content_model"], cache=cache, outline=outline, completed_sections=completed, on_outline=lambda structure: store.save_outline(job_id, structure), trace=trace)
+    for title, item in events:
+        if title is None or not (isinstance(item, str) or item is SECTION_DONE or item is SECTION_RESET):
+            continue
+        position = list(notes.contents).index(title)
+        if item is SECTION_DONE:
+            notes.complete_section(title)
+            store.save_section(job_id, title, position, notes.contents[title], done=True)
+        elif item is SECTION_RESET:
+            notes.reset_section(title)
+            store.save_section(job_id, title, position, "")
+        else:
+            notes.update_content(title, item)
+            now = time.monotonic()
+            if now - last_saved.get(title, 0) >= PROGRESS_INTERVAL:
+                store.save_section(job_id, title, position, notes.contents[title])
+                last_saved[title] = now
+
+    if not notes.contents:
+        raise ValueError("Failed to decode the notes structure")
+    archive.add_meeting(f"Job {job_id}", transcript, list(notes.contents.items()), segments=segments, template=job["template"], source=f"job:{job_id}", created=job["created"])
+
+
+def keep_alive(store, job_id, stop):
+    while not stop.wait(STALE_AFTER / 4):
+        store.heartbeat(job_id)
+
+
+def work(worker_name, worker_count=1):
+    load_dotenv()
+    store = JobStore()
+    # Every worker process uses the same API key, so each gets an equal share of its rate limits
+    client = RateLimitedClient(create_groq_client(), RateLimiter(share=1 / worker_count))
+    cache = DiskCache()
+    archive = Archive()
+    fingerprints = FingerprintIndex()
+    print(f"{worker_name} waiting for jobs")
+    while True:
+        job = store.claim_next_job(worker_name)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        print(f"{worker_name} running job {job['id']}")
+        stop = threading.Event()
+        threading.Thread(target=keep_alive, args=(store, job["id"], stop), daemon=True).start()
+        try:
+            run_job(store, job, client, cache, archive, fingerprints)
+        except Exception as e:
+            print(f"[error]: job {job['id']} failed: {e}")
+            store.finish_job(job["id"], FAILED, error=str(e))
+        else:
+            store.finish_job(job["id"], DONE)
+        finally:
+            stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background note generation workers.")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    processes = [multiprocessing.Process(target=work, args=(f"worker-{os.getpid()}-{index}", args.workers), daemon=True) for index in range(args.workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()